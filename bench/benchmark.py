@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the gds2gltf conversion pipeline
+
+USAGE:
+    - run "python3 bench/benchmark.py" to run all cases and print the results
+    - options:
+        --cases stdcell,via_field     only run the named cases (wildcards allowed)
+        --scale F                     grow or shrink the synthetic layouts
+        --repeat N                    run every case N times and keep the fastest
+        --save results.json           store the results as JSON
+        --baseline baseline.json      compare with saved results, exit 1 on regressions
+        --threshold 0.1               allowed relative slowdown / growth (default 10%)
+        --backends process,thread     run every case with each meshing backend and compare them
+
+Every case runs in a fresh Python process with the multiprocessing pool of the
+converter, so peak RSS and timings of one case do not leak into the next. The
+stages are timed through the Converter API:
+
+    read        GDSII parse and layerstack detection (Converter.load)
+    mesh        triangulation and extrusion of all cell layers (Converter.mesh_cells)
+    scenegraph  glTF nodes, meshes and binary blob (Converter.build)
+    write       serialization of the output file (save_gltf)
+
+Cases of cell libraries ("catalog" option) mesh all top level cells and time
+the export of one GLB per cell as the catalog stage (Converter.catalog)
+instead of scenegraph and write, like "gds2gltf --catalog".
+
+For each stage the wall time and the peak RSS of the converter process at the
+end of the stage are recorded, plus the triangles meshed, the binary blob size
+and the output file size of the stages producing them. The workers' peak RSS
+and triangles/s of the mesh stage are recorded per case.
+
+With --backends every case runs once per execution backend of the meshing
+stage (process, thread, serial; see gds2gltf.worker_pool), stored as
+"case[backend]", and a table compares the mesh time, speedup over serial and
+memory of the backends. "make bench-backends" does this for the bundled
+layouts. Threads only mesh in parallel where the GIL is released, so the
+thread backend gains most on free-threaded Python builds; the results record
+whether the GIL was enabled.
+"""
+
+import argparse
+import contextlib
+import fnmatch
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+DATA = os.path.join(ROOT, "data")
+SG13G2 = os.path.join(DATA, "layerstack", "sg13g2_layerstack.txt")
+SKY130 = os.path.join(DATA, "layerstack", "sky130_layerstack.txt")
+
+# name: (layout, layerstack, converter options)
+# layouts starting with "synthetic:" are generated by make_layout()
+CASES = {
+    "stdcell": (os.path.join(DATA, "sg13g2_stdcell.gds"), SG13G2, {"catalog": True}),
+    "testsg13": (os.path.join(DATA, "testsg13.gds"), SG13G2, {}),
+    "system_model": (os.path.join(DATA, "system_model_1v8.gds"), SKY130, {}),
+    "system_model_instancing": (os.path.join(DATA, "system_model_1v8.gds"), SKY130, {"instancing": True}),
+    "system_model_flatten": (os.path.join(DATA, "system_model_1v8.gds"), SKY130, {"flatten": True}),
+    "stdcell_array": ("synthetic:stdcell_array", SG13G2, {}),
+    "stdcell_array_instancing": ("synthetic:stdcell_array", SG13G2, {"instancing": True}),
+    "via_field": ("synthetic:via_field", SG13G2, {}),
+    "via_field_shape_instancing": ("synthetic:via_field", SG13G2, {"shape_instancing": 16}),
+    "routed_paths": ("synthetic:routed_paths", SG13G2, {}),
+}
+
+def make_layout(name, path, scale):
+    """Writes the synthetic layout name to path.
+
+    stdcell_array   rows of standard cells placed with GDSII arrays
+    via_field       one cell with a dense grid of Via1 squares between two metal plates
+    routed_paths    long Metal2/Metal3 paths with many bends
+    """
+    import gdspy
+    lib = gdspy.GdsLibrary()
+    if name == "stdcell_array":
+        lib.read_gds(os.path.join(DATA, "sg13g2_stdcell.gds"), units='import')
+        top = lib.new_cell("TOP_ARRAY")
+        names = sorted(cell.name for cell in lib.top_level() if cell is not top and cell.get_bounding_box() is not None)
+        rows = max(1, int(40 * scale))
+        for row in range(rows):
+            cell = lib.cells[names[row % len(names)]]
+            lo, hi = cell.get_bounding_box()
+            width, height = hi[0] - lo[0], hi[1] - lo[1]
+            top.add(gdspy.CellArray(cell, max(1, int(50 * scale)), 1, (width, height),
+                                    origin=(0, row * height), x_reflection=row % 2 == 1))
+    elif name == "via_field":
+        top = lib.new_cell("VIA_FIELD")
+        n = max(2, int(150 * scale ** 0.5))
+        pitch = 0.5
+        top.add(gdspy.Rectangle((-1, -1), (n * pitch + 1, n * pitch + 1), layer=8))
+        top.add(gdspy.Rectangle((-1, -1), (n * pitch + 1, n * pitch + 1), layer=10))
+        for i in range(n):
+            for j in range(n):
+                top.add(gdspy.Rectangle((i * pitch, j * pitch), (i * pitch + 0.19, j * pitch + 0.19), layer=19))
+    elif name == "routed_paths":
+        top = lib.new_cell("ROUTED_PATHS")
+        paths = max(1, int(100 * scale))
+        for k in range(paths):
+            points = [(0, k * 1.0)]
+            for step in range(60):
+                x, y = points[-1]
+                points.append((x + 5.0, y) if step % 2 == 0 else (x, y + (0.5 if (step // 2) % 2 == 0 else -0.5)))
+            top.add(gdspy.FlexPath(points, 0.2, layer=10 if k % 2 == 0 else 30))
+    else:
+        raise ValueError(f"unknown synthetic layout {name}")
+    lib.write_gds(path, cells=[top] + list(top.get_dependencies(True)))
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(who).ru_maxrss * scale / 2**20
+
+def run_case(name, scale, workdir, backend=None):
+    """Runs one case in the current process and returns its metrics.
+
+    backend selects the execution backend of the meshing stage (default: the converter's).
+    """
+    import gds2gltf
+    layout, layerstack, options = CASES[name]
+    options = dict(options)
+    if layout.startswith("synthetic:"):
+        path = os.path.join(workdir, f"{layout.split(':')[1]}_{scale:g}.gds")
+        if not os.path.exists(path):
+            make_layout(layout.split(":")[1], path, scale)
+        layout = path
+    output_path = os.path.join(workdir, name + ".gltf")
+    shape_instancing = options.pop("shape_instancing", None)
+    catalog = options.pop("catalog", False)
+
+    stages = {}
+    def stage(stage_name, function):
+        t_start = time.perf_counter()
+        result = function()
+        stages[stage_name] = {"seconds": time.perf_counter() - t_start, "peak_rss_mb": peak_rss_mb()}
+        return result
+
+    t_start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        converter = gds2gltf.Converter(layout, layerstack, shape_instancing=shape_instancing, backend=backend)
+        stage("read", converter.load)
+        if catalog:
+            output_path = os.path.join(workdir, name + ".catalog.bin")
+            stage("mesh", lambda: converter.mesh_cells(converter.catalog_cells()))
+            index = stage("catalog", lambda: converter.catalog(output_path, output_path[:-4] + ".json",
+                                                               validate=False, **options))
+            nodes = sum(entry['nodes'] for entry in index['cells'])
+        else:
+            stage("mesh", converter.mesh_cells)
+            builder = stage("scenegraph", lambda: converter.scene(**options))
+            nodes = len(builder.nodes)
+            blob_bytes = builder.blob_size
+            stage("write", lambda: builder.save(output_path))
+    wall = time.perf_counter() - t_start
+
+    triangles = 0
+    for indices, _, shapes in converter.layer_meshes.values():
+        triangles += len(indices) + sum(len(shape[0]) for shape in shapes)
+    stages["mesh"]["triangles"] = triangles
+    if catalog:
+        stages["catalog"]["bytes"] = os.path.getsize(output_path)
+    else:
+        stages["scenegraph"]["bytes"] = blob_bytes
+        stages["write"]["bytes"] = os.path.getsize(output_path)
+
+    mesh_seconds = stages["mesh"]["seconds"]
+    return {
+        "layout": os.path.basename(layout),
+        "options": CASES[name][2],
+        "backend": converter.backend,
+        "wall_seconds": wall,
+        "peak_rss_mb": peak_rss_mb(),
+        "worker_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "cells": len(converter.gdsii.cells),
+        "triangles": triangles,
+        "triangles_per_second": triangles / mesh_seconds if mesh_seconds > 0 else None,
+        "nodes": nodes,
+        "blob_bytes": None if catalog else blob_bytes,
+        "output_bytes": os.path.getsize(output_path),
+        "stages": stages,
+    }
+
+def run_case_process(name, scale, repeat, workdir, backend=None):
+    """Runs a case repeat times, each in a new process, and keeps the fastest run."""
+    best = None
+    command = [sys.executable, os.path.abspath(__file__), "--run-case", name, "--scale", str(scale), "--workdir", workdir]
+    if backend is not None:
+        command += ["--backend", backend]
+    for _ in range(repeat):
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result["wall_seconds"] < best["wall_seconds"]:
+            best = result
+    return best
+
+# metric: (higher is better, reported in the comparison)
+METRICS = {
+    "wall_seconds": False,
+    "peak_rss_mb": False,
+    "worker_peak_rss_mb": False,
+    "triangles_per_second": True,
+    "output_bytes": False,
+}
+
+def compare(results, baseline, threshold):
+    """Prints results next to the baseline and returns the list of regressions."""
+    regressions = []
+    print(f"\n{'case':<28}{'metric':<22}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, result in results["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            print(f"{name:<28}(not in baseline)")
+            continue
+        metrics = [(metric, result.get(metric), base.get(metric), higher) for metric, higher in METRICS.items()]
+        metrics += [(f"{stage}.seconds", values["seconds"], base.get("stages", {}).get(stage, {}).get("seconds"), False)
+                    for stage, values in result["stages"].items()]
+        for metric, current, previous, higher_is_better in metrics:
+            if current is None or not previous:
+                continue
+            change = current / previous - 1
+            worse = -change if higher_is_better else change
+            # times below 0.1 s are too noisy to flag
+            noisy = metric.endswith("seconds") and max(current, previous) < 0.1
+            flag = ""
+            if worse > threshold and not noisy:
+                flag = " REGRESSION"
+                regressions.append((name, metric, previous, current))
+            print(f"{name:<28}{metric:<22}{previous:>12.4g}{current:>12.4g}{change:>+8.1%}{flag}")
+    return regressions
+
+def print_results(results):
+    print(f"\n{'case':<28}{'wall s':>8}{'read':>8}{'mesh':>8}{'scene':>8}{'write':>8}"
+          f"{'RSS MB':>8}{'wRSS MB':>8}{'tri/s':>10}{'out MB':>8}")
+    for name, r in results["cases"].items():
+        s = r["stages"]
+        tps = r["triangles_per_second"] or 0
+        # catalog cases build and write the scenes in one stage, shown as scene
+        scene = s.get("scenegraph", s.get("catalog"))["seconds"]
+        write = s["write"]["seconds"] if "write" in s else 0.0
+        print(f"{name:<28}{r['wall_seconds']:>8.2f}{s['read']['seconds']:>8.2f}{s['mesh']['seconds']:>8.2f}"
+              f"{scene:>8.2f}{write:>8.2f}{r['peak_rss_mb']:>8.0f}"
+              f"{r['worker_peak_rss_mb']:>8.0f}{tps:>10.3g}{r['output_bytes'] / 2**20:>8.2f}")
+
+def print_backends(results, backends):
+    """Prints the mesh stage of every case next to each other for the backends, with the speedup over serial."""
+    print(f"\n{'case':<28}{'backend':<10}{'mesh s':>8}{'speedup':>9}{'wall s':>8}{'RSS MB':>8}{'wRSS MB':>8}{'tri/s':>10}")
+    names = dict.fromkeys(key.rsplit("[", 1)[0] for key in results["cases"])
+    for name in names:
+        serial = results["cases"].get(f"{name}[serial]")
+        for backend in backends:
+            r = results["cases"][f"{name}[{backend}]"]
+            mesh = r["stages"]["mesh"]["seconds"]
+            speedup = f"{serial['stages']['mesh']['seconds'] / mesh:>8.2f}x" if serial and mesh > 0 else f"{'':>9}"
+            print(f"{name:<28}{backend:<10}{mesh:>8.2f}{speedup}{r['wall_seconds']:>8.2f}{r['peak_rss_mb']:>8.0f}"
+                  f"{r['worker_peak_rss_mb']:>8.0f}{r['triangles_per_second'] or 0:>10.3g}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the gds2gltf conversion pipeline.")
+    parser.add_argument("--cases", help="comma separated case names to run, wildcards allowed (default all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="size factor of the synthetic layouts")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, the fastest is kept")
+    parser.add_argument("--save", metavar="FILE", help="write the results as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="compare with saved results, exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative regression (default 0.1)")
+    parser.add_argument("--workdir", help="directory for synthetic layouts and outputs (default: temporary)")
+    parser.add_argument("--backends", help="comma separated meshing backends to compare (process, thread, serial)")
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, args.scale, args.workdir, args.backend)))
+        sys.exit(0)
+
+    names = list(CASES)
+    if args.cases:
+        patterns = args.cases.split(",")
+        names = [name for name in names if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)]
+    backends = args.backends.split(",") if args.backends else [None]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = os.path.abspath(args.workdir or tmpdir)
+        os.makedirs(workdir, exist_ok=True)
+        results = {
+            "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                        "cpus": os.cpu_count(), "gil_enabled": getattr(sys, "_is_gil_enabled", lambda: True)()},
+            "scale": args.scale,
+            "cases": {},
+        }
+        for name in names:
+            for backend in backends:
+                key = name if backend is None else f"{name}[{backend}]"
+                print(f"Running {key}...", flush=True)
+                results["cases"][key] = run_case_process(name, args.scale, args.repeat, workdir, backend)
+
+    print_results(results)
+    if args.backends:
+        print_backends(results, backends)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved as {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != args.scale:
+            print(f"Warning: baseline was run with --scale {baseline.get('scale')}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions above {args.threshold:.0%}")
+            sys.exit(1)
+        print("\nNo regressions")
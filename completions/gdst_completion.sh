@@ -5,7 +5,7 @@ _gdst_complete() {
     COMPREPLY=()
     cur="${COMP_WORDS[COMP_CWORD]}"
     prev="${COMP_WORDS[COMP_CWORD-1]}"
-    commands="list_cells lc open_3d_cell ocv export_gltf eg help"
+    commands="list_cells lc open_3d_cell ocv export_gltf eg stats st help"
     cells=""
 
     case "${prev}" in
@@ -23,7 +23,7 @@ _gdst_complete() {
             COMPREPLY=( $(compgen -W "${opts}" -- ${cur}) )
             return 0
             ;;
-        export_gltf|eg)
+        export_gltf|eg|stats|st)
             opts="--file -f --layerstack -l"
             COMPREPLY=( $(compgen -W "${opts}" -- ${cur}) )
             return 0
@@ -3,10 +3,40 @@
 This program converts a GDSII 2D layout file to a glTF 3D file
 
 USAGE:
-    - edit the "layerstack" variable in the "CONFIGURATION" section below
-    - run "gdsiigtlf file.gds"
+    - run "gds2gltf file.gds [layerstack.txt]"
+    - optional filters for quick previews:
+        --layers Metal1,Via1,Metal2   only export the named layers
+        --zmin Z / --zmax Z           only export layers overlapping the z range
+        --max-depth N                 mesh N hierarchy levels, bounding boxes below
+        --flatten                     bake everything into one mesh per layer
+        --instancing                  one instanced node per cell and layer
+        --shape-instancing N          instance vias/contacts repeated more than N times
+        --vertex-cache                reorder triangles for the GPU vertex cache (ACMR)
+        --backend thread              mesh in threads instead of worker processes (or serial)
+        --cache [DIR]                 persistent mesh cache shared between runs
+        --incremental / --watch       re-mesh only changed cells / on every save
+        --checkpoint / --resume       keep finished meshes / continue an interrupted conversion
+        --profile trace.json          per-stage spans and per-cell counters (Chrome trace)
+        --memory-budget MB            spill finished meshes to disk above this RSS
+        --stream                      write meshes as they are finished instead of keeping them
+        --estimate                    predict triangles and output size without meshing
+        --catalog [CELLS]             one GLB per top cell (or matching cell) plus a JSON index
+        --split-layers [GROUPS]       one GLB per layer (or layer group) plus a manifest
+    - run "gds2gltf --batch 'blocks/*.gds' [--layerstack layerstack.txt]" to convert
+      many files with one worker pool and mesh cache
+    - run "gds2gltf --serve [HOST:PORT|SOCKET]" to keep designs loaded in a daemon
+      and fetch GLB files from /convert?gds=file.gds&top=cell&layers=...
 OUTPUT:
     - the files file.gds.gltf
+    - with --catalog: file.gds.catalog.bin (the GLB files one after the other)
+      and file.gds.catalog.json (offset, length and bounding box of every cell)
+    - with --split-layers: file.gds.layers/ with one GLB per layer and manifest.json
+
+LIBRARY:
+    from gds2gltf import Converter
+    converter = Converter("file.gds", "layerstack.txt").load()
+    converter.write("file.gltf")
+    converter.write("core_metal.glb", top="core", layers=["Metal*"])
 
 The program takes one argument, a path to a GDSII file. It reads shapes from
 each layer of the GDSII file, converts them to polygon boundaries, then makes
@@ -30,14 +60,47 @@ import triangle # triangulate polygons
 import time 
 
 import pygltflib
-from pygltflib import BufferFormat
-from pygltflib.validator import validate, summary
 from pygltflib.utils import gltf2glb
 
 import multiprocessing
 import os
+import argparse
+import fnmatch
+import hashlib
+import sqlite3
+import tempfile
+import json
+import collections
+import urllib.parse
+import http.server
+import socketserver
+import contextlib
+import cProfile
+import pstats
+import resource
+import threading
+import tracemalloc
+import struct
+import shutil
+import base64
+import io
+import glob
+import queue
+import re
+import functools
+import multiprocessing.pool
+import stat
 
 multithread = True
+BACKENDS = ("process", "thread", "serial") # execution backends of the meshing stage, see worker_pool()
+
+max_mesh_vertices = 2**32 - 1 # UNSIGNED_INT index limit
+MESH_CACHE_VERSION = 1 # bump when the meshing code changes its output
+look_for_places = [
+    "/usr/local/share/gdst",
+    ".",
+    "./layerstack"
+]
 
 def read_layerstack_from_file(filename):
     """Reads a layerstack from a text file.
@@ -77,6 +140,430 @@ def read_layerstack_from_file(filename):
     
     return layerstack
 
+def filter_layerstack(layerstack, layer_names=None, zmin=None, zmax=None):
+    """Returns the part of a layerstack selected by layer name and z range.
+
+    Args:
+        layerstack: The layerstack dictionary from read_layerstack_from_file.
+        layer_names: List of layer names to keep. Names are matched case
+            insensitively and may contain shell wildcards (e.g. "Metal*").
+            None keeps all layers.
+        zmin: Drop layers that lie completely below this z value.
+        zmax: Drop layers that lie completely above this z value.
+
+    Returns:
+        A new layerstack dictionary in the same order as the input.
+    """
+    filtered = {}
+    for key, layer in layerstack.items():
+        if layer_names is not None:
+            name = layer['name'].lower()
+            if not any(fnmatch.fnmatch(name, pattern.lower()) for pattern in layer_names):
+                continue
+        if zmin is not None and layer['zmax'] < zmin:
+            continue
+        if zmax is not None and layer['zmin'] > zmax:
+            continue
+        filtered[key] = layer
+    return filtered
+
+def find_layerstacks():
+    """Returns the distinct layerstack dictionaries of the *.txt files in the look_for_places directories."""
+    layerstacks = []
+    for place in look_for_places:
+        # Get all files from the directory
+        try:
+            files = os.listdir(place)
+            for file in files:
+                if file.endswith(".txt"):
+                    layerstack_file_path = os.path.join(place, file)
+                    try:
+                        layerstack = read_layerstack_from_file(layerstack_file_path)
+                        if layerstack not in layerstacks:
+                            layerstacks.append(layerstack)
+
+                    except ValueError:
+                        print(f"Error reading layerstack file: {layerstack_file_path}")
+
+        except FileNotFoundError:
+            continue
+    return layerstacks
+
+def guess_layerstack(gdsii, layerstacks=None):
+    """Picks the layerstack file matching most of the layers used in a GDSII library.
+
+    Args:
+        gdsii: The gdspy library.
+        layerstacks: Candidate layerstack dictionaries (default: find_layerstacks()).
+
+    Returns:
+        The best matching layerstack dictionary.
+
+    Raises:
+        ValueError: If no layerstack file shares a layer with the library.
+    """
+    print("Trying to guess layerstack file name from GDSII data types")
+    if layerstacks is None:
+        layerstacks = find_layerstacks()
+
+    # Get unique materials from all cells
+    unique_materials = []
+    for cell in gdsii.cells.values():
+        for material in get_unique_materials(cell):
+            if material not in unique_materials:
+                unique_materials.append(material)
+
+    best_match = 0
+    best_layerstack = None
+    for ls in layerstacks:
+        nMatches = 0
+        for material in unique_materials:
+            if (material[0], material[1]) in ls:
+                nMatches += 1
+        if nMatches > best_match:
+            best_match = nMatches
+            best_layerstack = ls
+        print(f"Layerstack: {ls.keys()} matches {nMatches} out of {len(unique_materials)}")
+
+    if best_layerstack is None:
+        raise ValueError("No layerstack file found matching the GDSII layers, pass one on the command line")
+    return best_layerstack
+
+def reference_matrices(ref):
+    """Returns the 2D placement transforms of a cell reference.
+
+    The transforms follow the GDSII convention used by gdspy: magnification,
+    array spacing, x reflection, rotation and finally translation to origin.
+
+    Args:
+        ref: A gdspy CellReference or CellArray.
+
+    Returns:
+        A numpy array of shape (n, 3, 3) with one homogeneous matrix per
+        placement (n is 1 for a plain reference, columns*rows for an array).
+    """
+    mag = ref.magnification if ref.magnification is not None else 1.0
+    base = np.diag([mag, mag, 1.0])
+    if isinstance(ref, gdspy.CellArray):
+        ii, jj = np.meshgrid(np.arange(ref.columns), np.arange(ref.rows), indexing='ij')
+        offsets = np.stack((ii.ravel() * ref.spacing[0], jj.ravel() * ref.spacing[1]), axis=1)
+    else:
+        offsets = np.zeros((1, 2))
+    matrices = np.tile(base, (len(offsets), 1, 1))
+    matrices[:, 0:2, 2] = offsets
+
+    outer = np.identity(3)
+    if ref.x_reflection:
+        outer = np.diag([1.0, -1.0, 1.0]) @ outer
+    if ref.rotation is not None:
+        ct = np.cos(np.radians(ref.rotation))
+        st = np.sin(np.radians(ref.rotation))
+        outer = np.array([[ct, -st, 0], [st, ct, 0], [0, 0, 1]]) @ outer
+    outer[0:2, 2] = ref.origin
+    return outer @ matrices
+
+def matrices_to_trs(matrices):
+    """Splits 2D placement matrices into glTF translation, rotation and scale.
+
+    GDSII placements only rotate about z, mirror in y and scale uniformly, so
+    the linear part is R(angle) @ diag(mag, +-mag).
+
+    Args:
+        matrices: numpy array of shape (n, 3, 3).
+
+    Returns:
+        (translations (n, 3), rotations as xyzw quaternions (n, 4), scales (n, 3))
+    """
+    n = len(matrices)
+    linear = matrices[:, 0:2, 0:2]
+    det = np.linalg.det(linear)
+    mag = np.sqrt(np.abs(det))
+    angle = np.arctan2(linear[:, 1, 0], linear[:, 0, 0])
+
+    translations = np.zeros((n, 3))
+    translations[:, 0:2] = matrices[:, 0:2, 2]
+    rotations = np.zeros((n, 4))
+    rotations[:, 2] = np.sin(angle / 2)
+    rotations[:, 3] = np.cos(angle / 2)
+    scales = np.ones((n, 3))
+    scales[:, 0] = mag
+    scales[:, 1] = np.where(det < 0, -mag, mag)
+    return translations, rotations, scales
+
+def stack_bounds(layer_bounds, layerstack):
+    """Returns the 3D bounding box of the layerstack layers in a cell_layer_bounds() result.
+
+    Returns:
+        [[xmin, ymin, zmin], [xmax, ymax, zmax]], or None if none of the layers
+        has geometry.
+    """
+    boxes = [(lo, hi, layerstack[lnum]) for lnum, (lo, hi) in layer_bounds.items() if lnum in layerstack]
+    if not boxes:
+        return None
+    lo = np.min([[*lo, layer['zmin']] for lo, _, layer in boxes], axis=0)
+    hi = np.max([[*hi, layer['zmax']] for _, hi, layer in boxes], axis=0)
+    return [lo.tolist(), hi.tolist()]
+
+def trs_matrices(trs):
+    """Returns the (n, 4, 4) matrices of translation, xyzw rotation and scale rows (n, 10), see NodeTable."""
+    x, y, z, w = trs[:, 3:7].T
+    matrices = np.zeros((len(trs), 4, 4))
+    matrices[:, 0, 0:3] = np.stack((1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)), axis=1)
+    matrices[:, 1, 0:3] = np.stack((2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)), axis=1)
+    matrices[:, 2, 0:3] = np.stack((2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)), axis=1)
+    matrices[:, 0:3, 0:3] *= trs[:, None, 7:10]
+    matrices[:, 0:3, 3] = trs[:, 0:3]
+    matrices[:, 3, 3] = 1
+    return matrices
+
+def transform_boxes(lo, hi, matrices):
+    """Returns the axis aligned bounds (lo, hi) of boxes lo, hi (n, 3) transformed by affine matrices (n, 4, 4)."""
+    center = (lo + hi) / 2
+    extent = (hi - lo) / 2
+    center = np.einsum('nij,nj->ni', matrices[:, 0:3, 0:3], center) + matrices[:, 0:3, 3]
+    extent = np.einsum('nij,nj->ni', np.abs(matrices[:, 0:3, 0:3]), extent)
+    return center - extent, center + extent
+
+def placed_box(lo, hi, matrices):
+    """Returns the bounds (lo, hi) of the 3D box lo, hi placed with every 2D transform of matrices (n, 3, 3)."""
+    placed = np.zeros((len(matrices), 4, 4))
+    placed[:, 0:2, 0:2] = matrices[:, 0:2, 0:2]
+    placed[:, 0:2, 3] = matrices[:, 0:2, 2]
+    placed[:, 2, 2] = placed[:, 3, 3] = 1
+    placed_lo, placed_hi = transform_boxes(np.tile(lo, (len(matrices), 1)), np.tile(hi, (len(matrices), 1)), placed)
+    return placed_lo.min(axis=0), placed_hi.max(axis=0)
+
+def tree_depths(parents):
+    """Returns the depth of every node of a forest given as parent indices (-1 for roots), by pointer jumping."""
+    depths = (parents >= 0).astype(np.int64)
+    up = parents.copy()
+    jump = np.flatnonzero(up >= 0)
+    while len(jump):
+        # depths[i] is the distance from i to up[i]; every round doubles it
+        depths[jump] += depths[up[jump]]
+        up[jump] = up[up[jump]]
+        jump = jump[up[jump] >= 0]
+    return depths
+
+def cell_layer_bounds(cell, layerstack, bounds_cache):
+    """Returns the per-layer 2D bounding boxes of a cell and its whole subtree.
+
+    Only layers in the (filtered) layerstack are taken into account. Results
+    are memoized in bounds_cache by cell name, so every cell is visited once.
+
+    Args:
+        cell: The gdspy cell.
+        layerstack: The layerstack dictionary.
+        bounds_cache: Dictionary used to memoize the result per cell name.
+
+    Returns:
+        A dictionary mapping layerstack keys to [[xmin, ymin], [xmax, ymax]].
+    """
+    if cell.name in bounds_cache:
+        return bounds_cache[cell.name]
+
+    bounds = {}
+    def grow(lnum, points):
+        lo = points.min(axis=0)
+        hi = points.max(axis=0)
+        if lnum in bounds:
+            lo = np.minimum(lo, bounds[lnum][0])
+            hi = np.maximum(hi, bounds[lnum][1])
+        bounds[lnum] = np.array([lo, hi])
+
+    for path in cell.paths:
+        lnum = (path.layers[0], path.datatypes[0])
+        if lnum in layerstack:
+            for poly in path.get_polygons():
+                grow(lnum, np.asarray(poly))
+    for polygon in cell.polygons:
+        lnum = (polygon.layers[0], polygon.datatypes[0])
+        if lnum in layerstack:
+            for sub_polygon in polygon.polygons:
+                grow(lnum, np.asarray(sub_polygon))
+
+    for ref in cell.references:
+        if not isinstance(ref.ref_cell, gdspy.Cell):
+            continue
+        child_bounds = cell_layer_bounds(ref.ref_cell, layerstack, bounds_cache)
+        if not child_bounds:
+            continue
+        matrices = reference_matrices(ref)
+        for lnum, (lo, hi) in child_bounds.items():
+            corners = np.array([[lo[0], lo[1], 1], [hi[0], lo[1], 1],
+                                [hi[0], hi[1], 1], [lo[0], hi[1], 1]])
+            placed = np.einsum('nij,kj->nki', matrices, corners)[:, :, 0:2]
+            grow(lnum, placed.reshape(-1, 2))
+
+    bounds_cache[cell.name] = bounds
+    return bounds
+
+def box_mesh(lo, hi, zmin, zmax):
+    """Returns positions and triangle indices of an axis aligned box."""
+    positions = np.array([[lo[0], lo[1], zmax], [hi[0], lo[1], zmax],
+                          [hi[0], hi[1], zmax], [lo[0], hi[1], zmax],
+                          [lo[0], lo[1], zmin], [hi[0], lo[1], zmin],
+                          [hi[0], hi[1], zmin], [lo[0], hi[1], zmin]])
+    indices = np.array([[0, 1, 2], [0, 2, 3],   # top
+                        [4, 6, 5], [4, 7, 6],   # bottom
+                        [0, 4, 5], [0, 5, 1],   # front
+                        [1, 5, 6], [1, 6, 2],   # right
+                        [2, 6, 7], [2, 7, 3],   # back
+                        [3, 7, 4], [3, 4, 0]])  # left
+    return positions, indices
+
+def cells_within_depth(top_cell, max_depth):
+    """Returns the names of the cells placed at hierarchy depth <= max_depth.
+
+    The top cell is at depth 0. With max_depth None all cells below the top
+    cell are returned.
+    """
+    names = {top_cell.name}
+    level = [top_cell]
+    depth = 0
+    while level and (max_depth is None or depth < max_depth):
+        next_level = []
+        for cell in level:
+            for ref in cell.references:
+                if isinstance(ref.ref_cell, gdspy.Cell) and ref.ref_cell.name not in names:
+                    names.add(ref.ref_cell.name)
+                    next_level.append(ref.ref_cell)
+        level = next_level
+        depth += 1
+    return names
+
+def flatten_placements(top_cell, max_depth=None):
+    """Composes the world transforms of every cell placement below top_cell.
+
+    The hierarchy is walked one level at a time and the reference transforms
+    of a level are composed with all placements of the parent cell in one
+    batched matrix product, so the work is done in numpy and not per instance.
+
+    Args:
+        top_cell: The gdspy top cell, placed with the identity transform.
+        max_depth: Placements deeper than this are returned as proxies
+            (bounding boxes) instead of being expanded further.
+
+    Returns:
+        (placements, proxies): two dictionaries mapping cell names to numpy
+        arrays of shape (n, 3, 3) holding the world transforms of the cell.
+    """
+    cells = {}
+    placements = {}
+    proxies = {}
+    level = {top_cell.name: np.identity(3)[None]}
+    cells[top_cell.name] = top_cell
+    depth = 0
+    while level:
+        next_level = {}
+        for name, matrices in level.items():
+            placements.setdefault(name, []).append(matrices)
+            for ref in cells[name].references:
+                if not isinstance(ref.ref_cell, gdspy.Cell):
+                    continue
+                cells[ref.ref_cell.name] = ref.ref_cell
+                composed = compose_placements(matrices, reference_matrices(ref))
+                target = proxies if max_depth is not None and depth + 1 > max_depth else next_level
+                target.setdefault(ref.ref_cell.name, []).append(composed)
+        level = {name: np.concatenate(parts) for name, parts in next_level.items()}
+        depth += 1
+
+    placements = {name: np.concatenate(parts) for name, parts in placements.items()}
+    proxies = {name: np.concatenate(parts) for name, parts in proxies.items()}
+    return placements, proxies
+
+def placement_counts(top_cell, max_depth=None):
+    """Counts the placements of every cell below top_cell, like flatten_placements() without transforms.
+
+    Returns:
+        (counts, proxies, transformed): dictionaries mapping cell names to the
+        number of placements, of placements below max_depth (drawn as bounding
+        boxes), and of placements that rotate, mirror or scale the cell.
+    """
+    counts, proxies, transformed = {}, {}, {}
+    cells = {top_cell.name: top_cell}
+    level = {top_cell.name: (1, 0)}
+    depth = 0
+    while level:
+        next_level = {}
+        for name, (count, rotated) in level.items():
+            counts[name] = counts.get(name, 0) + count
+            transformed[name] = transformed.get(name, 0) + rotated
+            for ref in cells[name].references:
+                if not isinstance(ref.ref_cell, gdspy.Cell):
+                    continue
+                cells[ref.ref_cell.name] = ref.ref_cell
+                elements = ref.columns * ref.rows if isinstance(ref, gdspy.CellArray) else 1
+                plain = not ref.rotation and not ref.x_reflection and ref.magnification in (None, 1)
+                if max_depth is not None and depth + 1 > max_depth:
+                    proxies[ref.ref_cell.name] = proxies.get(ref.ref_cell.name, 0) + count * elements
+                    continue
+                child_count, child_rotated = next_level.get(ref.ref_cell.name, (0, 0))
+                next_level[ref.ref_cell.name] = (child_count + count * elements,
+                                                 child_rotated + (rotated if plain else count) * elements)
+        level = next_level
+        depth += 1
+    return counts, proxies, transformed
+
+def cell_layer_counts(cell, layerstack):
+    """Returns {layer key: (polygons, points)} of the shapes process_cell would mesh, without meshing them."""
+    counts = {}
+    if cell.name == '$$$CONTEXT_INFO$$$':
+        return counts
+    def add(lnum, polygons):
+        polygons_before, points_before = counts.get(lnum, (0, 0))
+        counts[lnum] = (polygons_before + len(polygons), points_before + sum(len(polygon) for polygon in polygons))
+    for path in cell.paths:
+        if (path.layers[0], path.datatypes[0]) in layerstack:
+            add((path.layers[0], path.datatypes[0]), path.get_polygons())
+    for polygon in cell.polygons:
+        if (polygon.layers[0], polygon.datatypes[0]) in layerstack:
+            add((polygon.layers[0], polygon.datatypes[0]), polygon.polygons)
+    return counts
+
+def extruded_size(polygons, points):
+    """Returns (vertices, triangles) of the extruded mesh process_cell makes of polygons with points in total.
+
+    A simple n point polygon is filled with n - 2 triangles, copied to the top
+    and the bottom, and each edge gives two side triangles, which is the
+    num_polygon_points*2 + triangles*2 of process_cell.
+    """
+    return 2 * points, 2 * points + 2 * (points - 2 * polygons)
+
+def bake_mesh(gltf_indices, gltf_positions, matrices):
+    """Transforms a mesh into world space once per placement matrix.
+
+    Args:
+        gltf_indices: Triangle indices of the mesh, shape (t, 3).
+        gltf_positions: Vertex positions of the mesh, shape (m, 3).
+        matrices: World transforms, shape (n, 3, 3).
+
+    Returns:
+        (indices, positions) of the n concatenated copies. Copies placed with a
+        mirroring transform get their triangle winding reversed.
+    """
+    n = len(matrices)
+    m = len(gltf_positions)
+    xy = np.einsum('nij,mj->nmi', matrices[:, 0:2, 0:2], gltf_positions[:, 0:2]) + matrices[:, None, 0:2, 2]
+    z = np.broadcast_to(gltf_positions[:, 2], (n, m))
+    positions = np.concatenate((xy, z[:, :, None]), axis=2).reshape(-1, 3)
+
+    indices = np.broadcast_to(gltf_indices, (n,) + gltf_indices.shape).copy()
+    mirrored = np.linalg.det(matrices[:, 0:2, 0:2]) < 0
+    indices[mirrored] = indices[mirrored][:, :, ::-1]
+    indices += (np.arange(n) * m)[:, None, None]
+    return indices.reshape(-1, 3), positions
+
+def offset_matrices(offsets):
+    """Returns translation matrices of shape (k, 3, 3) for 2D offsets of shape (k, 2)."""
+    matrices = np.tile(np.identity(3), (len(offsets), 1, 1))
+    matrices[:, 0:2, 2] = offsets
+    return matrices
+
+def compose_placements(matrices, local_matrices):
+    """Returns every product matrices[a] @ local_matrices[b] as an array of shape (a*b, 3, 3)."""
+    return np.einsum('aij,bjk->abik', matrices, local_matrices).reshape(-1, 3, 3)
+
 def export_glb(gltf_filename):
     # glb_filename = gltf_filename.replace(".gltf", ".glb")
     gltf2glb(gltf_filename)
@@ -128,61 +615,389 @@ def remove_duplicates(polygon, edges, tol=1e-6):
     
     return new_polygon, new_edges
 
-def add_cell_node(c, parent_node, prefix):
-        for ref in c.references:
-            instance_node = pygltflib.Node()
-            instance_node.extras = {}
-            instance_node.extras["type"] = ref.ref_cell.name;
-            if(ref.properties.get(61)==None):
-                # ref.ref_cell.name
-                instance_node.name = "???"; 
-            else:
-                instance_node.name = ref.properties[61]
-                
-            #print(prefix, instance_node.name, "(", ref.ref_cell.name + ")")
-            instance_node.translation = [ref.origin[0], ref.origin[1], 0]
-            if(ref.rotation!=None):
-                if(ref.rotation==90):
-                    instance_node.rotation = [ 0, 0, 0.7071068, 0.7071068 ]
-                elif(ref.rotation==180):
-                    instance_node.rotation = [ 0, 0, 1, 0 ]
-                elif(ref.rotation==270):
-                    instance_node.rotation = [ 0, 0, 0.7071068, -0.7071068 ]
-            if(ref.x_reflection):
-                instance_node.scale = [1,-1,1]
-
-            for layer in layerstack.values():
-                lib_name = ref.ref_cell.name + "_" + layer['name']
-                if(meshes_lib.get(lib_name)!=None):
-                    layer_node = pygltflib.Node()
-                    layer_node.name = lib_name
-                    layer_node.mesh = meshes_lib[lib_name]
-                    gltf.nodes.append(layer_node)
-                    instance_node.children.append(len(gltf.nodes)-1)
-            
-            if(len(ref.ref_cell.references)>0):
-                add_cell_node(ref.ref_cell, instance_node, prefix + "\t")
-
-            gltf.nodes.append(instance_node)
-            parent_node.children.append(len(gltf.nodes)-1)
-
-def process_cell(cell):
-    global end_time
-    # global binaryBlob
-    
+def cell_layer_fingerprints(cell, layerstack, shape_precision=1e-6):
+    """Returns a geometry fingerprint for every layerstack layer used by a cell.
+
+    The fingerprint hashes the polygon coordinates of the cell's own shapes on
+    one layer (rounded to shape_precision and sorted, so the order in the file
+    does not matter). Cells with the same fingerprint on a layer produce the
+    same mesh, e.g. the "$$" suffixed copies KLayout creates when merging.
+
+    Args:
+        cell: The gdspy cell.
+        layerstack: The layerstack dictionary, other layers are ignored.
+        shape_precision: Coordinate rounding step of the hash.
+
+    Returns:
+        A dictionary mapping layerstack keys to hex digests.
+    """
+    layers = {}
+    for path in cell.paths:
+        lnum = (path.layers[0], path.datatypes[0])
+        if lnum in layerstack:
+            layers.setdefault(lnum, []).extend(path.get_polygons())
+    for polygon in cell.polygons:
+        lnum = (polygon.layers[0], polygon.datatypes[0])
+        if lnum in layerstack:
+            layers.setdefault(lnum, []).extend(polygon.polygons)
+
+    fingerprints = {}
+    for lnum, polygons in layers.items():
+        keys = sorted(np.round(np.asarray(polygon) / shape_precision).astype(np.int64).tobytes()
+                      for polygon in polygons)
+        digest = hashlib.sha1()
+        for key in keys:
+            digest.update(len(key).to_bytes(4, 'little'))
+            digest.update(key)
+        fingerprints[lnum] = digest.hexdigest()
+    return fingerprints
+
+def split_repeated_shapes(polygons, threshold, shape_precision=1e-6):
+    """Separates shapes that repeat more than threshold times within a layer.
+
+    Two polygons are the same shape when their points, relative to the lower
+    left corner of their bounding box, agree to shape_precision. Via arrays
+    and contact rows are typically thousands of copies of one small square.
+
+    Args:
+        polygons: List of (points, None, False) tuples of one cell layer.
+        threshold: Minimum number of copies (exclusive) to instance a shape.
+        shape_precision: Coordinate rounding step when comparing shapes.
+
+    Returns:
+        (remaining, repeated): the polygons that are meshed as usual, and a list
+        of (prototype points at the origin, offsets of shape (k, 2)).
+    """
+    groups = {}
+    origins = []
+    for index, (polygon, _, _) in enumerate(polygons):
+        polygon = np.asarray(polygon)
+        origin = polygon.min(axis=0)
+        origins.append(origin)
+        key = np.round((polygon - origin) / shape_precision).astype(np.int64).tobytes()
+        groups.setdefault(key, []).append(index)
+
+    repeated = []
+    instanced = set()
+    for indices in groups.values():
+        if len(indices) > threshold:
+            prototype = np.asarray(polygons[indices[0]][0]) - origins[indices[0]]
+            repeated.append((prototype, np.array([origins[i] for i in indices])))
+            instanced.update(indices)
+
+    remaining = [polygon for i, polygon in enumerate(polygons) if i not in instanced]
+    return remaining, repeated
+
+def triangulate_polygon(polygon):
+    """Insets a GDSII polygon slightly and fills it with triangles.
+
+    Args:
+        polygon: numpy array of polygon points, shape (n, 2).
+
+    Returns:
+        (polygon, triangles, clockwise): the deduplicated inset polygon points,
+        the output dictionary of triangle.triangulate and the point orientation.
+    """
+    num_polygon_points = len(polygon)
+
+    # determine whether polygon points are CW or CCW
+    area = 0
+    for i, v1 in enumerate(polygon): # loop through vertices
+        v2 = polygon[(i+1) % num_polygon_points]
+        area += (v2[0]-v1[0])*(v2[1]+v1[1]) # integrate area
+    clockwise = area > 0
+
+    # GDSII implements holes in polygons by making the polygon edge
+    # wrap into the hole and back out along the same line. However,
+    # this confuses the triangulation library, which fills the holes
+    # with extra triangles. Avoid this by moving each edge back a
+    # very small amount so that no two edges of the same polygon overlap.
+    # Define a small threshold to avoid division by very small numbers (to prevent NaNs or infinities)
+
+    epsilon = 1e-8  
+    delta = 0.00001  # Amount to inset each vertex by (smaller values have caused issues in the past)
+
+    # Step 1: Extract polygon points
+    points_i = polygon  # Get the list of points representing the polygon vertices
+
+    # Step 2: Shift points to get neighbors
+    points_j = np.roll(points_i, -1, axis=0)  # Shift points forward by 1 (next point)
+    points_k = np.roll(points_i, 1, axis=0)   # Shift points backward by 1 (previous point)
+
+    # Step 3: Calculate normals for edges (between consecutive vertices)
+    # Normal between current and next vertex (i -> j)
+    normal_ij = np.stack((points_j[:, 1] - points_i[:, 1],  # y-component difference
+                        points_i[:, 0] - points_j[:, 0]), axis=1)  # x-component difference (perpendicular)
+
+    # Normal between current and previous vertex (i -> k)
+    normal_ik = np.stack((points_i[:, 1] - points_k[:, 1],  # y-component difference
+                        points_k[:, 0] - points_i[:, 0]), axis=1)  # x-component difference (perpendicular)
+
+    # Step 4: Compute the lengths of these normal vectors
+    length_ij = np.linalg.norm(normal_ij, axis=1)
+    length_ik = np.linalg.norm(normal_ik, axis=1)
+
+    # Step 5: Handle small lengths to avoid division by near-zero values
+    length_ij[length_ij < epsilon] = 1  # Set very small lengths to 1 to avoid division issues
+    length_ik[length_ik < epsilon] = 1  # Set very small lengths to 1
+
+    # Step 6: Normalize the normals (unit vectors)
+    normal_ij /= np.stack((length_ij, length_ij), axis=1)  # Normalize by dividing by length
+    normal_ik /= np.stack((length_ik, length_ik), axis=1)  # Normalize by dividing by length
+
+    # Step 7: Adjust direction of normals if polygon is oriented clockwise
+    if clockwise:
+        normal_ij = -normal_ij  # Reverse direction for clockwise orientation
+        normal_ik = -normal_ik
+
+    # Step 8: Move each vertex inward by 'delta' along its two edge normals
+    # Each vertex is moved inward along both the normal to its adjacent edges
+    polygon = points_i - delta * normal_ij - delta * normal_ik
+
+    # In an extreme case of the above, the polygon edge doubles back on
+    # itself on the same line, resulting in a zero-width segment. I've
+    # seen this happen, e.g., with a capital "N"-shaped hole, where
+    # the hole split line cuts out the "N" shape but splits apart to
+    # form the triangle cutout in one side of the shape. In any case,
+    # simply moving the polygon edges isn't enough to deal with this;
+    # we'll additionally mark points just outside of each edge, between
+    # the original edge and the delta-shifted edge, as outside the polygon.
+    # These parts will be removed from the triangulation, and this solves
+    # just this case with no adverse affects elsewhere.
+    hole_delta = 0.00001 # small fraction of delta
+    holes = 0.5*(points_j+points_i) - hole_delta*delta*normal_ij
+    # HOWEVER: sometimes this causes a segmentation fault in the triangle
+    # library. I've observed this as a result of certain various polygons.
+    # Frustratingly, the fault can be bypassed by *rotating the polygons*
+    # by like 30 degrees (exact angle seems to depend on delta values) or
+    # moving one specific edge outward a bit. I have absolutely no idea
+    # what is wrong. In the interest of stability over full functionality,
+    # this is disabled. TODO: figure out why this happens and fix it.
+    use_holes = False
+
+
+    # triangulate: compute triangles to fill polygon
+    point_array = np.arange(num_polygon_points)
+
+    edges = np.transpose(np.stack((point_array, np.roll(point_array, 1))))
+    polygon, edges = remove_duplicates(polygon, edges)
+
+    if use_holes:
+        triangles = triangle.triangulate(dict(vertices=polygon,
+                                            segments=edges,
+                                            holes=holes), opts='p')
+    else:
+        triangles = triangle.triangulate(dict(vertices=polygon,
+                                            segments=edges), opts='p')
+
+    if not 'triangles' in triangles.keys():
+        triangles['triangles'] = []
+
+    return polygon, triangles, clockwise
+
+def extrude_polygons(polygons, zmin, zmax):
+    """Builds the extruded triangle mesh of triangulated polygons.
+
+    Args:
+        polygons: List of (polygon, triangles, clockwise) tuples from triangulate_polygon.
+        zmin: Bottom z of the layer.
+        zmax: Top z of the layer.
+
+    Returns:
+        (gltf_indices, gltf_positions): numpy arrays of shape (t, 3) and (m, 3).
+    """
+    positions_list = []
+    indices_list = []
+    indices_offset = 0
+    for i,(_, poly_data, clockwise) in enumerate(polygons):
+        p_positions_top = np.insert(poly_data['vertices'], 2, zmax, axis=1)
+        p_positions_bottom = np.insert( poly_data['vertices'] , 2, zmin, axis=1)
+
+        p_positions = np.concatenate( (p_positions_top, p_positions_bottom) )
+        p_indices_top = np.reshape(poly_data['triangles'], (-1, 3))
+        p_indices_bottom = np.flip ((p_indices_top+len(p_positions_top)), axis=1 )
+
+        ind_list_top = np.arange(len(p_positions_top))
+        ind_list_bottom = np.arange(len(p_positions_top)) + len(p_positions_top)
+
+        if(clockwise):
+            ind_list_top = np.flip(ind_list_top, axis=0)
+            ind_list_bottom = np.flip(ind_list_bottom, axis=0)
+
+        p_indices_right = np.stack( (ind_list_bottom, np.roll(ind_list_bottom, -1, axis=0) , np.roll(ind_list_top, -1, axis=0)), axis=1 )
+        p_indices_left = np.stack( ( np.roll(ind_list_top, -1, axis=0), ind_list_top , ind_list_bottom ) , axis=1)
+
+        p_indices = np.concatenate( (p_indices_top, p_indices_bottom, p_indices_right, p_indices_left) )
+
+        positions_list.append(p_positions)
+        indices_list.append(p_indices + indices_offset)
+        indices_offset += len(p_positions)
+
+    if not positions_list:
+        return np.zeros((0, 3), dtype=np.int64), np.zeros((0, 3))
+    return np.concatenate(indices_list), np.concatenate(positions_list)
+
+VERTEX_CACHE_SIZE = 16 # entries of the FIFO post-transform vertex cache of the ACMR figures
+
+def mesh_components(indices):
+    """Splits a triangle list into runs of triangles that share no vertex with the runs before.
+
+    extrude_polygons() appends the polygons one after the other, each with
+    its own range of vertices, so every polygon starts a new run.
+
+    Returns:
+        (starts, lo, hi): first triangle, lowest and highest vertex index of every run.
+    """
+    if not len(indices):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    reach = np.maximum.accumulate(indices.max(axis=1))
+    starts = np.flatnonzero(np.concatenate(([True], indices[1:].min(axis=1) > reach[:-1])))
+    return starts, np.minimum.reduceat(indices.min(axis=1), starts), np.maximum.reduceat(indices.max(axis=1), starts)
+
+def vertex_cache_misses(indices, cache_size=VERTEX_CACHE_SIZE):
+    """Returns the vertex shader runs of a (t, 3) triangle list drawn with a FIFO vertex cache.
+
+    Divided by the triangle count this is the ACMR (average cache miss ratio).
+    Runs with fewer vertices than the cache miss each of their vertices once,
+    they are counted in bulk; the cache is only simulated for larger runs.
+    """
+    starts, lo, hi = mesh_components(indices)
+    ends = np.append(starts[1:], len(indices))
+    small = hi - lo < cache_size
+    misses = np.unique(indices[np.repeat(small, ends - starts)]).size
+    for start, end in zip(starts[~small], ends[~small]):
+        entered = {} # vertex -> miss count when it entered the cache
+        count = 0
+        for vertex in indices[start:end].ravel().tolist():
+            if count - entered.get(vertex, -cache_size - 1) > cache_size:
+                entered[vertex] = count
+                count += 1
+        misses += count
+    return misses
+
+def forsyth_order(triangles, num_vertices, cache_size=VERTEX_CACHE_SIZE):
+    """Returns the triangle order of Tom Forsyth's linear-speed vertex cache optimisation.
+
+    The triangles are emitted greedily: next comes the triangle with the
+    highest sum of vertex scores among the triangles of the vertices in a
+    simulated LRU cache. Vertices score by their cache position and get a
+    bonus for few remaining triangles, so fans are finished before their
+    vertices are evicted.
+
+    Args:
+        triangles: (t, 3) vertex indices below num_vertices.
+        num_vertices: Number of vertices.
+        cache_size: Entries of the simulated cache.
+
+    Returns:
+        Array with the new order of the triangle rows.
+    """
+    counts = np.bincount(triangles.ravel(), minlength=num_vertices)
+    offsets = np.concatenate(([0], np.cumsum(counts))).tolist()
+    triangle_of = (np.argsort(triangles.ravel(), kind="stable") // 3).tolist()
+    adjacent = [triangle_of[offsets[v]:offsets[v + 1]] for v in range(num_vertices)]
+    remaining = counts.tolist()
+    valence_score = [2.0 * count ** -0.5 if count else 0.0 for count in range(max(remaining) + 1)]
+    position_score = [0.75] * 3 + [(1 - (p - 3) / (cache_size - 3)) ** 1.5 for p in range(3, cache_size)]
+    score = [valence_score[count] for count in remaining]
+    corners = triangles.tolist()
+    emitted = [False] * len(corners)
+    order = []
+    cache = []
+    best = max(range(len(corners)), key=lambda t: sum(score[v] for v in corners[t]))
+    first_left = 0
+    while best >= 0:
+        order.append(best)
+        emitted[best] = True
+        triangle = corners[best]
+        for v in triangle:
+            remaining[v] -= 1
+        touched = triangle + [v for v in cache if v not in triangle]
+        cache = touched[:cache_size]
+        for p, v in enumerate(cache):
+            score[v] = position_score[p] + valence_score[remaining[v]] if remaining[v] else -1.0
+        for v in touched[cache_size:]:
+            score[v] = valence_score[remaining[v]]
+        best, best_score = -1, -1.0
+        for v in cache:
+            for t in adjacent[v]:
+                if not emitted[t]:
+                    a, b, c = corners[t]
+                    if score[a] + score[b] + score[c] > best_score:
+                        best, best_score = t, score[a] + score[b] + score[c]
+        if best < 0 and len(order) < len(corners):
+            # nothing left around the cache, go on with the first triangle not emitted
+            while emitted[first_left]:
+                first_left += 1
+            best = first_left
+    return np.array(order, dtype=np.int64)
+
+def optimize_vertex_cache(indices, positions, cache_size=VERTEX_CACHE_SIZE):
+    """Reorders the triangles and vertices of a layer mesh for the GPU vertex caches.
+
+    Polygons with more vertices than the cache get the triangle order of
+    forsyth_order(); smaller ones already miss every vertex once and keep
+    theirs. The vertices are then renumbered in order of first use, so the
+    vertex fetch reads the positions buffer front to back.
+
+    Returns:
+        (indices, positions): the reordered mesh with the same triangles and windings.
+    """
+    if not len(indices):
+        return indices, positions
+    starts, lo, hi = mesh_components(indices)
+    ends = np.append(starts[1:], len(indices))
+    indices = indices.copy()
+    for start, end, first, last in zip(starts, ends, lo, hi):
+        if last - first >= cache_size:
+            local = indices[start:end] - first
+            indices[start:end] = local[forsyth_order(local, last - first + 1, cache_size)] + first
+    used, first_use = np.unique(indices.ravel(), return_index=True)
+    order = used[np.argsort(first_use)]
+    if len(order) < len(positions):
+        order = np.concatenate((order, np.setdiff1d(np.arange(len(positions)), used)))
+    renumber = np.empty(len(positions), dtype=indices.dtype)
+    renumber[order] = np.arange(len(positions))
+    return renumber[indices], positions[order]
+
+def process_cell(cell, layerstack, shape_instancing=None, shape_precision=1e-6, vertex_cache=False):
+    """Triangulates and extrudes the shapes of one cell, layer by layer.
+
+    Runs in the worker processes or threads, so everything it needs is
+    passed in and it changes no shared state. The triangle library holds the
+    GIL, so only the NumPy parts run in parallel in a thread pool of a
+    regular Python build.
+
+    Args:
+        cell: The gdspy cell.
+        layerstack: The layers to mesh, other layers are skipped.
+        shape_instancing: Instance shapes repeated more than this many times
+            (None meshes every shape).
+        shape_precision: Coordinate precision when comparing repeated shapes.
+        vertex_cache: Reorder the meshes with optimize_vertex_cache() and count
+            the vertex cache misses before and after.
+
+    Returns:
+        (meshes, stats): meshes maps layerstack keys to (indices, positions,
+        shapes), where shapes is a list of (indices, positions, offsets)
+        repeated shape groups; the layer mesh is empty when all its shapes are
+        instanced. stats holds the start and end time, the worker pid and
+        thread id and per layer name counters (see Profiler.add_cell_stats).
+    """
     layers = {} # array to hold all geometry, sorted into layers
     
-    start_time = time.time()
-    print ("\nProcessing cell: ", cell.name)
+    start_time = time.perf_counter()
+    stats = {'start': start_time, 'end': start_time, 'pid': os.getpid(), 'thread': threading.get_native_id(),
+             'layers': {}}
     
     # $$$CONTEXT_INFO$$$ is a separate, non-standard compliant cell added
     # optionally by KLayout to store extra information not needed here.
     # see https://www.klayout.de/forum/discussion/1026/very-
     # important-gds-exported-from-k-layout-not-working-on-cadence-at-foundry
     if cell.name == '$$$CONTEXT_INFO$$$':
-        return # skip this cell
+        return {}, stats # skip this cell
 
-    print ("\tpaths loop. total paths:" , len(cell.paths))
     # loop through paths in cell
     for path in cell.paths:
         lnum = (path.layers[0],path.datatypes[0]) # GDSII layer number
@@ -195,8 +1010,6 @@ def process_cell(cell):
         for poly in path.get_polygons():
             layers[lnum].append((poly, None, False))
 
-    print ("\tpolygons loop. total polygons:" , len(cell.polygons))
-
     for polygon in cell.polygons:
         # Get the first layer and datatype of the polygon
         layer_and_type = (polygon.layers[0], polygon.datatypes[0])
@@ -241,183 +1054,69 @@ def process_cell(cell):
     # which is a Python interface to a fast and well-written C library also called
     # triangle (with documentation at https://www.cs.cmu.edu/~quake/triangle.html).
 
-    print('\tTriangulating polygons...')
-
-    
     num_triangles = {} # will store the number of triangles for each layer
-    print(f"\t{len(layers)} layers found")
     # loop through all layers
 
-    node_names = []
-    curIndices = []
-    curPositions = []
-    layer_numbers = []
-    cur_gltf_indices = []
-    cur_gltf_positions = []
+    meshes = {}
 
     for layer_number, polygons in layers.items():
-        print(f"\tLayer {layer_number} has {len(polygons)} polygons, name: {layerstack[layer_number]['name']}")
-        # print(f"\tLayer name: {layerstack[layer_number]['name']}")
-        # print(f"\tLayer {layer_number} has {len(polygons)} polygons")
         # but skip layer if it won't be exported
         if not layer_number in layerstack.keys():
             continue
 
         num_triangles[layer_number] = 0
 
+        zmin = layerstack[layer_number]['zmin']
+        zmax = layerstack[layer_number]['zmax']
+
+        num_polygons = len(polygons)
+        triangulate_calls = 0
+
+        # repeated vias and contacts: mesh one prototype and keep the offsets
+        shapes = []
+        if shape_instancing is not None:
+            polygons, repeated = split_repeated_shapes(polygons, shape_instancing, shape_precision)
+            for prototype, offsets in repeated:
+                shape_indices, shape_positions = extrude_polygons([triangulate_polygon(prototype)], zmin, zmax)
+                if vertex_cache:
+                    shape_indices, shape_positions = optimize_vertex_cache(shape_indices, shape_positions)
+                shapes.append((shape_indices, shape_positions, offsets))
+                triangulate_calls += 1
+
         # loop through polygons in layer
         for index, (polygon, _, _) in enumerate(polygons):
             num_polygon_points = len(polygon)
-
-            # determine whether polygon points are CW or CCW
-            area = 0
-            for i, v1 in enumerate(polygon): # loop through vertices
-                v2 = polygon[(i+1) % num_polygon_points]
-                area += (v2[0]-v1[0])*(v2[1]+v1[1]) # integrate area
-            clockwise = area > 0
-
-            # GDSII implements holes in polygons by making the polygon edge
-            # wrap into the hole and back out along the same line. However,
-            # this confuses the triangulation library, which fills the holes
-            # with extra triangles. Avoid this by moving each edge back a
-            # very small amount so that no two edges of the same polygon overlap.
-            # Define a small threshold to avoid division by very small numbers (to prevent NaNs or infinities)
-
-            epsilon = 1e-8  
-            delta = 0.00001  # Amount to inset each vertex by (smaller values have caused issues in the past)
-
-            # Step 1: Extract polygon points
-            points_i = polygon  # Get the list of points representing the polygon vertices
-
-            # Step 2: Shift points to get neighbors
-            points_j = np.roll(points_i, -1, axis=0)  # Shift points forward by 1 (next point)
-            points_k = np.roll(points_i, 1, axis=0)   # Shift points backward by 1 (previous point)
-
-            # Step 3: Calculate normals for edges (between consecutive vertices)
-            # Normal between current and next vertex (i -> j)
-            normal_ij = np.stack((points_j[:, 1] - points_i[:, 1],  # y-component difference
-                                points_i[:, 0] - points_j[:, 0]), axis=1)  # x-component difference (perpendicular)
-
-            # Normal between current and previous vertex (i -> k)
-            normal_ik = np.stack((points_i[:, 1] - points_k[:, 1],  # y-component difference
-                                points_k[:, 0] - points_i[:, 0]), axis=1)  # x-component difference (perpendicular)
-
-            # Step 4: Compute the lengths of these normal vectors
-            length_ij = np.linalg.norm(normal_ij, axis=1)
-            length_ik = np.linalg.norm(normal_ik, axis=1)
-
-            # Step 5: Handle small lengths to avoid division by near-zero values
-            length_ij[length_ij < epsilon] = 1  # Set very small lengths to 1 to avoid division issues
-            length_ik[length_ik < epsilon] = 1  # Set very small lengths to 1
-
-            # Step 6: Normalize the normals (unit vectors)
-            normal_ij /= np.stack((length_ij, length_ij), axis=1)  # Normalize by dividing by length
-            normal_ik /= np.stack((length_ik, length_ik), axis=1)  # Normalize by dividing by length
-
-            # Step 7: Adjust direction of normals if polygon is oriented clockwise
-            if clockwise:
-                normal_ij = -normal_ij  # Reverse direction for clockwise orientation
-                normal_ik = -normal_ik
-
-            # Step 8: Move each vertex inward by 'delta' along its two edge normals
-            # Each vertex is moved inward along both the normal to its adjacent edges
-            polygon = points_i - delta * normal_ij - delta * normal_ik
-
-            # In an extreme case of the above, the polygon edge doubles back on
-            # itself on the same line, resulting in a zero-width segment. I've
-            # seen this happen, e.g., with a capital "N"-shaped hole, where
-            # the hole split line cuts out the "N" shape but splits apart to
-            # form the triangle cutout in one side of the shape. In any case,
-            # simply moving the polygon edges isn't enough to deal with this;
-            # we'll additionally mark points just outside of each edge, between
-            # the original edge and the delta-shifted edge, as outside the polygon.
-            # These parts will be removed from the triangulation, and this solves
-            # just this case with no adverse affects elsewhere.
-            hole_delta = 0.00001 # small fraction of delta
-            holes = 0.5*(points_j+points_i) - hole_delta*delta*normal_ij
-            # HOWEVER: sometimes this causes a segmentation fault in the triangle
-            # library. I've observed this as a result of certain various polygons.
-            # Frustratingly, the fault can be bypassed by *rotating the polygons*
-            # by like 30 degrees (exact angle seems to depend on delta values) or
-            # moving one specific edge outward a bit. I have absolutely no idea
-            # what is wrong. In the interest of stability over full functionality,
-            # this is disabled. TODO: figure out why this happens and fix it.
-            use_holes = False
-
-
-            # triangulate: compute triangles to fill polygon
-            point_array = np.arange(num_polygon_points)
-
-            edges = np.transpose(np.stack((point_array, np.roll(point_array, 1))))
-            polygon, edges = remove_duplicates(polygon, edges)
-            
-            if use_holes:
-                triangles = triangle.triangulate(dict(vertices=polygon,
-                                                    segments=edges,
-                                                    holes=holes), opts='p')
-            else:
-                triangles = triangle.triangulate(dict(vertices=polygon,
-                                                    segments=edges), opts='p')
-
-            if not 'triangles' in triangles.keys():
-                triangles['triangles'] = []
+            polygon, triangles, clockwise = triangulate_polygon(polygon)
 
             # each line segment will make two triangles (for a rectangle), and the polygon
             # triangulation will be copied on the top and bottom of the layer.
             num_triangles[layer_number] += num_polygon_points*2 + \
                                         len(triangles['triangles'])*2
             polygons[index] = (polygon, triangles, clockwise)
+            triangulate_calls += 1
 
         # glTF Mesh creation
 
-        zmin = layerstack[layer_number]['zmin']
-        zmax = layerstack[layer_number]['zmax']
-        layername = layerstack[layer_number]['name']
-        node_name = cell.name + "_" + layername
-
-        gltf_positions = []
-        gltf_indices = []        
-        indices_offset = 0
-        for i,(_, poly_data, clockwise) in enumerate(polygons):         
-            p_positions_top = np.insert(poly_data['vertices'], 2, zmax, axis=1)
-            p_positions_bottom = np.insert( poly_data['vertices'] , 2, zmin, axis=1)
-            
-            p_positions = np.concatenate( (p_positions_top, p_positions_bottom) )
-            p_indices_top = poly_data['triangles']
-            p_indices_bottom = np.flip ((p_indices_top+len(p_positions_top)), axis=1 )
-            
-            ind_list_top = np.arange(len(p_positions_top))
-            ind_list_bottom = np.arange(len(p_positions_top)) + len(p_positions_top)
-
-            if(clockwise):
-                ind_list_top = np.flip(ind_list_top, axis=0)
-                ind_list_bottom = np.flip(ind_list_bottom, axis=0)
-
-            p_indices_right = np.stack( (ind_list_bottom, np.roll(ind_list_bottom, -1, axis=0) , np.roll(ind_list_top, -1, axis=0)), axis=1 )
-            p_indices_left = np.stack( ( np.roll(ind_list_top, -1, axis=0), ind_list_top , ind_list_bottom ) , axis=1)
-                 
-            p_indices = np.concatenate( (p_indices_top, p_indices_bottom, p_indices_right, p_indices_left) )
-
-            if(len(gltf_positions)==0):
-                gltf_positions = p_positions
-            else:
-                gltf_positions = np.append(gltf_positions , p_positions, axis=0)
-            if(len(gltf_indices)==0):
-                gltf_indices = p_indices
-            else:    
-                gltf_indices = np.append(gltf_indices, p_indices + indices_offset, axis=0)            
-            indices_offset += len(p_positions)
-      
-        
-        indices_binary_blob = gltf_indices.astype(np.uint32).flatten().tobytes() #triangles.flatten().tobytes()
-        positions_binary_blob = gltf_positions.astype(np.float32).tobytes() #points.tobytes()
+        gltf_indices, gltf_positions = extrude_polygons(polygons, zmin, zmax)
+        if vertex_cache:
+            cache_misses_before = vertex_cache_misses(gltf_indices)
+            gltf_indices, gltf_positions = optimize_vertex_cache(gltf_indices, gltf_positions)
+        meshes[layer_number] = (gltf_indices, gltf_positions, shapes)
 
-        node_names.append(cell.name)
-        curIndices.append(indices_binary_blob)
-        curPositions.append(positions_binary_blob)
-        layer_numbers.append(layer_number)
-        cur_gltf_indices.append(gltf_indices)
-        cur_gltf_positions.append(gltf_positions)
+        arrays = [(gltf_indices, gltf_positions)] + [shape[0:2] for shape in shapes]
+        stats['layers'][layerstack[layer_number]['name']] = {
+            'polygons': num_polygons,
+            'vertices': sum(len(p) for _, p in arrays),
+            'triangles': sum(len(i) for i, _ in arrays),
+            'bytes': sum(i.size * 4 + p.size * 4 for i, p in arrays),
+            'triangulate_calls': triangulate_calls,
+            'instanced_shapes': sum(len(shape[2]) for shape in shapes),
+        }
+        if vertex_cache:
+            # the shape prototypes are too small to gain, only the layer mesh counts
+            stats['layers'][layerstack[layer_number]['name']].update(
+                cache_triangles=len(gltf_indices), cache_misses_before=cache_misses_before,
+                cache_misses=vertex_cache_misses(gltf_indices))
 
         # bufferView1 = pygltflib.BufferView()
         # bufferView1.buffer = 0
@@ -471,238 +1170,3062 @@ def process_cell(cell):
         # gltf.meshes.append(mesh)
         # meshes_lib[node_name] = len(gltf.meshes)-1
 
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    poly = len(cell.polygons)
+    stats['end'] = time.perf_counter()
+    stats['peak_rss'] = peak_rss()
+    return meshes, stats
 
-    if poly != 0 :
-        print(f"Function took {elapsed_time:.5f} seconds {poly} polygons ({(elapsed_time/poly*1000):.3f}) ")   
-    else:
-        Warning("No polygons found in cell: " + cell.name)
+profile_lock = threading.Lock() # newer Pythons allow one active cProfile per process
 
-    return (node_names, curIndices, curPositions, layer_numbers, cur_gltf_indices, cur_gltf_positions)
+def run_mesh_job(task):
+    """Runs process_cell for one (index, job, profile_dir) task of Converter.mesh_cells.
 
-def get_unique_materials(cell):
-    materials = set()  # Use a set for faster lookup
-    
-    # Process paths
-    for path in cell.paths:
-        layer_and_type = (path.layers[0], path.datatypes[0])
-        if layer_and_type not in materials:
-            materials.add(layer_and_type)
-    
-    # Process polygons
-    for polygon in cell.polygons:
-        layer_and_type = (polygon.layers[0], polygon.datatypes[0])
-        if layer_and_type not in materials:
-            materials.add(layer_and_type)
-        
-    # Convert the set back to a list if needed (optional)
-    return list(materials)
+    With a profile_dir the call runs under cProfile and the statistics are
+    written to a file in that directory, to be merged by Profiler.write().
+    Profiled jobs of a thread pool run one at a time.
+    """
+    index, job, profile_dir = task
+    if profile_dir is None:
+        return index, process_cell(*job)
+    with profile_lock:
+        profile = cProfile.Profile()
+        result = profile.runcall(process_cell, *job)
+    profile.dump_stats(os.path.join(profile_dir, f"{os.getpid()}-{index}.prof"))
+    return index, result
 
+def worker_pool(backend, workers):
+    """Returns a pool of workers for an execution backend with the multiprocessing.Pool interface.
 
-binaryBlob = bytes()
-meshes_lib = {}
-end_time = None
-look_for_places = [
-    "/usr/local/share/gdst",
-    ".",
-    "./layerstack"
-]
+    Args:
+        backend: "process" for a multiprocessing.Pool, "thread" for a thread
+            pool in this process. Threads need no fork, pickling or copies of
+            the design, but only run in parallel where the GIL is released
+            (NumPy, or everything on a free-threaded Python build).
+        workers: Number of worker processes or threads.
+    """
+    if backend == "thread":
+        return multiprocessing.pool.ThreadPool(workers)
+    if backend == "process":
+        return multiprocessing.Pool(workers)
+    raise ValueError(f"Backend {backend} has no worker pool")
 
-if __name__ == "__main__":
-    t_start = time.time()
-    if len(sys.argv) < 2:
-        print("Error: need at least one file as command line argument: GDSII file.")
-        sys.exit(0)
+catalog_converter = None # Converter of the running catalog() or split_layers(), inherited by forked workers
 
-    gdsii_file_path = sys.argv[1]
+def run_catalog_job(task, converter=None):
+    """Builds the GLB of one (cell name, options, validate) task of Converter.catalog.
 
-    print('Reading GDSII file {}...'.format(gdsii_file_path))
-    gdsii = gdspy.GdsLibrary()
-    gdsii.read_gds(gdsii_file_path, units='import')
+    Args:
+        task: The task.
+        converter: The converter holding the meshes (default: catalog_converter,
+            for forked workers). Thread workers get it passed in.
 
-    gltf = pygltflib.GLTF2()
-    scene = pygltflib.Scene()
-    gltf.scenes.append(scene)
-    buffer = pygltflib.Buffer()
-    gltf.buffers.append(buffer)
+    Returns:
+        (GLB bytes, nodes, meshes, validation errors) of the cell.
+    """
+    name, options, validate = task
+    converter = converter or catalog_converter
+    cells = converter.cells(name, options['max_depth'])
+    layerstack = converter.select_layers(options['layers'], options['zmin'], options['zmax'])
+    builder = converter.assemble(cells, layerstack, name, options['max_depth'], options['flatten'],
+                                 options['instancing'], options['max_mesh_vertices'], verbose=False,
+                                 node_bounds=options['node_bounds'])
+    errors = builder.validate()['errors'] if validate else []
+    return builder.to_bytes(), len(builder.nodes), len(builder.gltf.meshes), errors
 
-    if len(sys.argv) == 2:
-        print("Trying to guess layerstack file name from GDSII data types")
-        layerstacks = []
-        for place in look_for_places:
-            # Get all files from the directory
-            try:
-                files = os.listdir(place)
-                for file in files:
-                    if file.endswith(".txt"):
-                        layerstack_file_path = os.path.join(place, file)
-                        try:
-                            layerstack = read_layerstack_from_file(layerstack_file_path)
-                            if layerstack not in layerstacks:
-                                layerstacks.append(layerstack)
-
-                        except ValueError:
-                            print(f"Error reading layerstack file: {layerstack_file_path}")
+def run_layer_job(task, converter=None):
+    """Builds and saves the GLB of one (path, layer keys, options, validate) task of Converter.split_layers.
 
-            except FileNotFoundError:
-                continue
-        
-        best_match = 0
-
-        for ls in layerstacks:
-            # if multithread:
-            #     num_workers = multiprocessing.cpu_count()
-            #     print(f"Using {num_workers} workers to get unique materials")
-            #     with multiprocessing.Pool(num_workers) as pool:
-            #         results = pool.map(get_unique_materials, gdsii.cells.values())
-            # else:
-            results = []
-            for cell in gdsii.cells.values():
-                results.append(get_unique_materials(cell))
-            
-            # Get unique materials from all cells
-            unique_materials = []
-            for result in results:
-                for material in result:
-                    if material not in unique_materials:
-                        unique_materials.append(material)
-
-            nMatches = 0
-            for material in unique_materials:
-                if (material[0], material[1]) in ls:
-                    nMatches += 1
-            if nMatches > best_match:
-                best_match = nMatches
-                layerstack = ls
-            print(f"Layerstack: {ls.keys()} matches {nMatches} out of {len(unique_materials)}")
-            
-    else:
-        layerstack_file_path = sys.argv[2]
-        layerstack = read_layerstack_from_file(layerstack_file_path)
+    Args:
+        task: The task.
+        converter: The converter holding the meshes, see run_catalog_job().
 
-    for layer in layerstack:
-        
-        mainMaterial = pygltflib.Material()
-        mainMaterial.doubleSided = True
-        mainMaterial.name = layerstack[layer]['name']
-        mainMaterial.pbrMetallicRoughness =  {
-                        "baseColorFactor": layerstack[layer]['color'],
-                        "metallicFactor": 0.5,
-                        "roughnessFactor": 0.5
-                    }
-        gltf.materials.append(mainMaterial)
-
-    print('Extracting polygons...')
-    if multithread:
-        num_workers = multiprocessing.cpu_count()
-        print(f"Using {num_workers} workers")
-        with multiprocessing.Pool(num_workers) as pool:
-            results = pool.map(process_cell, gdsii.cells.values())
-    else:
-        results = []
-        for cell in gdsii.cells.values():
-            results.append(process_cell(cell))
-    end_time = time.time()
-
-    for result in results: # loop through cells to read paths and polygons
-        names, indices, positions, layer_numbers, gltf_indicies, gltf_positions = result
-
-        for i in range(len(indices)):            
-            bufferView1 = pygltflib.BufferView()
-            bufferView1.buffer = 0
-            bufferView1.byteOffset = len(binaryBlob)
-            bufferView1.byteLength = len(indices[i])
-            bufferView1.target = pygltflib.ELEMENT_ARRAY_BUFFER
-            gltf.bufferViews.append(bufferView1)
-
-            accessor1 = pygltflib.Accessor()
-            accessor1.bufferView = len(gltf.bufferViews)-1
-            accessor1.byteOffset = 0
-            accessor1.componentType = pygltflib.UNSIGNED_INT
-            accessor1.type = pygltflib.SCALAR
-            accessor1.count = gltf_indicies[i].size
-            accessor1.max = [int(gltf_indicies[i].max())]
-            accessor1.min = [int(gltf_indicies[i].min())]
-            gltf.accessors.append(accessor1)
-
-            binaryBlob = binaryBlob + indices[i]
-
-            bufferView2 = pygltflib.BufferView()
-            bufferView2.buffer = 0
-            bufferView2.byteOffset = len(binaryBlob)
-            bufferView2.byteLength = len(positions[i])
-            bufferView2.target = pygltflib.ARRAY_BUFFER
-            gltf.bufferViews.append(bufferView2)
-
-            positions_count = len(gltf_positions[i])
-            accessor2 = pygltflib.Accessor()
-            accessor2.bufferView =  len(gltf.bufferViews)-1
-            accessor2.byteOffset = 0
-            accessor2.componentType = pygltflib.FLOAT
-            accessor2.count = positions_count
-            accessor2.type = pygltflib.VEC3
-            accessor2.max = gltf_positions[i].max(axis=0).tolist()
-            accessor2.min = gltf_positions[i].min(axis=0).tolist()
-
-            gltf.accessors.append(accessor2)
-
-            binaryBlob = binaryBlob + positions[i]
-
-            mesh = pygltflib.Mesh()
-            mesh_primitive = pygltflib.Primitive()
-            mesh_primitive.indices = len(gltf.accessors)-2
-            mesh_primitive.attributes.POSITION = len(gltf.accessors)-1
-            mesh_primitive.material = list(layerstack).index(layer_numbers[i])
-            mesh.primitives.append(mesh_primitive)
-
-            gltf.meshes.append(mesh)
-            meshes_lib[names[i] + "_" + layerstack[layer_numbers[i]]['name']] = len(gltf.meshes)-1
-
-    gltf.set_binary_blob(binaryBlob)
-    print(f"Binary blob size: {len(binaryBlob)} bytes")
-
-    buffer.byteLength = len(binaryBlob)
-    gltf.convert_buffers(BufferFormat.DATAURI)
-
-    done_time = time.time()
-    done_elapsed_time = done_time - end_time
-    print(f"store took: {done_elapsed_time:.5f} seconds")
-
-    main_cell = gdsii.top_level()[0]
-
-    root_node = pygltflib.Node()
-    root_node.name = main_cell.name #"ROOT"
-    gltf.nodes.append(root_node)
-
-    print ("\nBuilding Scenegraph:")
-    print(root_node.name)
-
-    add_cell_node(main_cell, root_node, "\t")
-        
+    Returns:
+        (file size, nodes, meshes, validation errors) of the layer group.
+    """
+    path, keys, options, validate = task
+    converter = converter or catalog_converter
+    cells = converter.cells(options['top'], options['max_depth'])
+    layerstack = {lnum: converter.layerstack[lnum] for lnum in keys}
+    builder = converter.assemble(cells, layerstack, options['top'], options['max_depth'], options['flatten'],
+                                 options['instancing'], options['max_mesh_vertices'], verbose=False,
+                                 node_bounds=options['node_bounds'])
+    errors = builder.validate()['errors'] if validate else []
+    with open(path, "wb") as f:
+        write_gltf_file(f, builder.gltf, builder.blob, builder.blob_size, True, builder.nodes)
+        return f.tell(), len(builder.nodes), len(builder.gltf.meshes), errors
+
+class MeshCache:
+    """Persistent cache of cell layer meshes shared between conversions.
 
-    for layer in layerstack.values():
-        lib_name = main_cell.name + "_" + layer['name']
-        if(meshes_lib.get(lib_name)!=None):
-            layer_node = pygltflib.Node()
-            layer_node.name = lib_name
-            layer_node.mesh = meshes_lib[lib_name]
-            gltf.nodes.append(layer_node)
-            root_node.children.append(len(gltf.nodes)-1)
+    Every entry is an uncompressed .npz file in the cache directory holding the
+    extruded layer mesh of one (cell, layer) and its repeated shape groups. An
+    SQLite index records file size and last use, and the least recently used
+    entries are evicted when the directory grows beyond max_bytes.
 
-    scene.nodes.append(0)
-    gltf.scene = 0
+    Several runs can share one cache directory: files are written to a temporary
+    name and renamed into place, and SQLite serializes the index updates.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.used = set()
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, "index.sqlite"), timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # a killed process loses no commits in WAL mode, only a crash of the machine may
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meshes "
+                        "(key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self.evict()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key):
+        """Returns the cached arrays of key as a dictionary, or None on a miss."""
+        row = self.db.execute("SELECT size FROM meshes WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        try:
+            with np.load(self.path(key)) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            # evicted or half written by a concurrent run
+            self.db.execute("DELETE FROM meshes WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+        self.db.execute("UPDATE meshes SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.hits += 1
+        self.used.add(key)
+        return arrays
 
-    ##validate(gltf)  # will throw an error depending on the problem
-    #summary(gltf) 
+    def put(self, key, arrays):
+        """Stores a dictionary of numpy arrays under key and evicts old entries if needed."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, self.path(key))
+        self.db.execute("INSERT OR REPLACE INTO meshes (key, size, last_used) VALUES (?, ?, ?)",
+                        (key, size, time.time()))
+        self.used.add(key)
+        self.evict()
 
+    def reserve(self, key):
+        """Always True: runs sharing a cache directory mesh a missing entry independently."""
+        return True
+
+    def release(self, keys):
+        pass
+
+    def prune(self):
+        """Removes every entry that was not read or written through this instance."""
+        for (key,) in self.db.execute("SELECT key FROM meshes").fetchall():
+            if key not in self.used:
+                self.db.execute("DELETE FROM meshes WHERE key = ?", (key,))
+                try:
+                    os.remove(self.path(key))
+                except FileNotFoundError:
+                    pass
+
+    def evict(self):
+        if self.max_bytes == float('inf'):
+            return
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM meshes").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.db.execute("SELECT key, size FROM meshes ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM meshes WHERE key = ?", (key,))
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+class MemoryMeshCache:
+    """In-memory counterpart of MeshCache shared by the converters of a batch.
+
+    Entries are layer_mesh_arrays() dictionaries, the least recently used are
+    dropped above max_bytes. reserve() marks an entry as being meshed for one
+    design, so designs loaded meanwhile wait for it instead of meshing it too.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.in_flight = set()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the arrays of key as a dictionary, or None on a miss."""
+        arrays = self.entries.get(key)
+        if arrays is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return arrays
+
+    def reserve(self, key):
+        """Returns True if the caller is to mesh key, False if it is being meshed already."""
+        if key in self.in_flight:
+            return False
+        self.in_flight.add(key)
+        return True
+
+    def release(self, keys):
+        """Drops the reservations of keys that will not be put (their design failed)."""
+        self.in_flight.difference_update(keys)
+
+    def put(self, key, arrays):
+        """Stores a dictionary of numpy arrays under key and drops old entries if needed."""
+        self.in_flight.discard(key)
+        if key in self.entries:
+            self.bytes -= sum(array.nbytes for array in self.entries.pop(key).values())
+        self.entries[key] = arrays
+        self.bytes += sum(array.nbytes for array in arrays.values())
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= sum(array.nbytes for array in old.values())
+
+def mesh_cache_key(fingerprint, layer, shape_instancing, shape_precision, vertex_cache=False):
+    """Returns the cache key of a cell layer mesh.
+
+    The key covers the geometry fingerprint, the z range of the layerstack entry
+    and every converter option that changes the mesh.
+    """
+    options = (MESH_CACHE_VERSION, fingerprint, layer['zmin'], layer['zmax'], shape_instancing, shape_precision)
+    if vertex_cache:
+        # added only when set, so the keys of existing caches stay valid
+        options += ("vertex_cache", VERTEX_CACHE_SIZE)
+    return hashlib.sha1(repr(options).encode()).hexdigest()
+
+def layer_mesh_arrays(indices, positions, shapes):
+    """Packs a layer mesh and its shape groups into a dictionary of arrays for MeshCache."""
+    arrays = {"indices": indices, "positions": positions}
+    for k, (shape_indices, shape_positions, offsets) in enumerate(shapes):
+        arrays[f"shape{k}_indices"] = shape_indices
+        arrays[f"shape{k}_positions"] = shape_positions
+        arrays[f"shape{k}_offsets"] = offsets
+    return arrays
+
+def cached_layer_mesh(arrays):
+    """Unpacks MeshCache.get() arrays into (indices, positions, shapes) of one cell layer."""
+    shapes = []
+    k = 0
+    while f"shape{k}_indices" in arrays:
+        shapes.append((arrays[f"shape{k}_indices"], arrays[f"shape{k}_positions"], arrays[f"shape{k}_offsets"]))
+        k += 1
+    return arrays["indices"], arrays["positions"], shapes
+
+def layer_mesh_list(indices, positions, shapes):
+    """Returns the arrays of a layer mesh as a flat list, see layer_mesh_from_list."""
+    return [indices, positions] + [array for shape in shapes for array in shape]
+
+def layer_mesh_from_list(arrays):
+    """Inverse of layer_mesh_list."""
+    return arrays[0], arrays[1], [tuple(arrays[k:k + 3]) for k in range(2, len(arrays), 3)]
+
+class MeshSpill:
+    """Memory mapped temporary storage for the finished meshes of a conversion.
+
+    spill() writes a batch of arrays to one new file in a private temporary
+    directory and returns read-only views of the file mapped into memory, so
+    the pages of spilled meshes are backed by the file instead of swap and the
+    kernel can drop them under memory pressure. On POSIX systems the files are
+    unlinked right after mapping, they disappear when the last view is gone.
+
+    Args:
+        directory: Parent of the temporary directory (default: the system temp directory).
+    """
+
+    def __init__(self, directory=None):
+        self.directory = tempfile.mkdtemp(prefix="gds2gltf-spill-", dir=directory)
+        self.files = 0
+        self.bytes = 0
+
+    def spill(self, arrays):
+        """Returns memory mapped copies of a list of numpy arrays, written to one file."""
+        offsets = []
+        path = os.path.join(self.directory, f"{self.files}.bin")
+        with open(path, "wb") as f:
+            for array in arrays:
+                offsets.append(f.tell())
+                f.write(np.ascontiguousarray(array).tobytes())
+                f.write(b"\0" * (-f.tell() % 16))
+            size = f.tell()
+        if size == 0:
+            os.remove(path)
+            return list(arrays)
+        mapped = np.memmap(path, dtype=np.uint8, mode="r")
+        if os.name == "posix":
+            os.remove(path)
+        self.files += 1
+        self.bytes += size
+        return [mapped[offset:offset + array.nbytes].view(array.dtype).reshape(array.shape)
+                for offset, array in zip(offsets, arrays)]
+
+    def blob_file(self):
+        """Returns a new temporary file for the buffer data of a GltfBuilder."""
+        return tempfile.TemporaryFile(dir=self.directory)
+
+    def close(self):
+        """Removes the temporary directory; views of spilled meshes stay valid on POSIX systems."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def read_manifest(manifest_path):
+    """Returns the manifest of the previous incremental run, or None."""
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_manifest(manifest_path, gdsii_file_path, layerstack, fingerprints):
+    """Records the per-cell layer fingerprints of this run for the next incremental run."""
+    manifest = {
+        'input': os.path.abspath(gdsii_file_path),
+        'layerstack': {layer['name']: [layer['zmin'], layer['zmax']] for layer in layerstack.values()},
+        'cells': {name: {layerstack[lnum]['name']: fingerprint for lnum, fingerprint in layers.items()}
+                  for name, layers in fingerprints.items()},
+    }
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+def changed_cells(manifest, layerstack, fingerprints):
+    """Returns the names of the cells whose geometry differs from the manifest."""
+    if manifest is None:
+        return set(fingerprints)
+    previous = manifest.get('cells', {})
+    return {name for name, layers in fingerprints.items()
+            if previous.get(name) != {layerstack[lnum]['name']: fingerprint for lnum, fingerprint in layers.items()}}
+
+def checkpoint_state(gds_path, layerstack, options):
+    """Returns what a checkpoint must match to be resumed: input file, layerstack and mesh options.
+
+    The meshes are keyed by their content, so the layer and depth selection
+    and the scene options (flatten, instancing, ...) may change on --resume.
+    """
+    gds_stat = os.stat(gds_path)
+    layers = json.dumps(sorted((str(lnum), layer) for lnum, layer in layerstack.items()))
+    return {
+        'version': MESH_CACHE_VERSION,
+        'input': os.path.abspath(gds_path),
+        'size': gds_stat.st_size,
+        'mtime_ns': gds_stat.st_mtime_ns,
+        'layerstack': hashlib.sha1(layers.encode()).hexdigest(),
+        'options': options,
+    }
+
+def open_checkpoint(checkpoint_dir, state, resume):
+    """Opens the checkpoint of a conversion: a MeshCache of the finished meshes and its run.json.
+
+    Every mesh is stored as soon as it is meshed (MeshCache writes are atomic),
+    so a killed run leaves a usable checkpoint behind. With resume a checkpoint
+    whose run.json matches state is reused, any other one is discarded.
+
+    Returns:
+        The MeshCache of the checkpoint.
+    """
+    run_path = os.path.join(checkpoint_dir, "run.json")
+    previous = read_manifest(run_path)
+    if resume and previous == state:
+        print(f"Resuming from checkpoint {checkpoint_dir}")
+    else:
+        if resume and previous is not None:
+            changed = [key for key in state if previous.get(key) != state[key]]
+            print(f"Checkpoint {checkpoint_dir} does not match this run ({', '.join(changed)} changed), starting over")
+        elif resume:
+            print(f"No checkpoint in {checkpoint_dir}, starting from scratch")
+        elif previous is not None:
+            print(f"Discarding the checkpoint of an interrupted run in {checkpoint_dir} (--resume continues it)")
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        os.makedirs(checkpoint_dir)
+        tmp_path = run_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, run_path)
+    return MeshCache(checkpoint_dir, float('inf'))
+
+def watch(args):
+    """Converts args.gds incrementally every time its modification time changes."""
+    print(f"Watching {args.gds} (Ctrl-C to stop)")
+    last_mtime = None
+    try:
+        while True:
+            try:
+                mtime = os.stat(args.gds).st_mtime
+            except FileNotFoundError:
+                mtime = None # being replaced by the layout tool
+            if mtime is not None and mtime != last_mtime:
+                # let the writer finish before reading
+                time.sleep(args.watch_interval)
+                if os.stat(args.gds).st_mtime == mtime:
+                    last_mtime = mtime
+                    try:
+                        convert(args)
+                    except Exception as e:
+                        print(f"Conversion failed: {e}")
+                    print(f"\nWatching {args.gds} (Ctrl-C to stop)")
+                continue
+            time.sleep(args.watch_interval)
+    except KeyboardInterrupt:
+        pass
+
+def get_unique_materials(cell):
+    materials = set()  # Use a set for faster lookup
+    
+    # Process paths
+    for path in cell.paths:
+        layer_and_type = (path.layers[0], path.datatypes[0])
+        if layer_and_type not in materials:
+            materials.add(layer_and_type)
+    
+    # Process polygons
+    for polygon in cell.polygons:
+        layer_and_type = (polygon.layers[0], polygon.datatypes[0])
+        if layer_and_type not in materials:
+            materials.add(layer_and_type)
+        
+    # Convert the set back to a list if needed (optional)
+    return list(materials)
+
+
+
+def current_rss():
+    """Returns the resident set size of this process in bytes.
+
+    Read from /proc on Linux; elsewhere the peak so far (peak_rss) is returned.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+def peak_rss():
+    """Returns the peak resident set size of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # bytes on macOS, KiB elsewhere
+
+class Profiler:
+    """Named spans and counters of the conversion pipeline.
+
+    Stage spans (read, layerstack, fingerprints, mesh, scenegraph, write, ...)
+    are always summed up for the one line summary at the end of a conversion.
+    With trace=True every span is also kept, together with one span per meshed
+    cell on the lane of the worker that meshed it, and write() saves them as a
+    Chrome trace (open in chrome://tracing or https://ui.perfetto.dev).
+
+    With memory=True a background thread samples the resident set size every
+    few milliseconds and every stage records the peak RSS seen while it ran.
+    trace_memory=True also runs tracemalloc and records the peak of the memory
+    allocated by Python and NumPy in each stage (slow, for hunting leaks).
+
+    Args:
+        trace: Keep the individual spans for write().
+        profile_workers: Run process_cell under cProfile in the workers; the
+            merged statistics are written next to the trace by write().
+        memory: Record the peak RSS of each stage.
+        trace_memory: Record the peak tracemalloc allocations of each stage.
+    """
+
+    def __init__(self, trace=False, profile_workers=False, memory=False, trace_memory=False):
+        self.trace = trace
+        self.events = []
+        self.stages = {}    # stage name -> {"seconds", "calls", "peak_rss_mb", "python_peak_mb"}
+        self.counters = {}  # counter name -> total
+        self.cells = {}     # cell name -> layer name -> counters from process_cell
+        self.worker_profile_dir = tempfile.mkdtemp(prefix="gds2gltf-profile-") if profile_workers else None
+        self.memory = memory or trace_memory
+        self.trace_memory = trace_memory
+        self.windows = []   # [peak RSS] of the open spans, updated by the sampler thread
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.stopped = threading.Event()
+        if self.memory:
+            threading.Thread(target=self.sample_rss, daemon=True).start()
+
+    def sample_rss(self, interval=0.005):
+        while not self.stopped.wait(interval):
+            rss = current_rss()
+            for window in list(self.windows):
+                window[0] = max(window[0], rss)
+
+    def close(self):
+        """Stops the RSS sampler thread; spans still record the RSS at their start and end."""
+        self.stopped.set()
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """Times the enclosed block as stage name; args are stored in the trace event."""
+        window = [current_rss()] if self.memory else None
+        if window is not None:
+            self.windows.append(window)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+            stage["seconds"] += end - start
+            stage["calls"] += 1
+            if window is not None:
+                self.windows = [other for other in self.windows if other is not window]
+                window[0] = max(window[0], current_rss())
+                stage["peak_rss_mb"] = max(stage.get("peak_rss_mb", 0), window[0] / 2**20)
+                args = dict(args, peak_rss_mb=round(window[0] / 2**20, 1))
+            if self.trace_memory:
+                python_peak = tracemalloc.get_traced_memory()[1] / 2**20
+                stage["python_peak_mb"] = max(stage.get("python_peak_mb", 0), python_peak)
+                args = dict(args, python_peak_mb=round(python_peak, 1))
+            self.add_event(name, "stage", start, end, os.getpid(), args)
+
+    def add_event(self, name, category, start, end, tid, args=None):
+        if self.trace:
+            self.events.append({"name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": tid,
+                                "ts": start * 1e6, "dur": (end - start) * 1e6, "args": args or {}})
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_cell_stats(self, cell_name, stats):
+        """Records the stats returned by process_cell and adds them to the counters."""
+        self.cells.setdefault(cell_name, {}).update(stats['layers'])
+        totals = {}
+        for counters in stats['layers'].values():
+            for key, value in counters.items():
+                totals[key] = totals.get(key, 0) + value
+        for key, value in totals.items():
+            self.count(key, value)
+        self.count("cells_meshed")
+        if 'peak_rss' in stats:
+            self.counters["worker_peak_rss_mb"] = max(self.counters.get("worker_peak_rss_mb", 0),
+                                                      round(stats['peak_rss'] / 2**20, 1))
+        # one lane per worker process, or per worker thread of this process
+        lane = stats['pid'] if stats['pid'] != os.getpid() else stats.get('thread', stats['pid'])
+        self.add_event(cell_name, "cell", stats['start'], stats['end'], lane, totals)
+
+    def summary_line(self):
+        """Returns e.g. "read 0.20s | mesh 1.70s | ... | 1107704 triangles meshed".
+
+        With memory tracking each stage also shows its peak RSS, e.g. "mesh 1.70s 312MB".
+        """
+        parts = []
+        for name, stage in self.stages.items():
+            part = f"{name} {stage['seconds']:.2f}s"
+            if "peak_rss_mb" in stage:
+                part += f" {stage['peak_rss_mb']:.0f}MB"
+            parts.append(part)
+        if self.counters.get("triangles"):
+            parts.append(f"{self.counters['triangles']} triangles meshed")
+        if self.counters.get("cache_triangles"):
+            parts.append(f"ACMR {self.counters['cache_misses_before'] / self.counters['cache_triangles']:.3f} -> "
+                         f"{self.counters['cache_misses'] / self.counters['cache_triangles']:.3f}")
+        if self.memory:
+            parts.append(f"peak RSS {peak_rss() / 2**20:.0f}MB")
+        return " | ".join(parts)
+
+    def write(self, path):
+        """Saves the trace, stage totals, counters and per-cell counters as JSON to path."""
+        pids = sorted({event["tid"] for event in self.events if event["cat"] == "cell"})
+        names = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": os.getpid(), "args": {"name": "main"}}]
+        names += [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": pid, "args": {"name": f"worker {pid}"}}
+                  for pid in pids if pid != os.getpid()]
+        report = {
+            "traceEvents": names + self.events,
+            "displayTimeUnit": "ms",
+            "stages": self.stages,
+            "counters": self.counters,
+            "cells": self.cells,
+        }
+        if self.memory:
+            report["peak_rss_mb"] = peak_rss() / 2**20
+        with open(path, "w") as f:
+            json.dump(report, f)
+        print(f"Profile written to {path}")
+
+        if self.worker_profile_dir is not None:
+            files = [os.path.join(self.worker_profile_dir, name) for name in os.listdir(self.worker_profile_dir)]
+            if files:
+                stats_path = os.path.splitext(path)[0] + ".workers.prof"
+                pstats.Stats(*files).dump_stats(stats_path)
+                print(f"Worker cProfile statistics written to {stats_path} (python -m pstats {stats_path})")
+            for file in files:
+                os.remove(file)
+            os.rmdir(self.worker_profile_dir)
+            self.worker_profile_dir = None
+
+def save_gltf(gltf, output_path):
+    """Saves a glTF document with its binary blob set as .glb or as .gltf with a data URI buffer."""
+    blob = gltf.binary_blob() or b""
+    write_gltf(gltf, io.BytesIO(blob), len(blob), output_path)
+
+def write_gltf(gltf, blob, blob_size, output_path, nodes=None):
+    """Saves a glTF document whose single buffer is held in a file object.
+
+    The buffer is copied to the output in chunks, as the binary chunk of a .glb
+    file or base64 encoded into the data URI of a .gltf file, so it is never
+    in memory as a whole, let alone as bytes and base64 copies. The files are
+    the same pygltflib's save_binary() and save() write.
+
+    Args:
+        gltf: pygltflib.GLTF2 object whose bufferViews all refer to buffer 0.
+        blob: Binary file object (io.BytesIO or a temporary file) with the buffer data.
+        blob_size: Length of the buffer data, a multiple of 4.
+        output_path: Path of the .glb or .gltf file.
+        nodes: NodeTable written as the nodes of the document instead of gltf.nodes.
+    """
+    with open(output_path, "wb") as f:
+        write_gltf_file(f, gltf, blob, blob_size, output_path.lower().endswith(".glb"), nodes)
+    print(f"Wrote {output_path} ({os.path.getsize(output_path)} bytes)")
+
+def write_gltf_file(f, gltf, blob, blob_size, binary, nodes=None):
+    """Writes a glTF document as .glb (binary) or .gltf to the binary file object f, see write_gltf()."""
+    buffers, gltf_nodes = gltf.buffers, gltf.nodes
+    blob.seek(0)
+    try:
+        # the nodes are written by the table, at the place of a placeholder in the pygltflib JSON
+        node_placeholder = '"@@gds2gltf-nodes@@"'
+        if nodes is not None:
+            gltf.nodes = [node_placeholder[1:-1]]
+        if binary:
+            gltf.buffers = [pygltflib.Buffer(byteLength=blob_size)]
+            json_parts = gltf.gltf_to_json(separators=(',', ':'), indent=None).split(node_placeholder)
+            if nodes is not None:
+                nodes_json = io.BytesIO()
+                nodes.write_json(nodes_json)
+                json_parts.insert(1, nodes_json.getvalue().decode("ascii"))
+            json_blob = "".join(json_parts).encode("utf-8")
+            json_blob += b' ' * (-len(json_blob) % 4)
+            f.write(b"glTF" + struct.pack("<III", 2, 12 + 8 + len(json_blob) + 8 + blob_size, len(json_blob)) + b"JSON")
+            f.write(json_blob)
+            f.write(struct.pack("<I", blob_size) + b"BIN\0")
+            shutil.copyfileobj(blob, f, 2**22)
+        else:
+            placeholder = "@@gds2gltf-buffer@@"
+            gltf.buffers = [pygltflib.Buffer(byteLength=blob_size, uri=placeholder)]
+            def write_data_uri():
+                f.write(b'"data:application/octet-stream;base64,')
+                # whole 3 byte groups per chunk, so the chunks encode without padding
+                while chunk := blob.read(3 * 2**20):
+                    f.write(base64.b64encode(chunk))
+                f.write(b'"')
+            writers = {f'"{placeholder}"': write_data_uri}
+            if nodes is not None:
+                writers[node_placeholder] = lambda: nodes.write_json(f, indent="  ")
+            json_text = gltf.gltf_to_json()
+            position = 0
+            for at, marker in sorted((json_text.index(marker), marker) for marker in writers):
+                f.write(json_text[position:at].encode("utf-8"))
+                writers[marker]()
+                position = at + len(marker)
+            f.write(json_text[position:].encode("utf-8"))
+    finally:
+        gltf.buffers, gltf.nodes = buffers, gltf_nodes
+
+COMPONENT_DTYPES = {
+    pygltflib.BYTE: np.int8, pygltflib.UNSIGNED_BYTE: np.uint8, pygltflib.SHORT: np.int16,
+    pygltflib.UNSIGNED_SHORT: np.uint16, pygltflib.UNSIGNED_INT: np.uint32, pygltflib.FLOAT: np.float32,
+}
+ACCESSOR_SIZES = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT2": 4, "MAT3": 9, "MAT4": 16}
+
+class GltfValidationError(ValueError):
+    """Raised by Converter.write() when the written file fails validate_gltf()."""
+
+    def __init__(self, report):
+        super().__init__(f"glTF validation failed with {len(report['errors'])} errors")
+        self.report = report
+
+def validate_gltf(gltf, blob, chunk_triangles=2**20, nodes=None):
+    """Checks a glTF document and its buffer data, every accessor in bulk with NumPy.
+
+    pygltflib's validator checks the JSON structure object by object and is
+    too slow for our outputs; this checks what breaks in the viewer:
+        - bufferViews and accessors lie within the buffer, types and alignment are valid
+        - float accessors hold no NaN or infinite values, min/max match the data
+        - primitives reference existing accessors and materials, triangle indices
+          come in threes, stay below the vertex count and repeat no vertex
+          (zero area triangles are only warnings)
+        - EXT_mesh_gpu_instancing attributes exist and have equal counts
+        - node references exist, no node has two parents, the node graph has
+          no cycles, node transforms are finite and scenes reference root nodes
+
+    Args:
+        gltf: pygltflib.GLTF2 object with a single buffer.
+        blob: The buffer data (bytes, memoryview or uint8 numpy array).
+        chunk_triangles: Triangles checked per step of the zero area check.
+        nodes: NodeTable holding the nodes instead of gltf.nodes.
+
+    Returns:
+        Dictionary with 'errors' and 'warnings' (lists of messages) and the
+        numbers of checked 'accessors', 'triangles' and 'nodes'.
+    """
+    errors, warnings = [], []
+    data = blob if isinstance(blob, np.ndarray) else np.frombuffer(blob, dtype=np.uint8)
+
+    for i, view in enumerate(gltf.bufferViews):
+        if view.buffer != 0 or (view.byteOffset or 0) + view.byteLength > len(data):
+            errors.append(f"bufferView {i} lies outside the buffer")
+
+    arrays = {} # accessor index -> (count, components) array, for the readable accessors
+    for i, accessor in enumerate(gltf.accessors):
+        dtype = COMPONENT_DTYPES.get(accessor.componentType)
+        size = ACCESSOR_SIZES.get(accessor.type)
+        if dtype is None or size is None:
+            errors.append(f"accessor {i} has component type {accessor.componentType} and type {accessor.type}")
+            continue
+        if accessor.bufferView is None or not 0 <= accessor.bufferView < len(gltf.bufferViews):
+            errors.append(f"accessor {i} references bufferView {accessor.bufferView}")
+            continue
+        view = gltf.bufferViews[accessor.bufferView]
+        itemsize = np.dtype(dtype).itemsize
+        if view.byteStride not in (None, 0, size * itemsize):
+            warnings.append(f"accessor {i} is interleaved, its data is not checked")
+            continue
+        start = (view.byteOffset or 0) + (accessor.byteOffset or 0)
+        nbytes = accessor.count * size * itemsize
+        if (accessor.byteOffset or 0) + nbytes > view.byteLength or start + nbytes > len(data):
+            errors.append(f"accessor {i} ({accessor.count} x {accessor.type}) overruns bufferView {accessor.bufferView}")
+            continue
+        if start % itemsize:
+            errors.append(f"accessor {i} is not aligned to its component size")
+            continue
+        array = np.frombuffer(data, dtype, accessor.count * size, start).reshape(accessor.count, size)
+        arrays[i] = array
+        if dtype == np.float32:
+            bad = np.count_nonzero(~np.isfinite(array))
+            if bad:
+                errors.append(f"accessor {i} has {bad} NaN or infinite values")
+                continue
+        if accessor.count:
+            for name, bound, actual in (("min", accessor.min, array.min(axis=0)), ("max", accessor.max, array.max(axis=0))):
+                if bound is not None and (len(bound) != size or not np.allclose(actual, bound, rtol=1e-6, atol=1e-9)):
+                    errors.append(f"accessor {i} {name} {bound} does not match its data {actual.tolist()}")
+
+    triangles = 0
+    for m, mesh in enumerate(gltf.meshes):
+        for primitive in mesh.primitives:
+            position = primitive.attributes.POSITION
+            if position not in arrays:
+                errors.append(f"mesh {m} ({mesh.name}) has no valid POSITION accessor")
+                continue
+            if gltf.accessors[position].min is None or gltf.accessors[position].max is None:
+                errors.append(f"mesh {m} ({mesh.name}) POSITION accessor has no min/max")
+            if primitive.material is not None and not 0 <= primitive.material < len(gltf.materials):
+                errors.append(f"mesh {m} ({mesh.name}) references material {primitive.material}")
+            if primitive.indices is None:
+                continue
+            index_accessor = gltf.accessors[primitive.indices] if primitive.indices in arrays else None
+            if index_accessor is None or index_accessor.type != "SCALAR" or \
+                    index_accessor.componentType not in (pygltflib.UNSIGNED_BYTE, pygltflib.UNSIGNED_SHORT, pygltflib.UNSIGNED_INT):
+                errors.append(f"mesh {m} ({mesh.name}) has no valid index accessor")
+                continue
+            positions = arrays[position]
+            indices = arrays[primitive.indices].ravel()
+            if indices.size and indices.max() >= len(positions):
+                errors.append(f"mesh {m} ({mesh.name}) indexes vertex {indices.max()} of {len(positions)}")
+                continue
+            if (primitive.mode if primitive.mode is not None else pygltflib.TRIANGLES) != pygltflib.TRIANGLES:
+                continue
+            if indices.size % 3:
+                errors.append(f"mesh {m} ({mesh.name}) has {indices.size} triangle indices, not a multiple of 3")
+                continue
+            corners = indices.reshape(-1, 3)
+            triangles += len(corners)
+            repeated = np.count_nonzero((corners[:, 0] == corners[:, 1]) | (corners[:, 1] == corners[:, 2]) |
+                                        (corners[:, 0] == corners[:, 2]))
+            if repeated:
+                errors.append(f"mesh {m} ({mesh.name}) has {repeated} degenerate triangles (repeated vertex)")
+            flat = 0
+            for k in range(0, len(corners), chunk_triangles):
+                p = positions[corners[k:k + chunk_triangles]]
+                flat += np.count_nonzero(~np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0]).any(axis=1))
+            if flat > repeated:
+                warnings.append(f"mesh {m} ({mesh.name}) has {flat - repeated} zero area triangles")
+
+    def check_instancing(i, name, extensions):
+        instancing = (extensions or {}).get("EXT_mesh_gpu_instancing")
+        if instancing is not None:
+            counts = set()
+            for attribute, accessor in instancing.get("attributes", {}).items():
+                if accessor not in arrays:
+                    errors.append(f"node {i} ({name}) instance {attribute} accessor {accessor} is invalid")
+                else:
+                    counts.add(len(arrays[accessor]))
+            if len(counts) > 1:
+                errors.append(f"node {i} ({name}) instance attributes have different counts {sorted(counts)}")
+
+    if nodes is not None:
+        # the table holds one parent per node and no dangling children by construction
+        rows, parents, _, _ = nodes.graph()
+        num_nodes = len(rows)
+        meshes = nodes.mesh[rows]
+        for i in np.flatnonzero(meshes >= len(gltf.meshes)):
+            errors.append(f"node {i} ({nodes.node_name(rows[i])}) references mesh {meshes[i]}")
+        for i in np.flatnonzero(~np.isfinite(nodes.trs[rows]).all(axis=1)):
+            errors.append(f"node {i} ({nodes.node_name(rows[i])}) has a NaN or infinite transform")
+        for row, extensions in nodes.extensions.items():
+            check_instancing(nodes.index[row], nodes.node_name(row), extensions)
+    else:
+        num_nodes = len(gltf.nodes)
+        parents = np.full(num_nodes, -1)
+        for i, node in enumerate(gltf.nodes):
+            for child in node.children or []:
+                if not 0 <= child < num_nodes:
+                    errors.append(f"node {i} ({node.name}) has missing child {child}")
+                elif parents[child] >= 0:
+                    errors.append(f"node {child} has two parents, {parents[child]} and {i}")
+                else:
+                    parents[child] = i
+            if node.mesh is not None and not 0 <= node.mesh < len(gltf.meshes):
+                errors.append(f"node {i} ({node.name}) references mesh {node.mesh}")
+            transform = (node.matrix or []) + (node.translation or []) + (node.rotation or []) + (node.scale or [])
+            if transform and not np.isfinite(transform).all():
+                errors.append(f"node {i} ({node.name}) has a NaN or infinite transform")
+            check_instancing(i, node.name, node.extensions)
+
+    roots = []
+    for scene in gltf.scenes:
+        for root in scene.nodes or []:
+            if not 0 <= root < num_nodes:
+                errors.append(f"scene references missing node {root}")
+            elif parents[root] >= 0:
+                errors.append(f"scene root {root} is a child of node {parents[root]}")
+            else:
+                roots.append(root)
+
+    # find the topmost ancestor of every node by pointer jumping; with at most
+    # one parent per node, the nodes whose ancestor still has a parent after
+    # log2(n) doublings are exactly those on or below a cycle
+    top = np.where(parents >= 0, parents, np.arange(num_nodes))
+    for _ in range(max(1, num_nodes).bit_length() + 1):
+        top = top[top]
+    cyclic = np.count_nonzero(parents[top] >= 0) if num_nodes else 0
+    if cyclic:
+        errors.append(f"{cyclic} nodes are part of or below a cycle in the node graph")
+    in_scene = np.zeros(num_nodes, dtype=bool)
+    in_scene[roots] = True
+    outside = np.count_nonzero(~in_scene[top] & (parents[top] < 0))
+    if outside:
+        warnings.append(f"{outside} nodes are not part of any scene")
+
+    return {'errors': errors, 'warnings': warnings, 'accessors': len(arrays),
+            'triangles': triangles, 'nodes': num_nodes}
+
+def print_validation(report, seconds, max_messages=20):
+    """Prints the summary of a validate_gltf() report and its first messages."""
+    status = f"{len(report['errors'])} errors" if report['errors'] else "OK"
+    if report['warnings']:
+        status += f", {len(report['warnings'])} warnings"
+    print(f"Validation: {report['accessors']} accessors, {report['triangles']} triangles, "
+          f"{report['nodes']} nodes checked in {seconds:.2f}s: {status}")
+    messages = [f"  error: {message}" for message in report['errors']] + \
+               [f"  warning: {message}" for message in report['warnings']]
+    for message in messages[:max_messages]:
+        print(message)
+    if len(messages) > max_messages:
+        print(f"  ... and {len(messages) - max_messages} more")
+
+def cell_placements(cell):
+    """Yields (reference, translation, rotation, scale) for every placement of a cell below cell.
+
+    A CellArray gives one placement per array element.
+    """
+    for ref in cell.references:
+        if not isinstance(ref.ref_cell, gdspy.Cell):
+            continue
+        translations, rotations, scales = matrices_to_trs(reference_matrices(ref))
+        for translation, rotation, scale in zip(translations, rotations, scales):
+            yield ref, translation, rotation, scale
+
+# JSON bytes of the scene objects in a .glb, measured on the bundled designs;
+# pretty printed .gltf JSON is about ESTIMATE_GLTF_JSON_FACTOR times larger
+ESTIMATE_JSON_BYTES = {"document": 1000, "mesh": 560, "accessor": 280, "instance_node": 155,
+                       "layer_node": 50, "instanced_node": 190}
+ESTIMATE_GLTF_JSON_FACTOR = 1.8
+
+def print_estimate(report, max_cells=10):
+    """Prints a Converter.estimate() report: totals, layers and the cells with most triangles."""
+    totals = report['totals']
+    print(f"Estimate for {report['top']} ({report['mode']}, {report['format']}):")
+    print(f"  {totals['cells']} cells, {totals['placements']} placements, {totals['polygons']} polygons, "
+          f"{totals['points']} polygon points")
+    print(f"  {totals['meshed_triangles']} triangles meshed in {totals['meshes']} meshes, "
+          f"{totals['drawn_triangles']} triangles drawn")
+    print(f"  {totals['nodes']} nodes, {totals['buffer_bytes'] / 2**20:.1f} MB buffer data, "
+          f"{totals['json_bytes'] / 2**20:.1f} MB JSON, {totals['output_bytes'] / 2**20:.1f} MB output")
+    workers = report['workers']
+    print(f"  {workers['jobs']} cells to mesh, the largest holds {workers['largest_job_share']:.0%} "
+          f"of the polygon points: up to {workers['suggested']} workers are useful")
+    print(f"  {'layer':<16}{'polygons':>12}{'vertices':>12}{'triangles':>12}{'drawn':>14}")
+    for name, layer in report['layers'].items():
+        print(f"  {name:<16}{layer['polygons']:>12}{layer['vertices']:>12}{layer['triangles']:>12}"
+              f"{layer['drawn_triangles']:>14}")
+    cells = sorted(report['cells'].items(), key=lambda item: -item[1]['triangles'])
+    print(f"  {'cell':<32}{'placements':>12}{'polygons':>12}{'triangles':>12}")
+    for name, cell in cells[:max_cells]:
+        print(f"  {name:<32}{cell['placements']:>12}{cell['polygons']:>12}{cell['triangles']:>12}")
+    if len(cells) > max_cells:
+        print(f"  ... and {len(cells) - max_cells} more cells")
+    for note in report['notes']:
+        print(f"  note: {note}")
+
+class NodeTable:
+    """The glTF nodes of a scene as NumPy columns, one row per node.
+
+    Large designs have millions of instance nodes. As pygltflib.Node objects
+    they took more memory and time to build and serialize than the meshes
+    took to make. Rows are added with open() and numbered with close(), so
+    a node can be numbered before its children (the root) or after them
+    (instance nodes, as the hierarchy traversal did with node objects).
+    Children lists are not stored; the children of a node are the rows
+    pointing at it as parent, in node order.
+
+    Transforms are stored as translation, rotation (xyzw quaternion) and
+    scale columns, with flags telling which of them the node has. Names and
+    instance types are indices into a table of distinct strings. Extensions
+    and other extras are dictionaries kept for the few nodes that have them.
+    Bounding boxes (see set_bounds()) are an array with a row per bounded node.
+    """
+
+    HAS_TRANSLATION = 1
+    HAS_ROTATION = 2
+    HAS_SCALE = 4
+    IDENTITY_TRS = np.array([0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0, 1.0, 1.0, 1.0])
+    COLUMNS = ("parent", "index", "mesh", "name", "type", "instances", "flags", "trs")
+
+    def __init__(self, capacity=1024):
+        self.size = 0   # rows opened
+        self.count = 0  # rows numbered by close()
+        self.parent = np.empty(capacity, dtype=np.int64)     # parent row, -1 for none
+        self.index = np.empty(capacity, dtype=np.int64)      # node index, -1 until closed
+        self.mesh = np.empty(capacity, dtype=np.int64)       # -1 for none
+        self.name = np.empty(capacity, dtype=np.int32)       # string index, -1 for none
+        self.type = np.empty(capacity, dtype=np.int32)       # string index of extras "type"
+        self.instances = np.empty(capacity, dtype=np.int64)  # extras "instances", -1 for none
+        self.flags = np.empty(capacity, dtype=np.uint8)
+        self.trs = np.empty((capacity, 10), dtype=np.float64)
+        self.strings = []
+        self.string_ids = {}
+        self.extensions = {}  # row -> extensions dictionary
+        self.extras = {}      # row -> further extras
+        self.bounds_row = None  # row -> row of bounds, -1 for none (None: no node has bounds)
+        self.bounds = None      # (m, 2, 2, 3) local and world [lo, hi] per bounded node
+
+    def __len__(self):
+        return self.size
+
+    def string(self, text):
+        if text is None:
+            return -1
+        string_id = self.string_ids.get(text)
+        if string_id is None:
+            string_id = self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+    def grow(self):
+        for column in self.COLUMNS:
+            old = getattr(self, column)
+            new = np.empty((2 * len(old),) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, column, new)
+
+    def open(self, parent=-1, name=None, mesh=None, translation=None, rotation=None, scale=None,
+             type=None, instances=None, extensions=None, extras=None):
+        """Adds a node row; it gets its node index with close().
+
+        Args:
+            parent: Row of the parent node (-1 for a root node).
+            name, mesh, translation, rotation, scale, extensions: The glTF node fields.
+            type, instances: The "type" and "instances" extras.
+            extras: Further extras.
+
+        Returns:
+            The row of the node.
+        """
+        if self.size == len(self.parent):
+            self.grow()
+        row = self.size
+        self.size += 1
+        self.parent[row] = parent
+        self.index[row] = -1
+        self.mesh[row] = -1 if mesh is None else mesh
+        self.name[row] = self.string(name)
+        self.type[row] = self.string(type)
+        self.instances[row] = -1 if instances is None else instances
+        trs = self.trs[row]
+        trs[:] = self.IDENTITY_TRS
+        flags = 0
+        if translation is not None:
+            trs[0:3] = translation
+            flags |= self.HAS_TRANSLATION
+        if rotation is not None:
+            trs[3:7] = rotation
+            flags |= self.HAS_ROTATION
+        if scale is not None:
+            trs[7:10] = scale
+            flags |= self.HAS_SCALE
+        self.flags[row] = flags
+        if extensions:
+            self.extensions[row] = extensions
+        if extras:
+            self.extras[row] = extras
+        return row
+
+    def close(self, row):
+        """Gives the node of row the next node index and returns it."""
+        self.index[row] = self.count
+        self.count += 1
+        return self.count - 1
+
+    def add(self, parent=-1, **fields):
+        """Adds and numbers a node at once (see open()) and returns its row."""
+        row = self.open(parent, **fields)
+        self.close(row)
+        return row
+
+    def set_bounds(self, rows, bounds):
+        """Sets the "bounds" and "world_bounds" extras of the nodes of rows.
+
+        Args:
+            rows: Node rows (m,).
+            bounds: (m, 2, 2, 3) local and world [lo, hi] boxes of the nodes,
+                rounded outwards to 1e-6.
+        """
+        self.bounds_row = np.full(self.size, -1, dtype=np.int64)
+        self.bounds_row[rows] = np.arange(len(rows))
+        self.bounds = np.empty(bounds.shape)
+        self.bounds[..., 0, :] = np.floor(bounds[..., 0, :] * 1e6) / 1e6
+        self.bounds[..., 1, :] = np.ceil(bounds[..., 1, :] * 1e6) / 1e6
+
+    def has_bounds(self, row):
+        return self.bounds_row is not None and row < len(self.bounds_row) and self.bounds_row[row] >= 0
+
+    def node_name(self, row):
+        return self.strings[self.name[row]] if self.name[row] >= 0 else None
+
+    def node_extras(self, row):
+        """Returns the extras dictionary of the node of row (empty if it has none)."""
+        extras = {}
+        if self.type[row] >= 0:
+            extras["type"] = self.strings[self.type[row]]
+        if self.instances[row] >= 0:
+            extras["instances"] = int(self.instances[row])
+        if self.has_bounds(row):
+            extras["bounds"], extras["world_bounds"] = self.bounds[self.bounds_row[row]].tolist()
+        extras.update(self.extras.get(row, {}))
+        return extras
+
+    def graph(self):
+        """Returns the node graph in node index order.
+
+        Returns:
+            (rows, parents, starts, children): the row of every node, the
+            parent node index of every node (-1 for none), and the children
+            of node i as children[starts[i]:starts[i + 1]].
+        """
+        if self.count != self.size:
+            raise ValueError(f"{self.size - self.count} nodes are not closed")
+        n = self.size
+        rows = np.empty(n, dtype=np.int64)
+        rows[self.index[:n]] = np.arange(n)
+        parent_rows = self.parent[rows]
+        parents = np.where(parent_rows >= 0, self.index[np.maximum(parent_rows, 0)], -1)
+        has_parent = np.flatnonzero(parents >= 0)
+        children = has_parent[np.argsort(parents[has_parent], kind="stable")]
+        starts = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(parents[has_parent], minlength=n), out=starts[1:])
+        return rows, parents, starts, children
+
+    def to_gltf(self):
+        """Returns the nodes as a list of pygltflib.Node objects, in node order."""
+        rows, _, starts, children = self.graph()
+        nodes = []
+        for i, row in enumerate(rows.tolist()):
+            node = pygltflib.Node(name=self.node_name(row))
+            node.extensions = self.extensions.get(row, {})
+            node.extras = self.node_extras(row)
+            if self.mesh[row] >= 0:
+                node.mesh = int(self.mesh[row])
+            trs = self.trs[row].tolist()
+            if self.flags[row] & self.HAS_TRANSLATION:
+                node.translation = trs[0:3]
+            if self.flags[row] & self.HAS_ROTATION:
+                node.rotation = trs[3:7]
+            if self.flags[row] & self.HAS_SCALE:
+                node.scale = trs[7:10]
+            node.children = children[starts[i]:starts[i + 1]].tolist()
+            nodes.append(node)
+        return nodes
+
+    def write_json(self, f, indent=None, batch=4096):
+        """Writes the nodes as the elements of the glTF "nodes" array to the binary file f.
+
+        The text is what pygltflib's gltf_to_json() makes of the same nodes
+        (with the nodes array on the second level of the document), but it is
+        formatted straight from the columns, batch nodes at a time.
+        """
+        if indent is None:
+            separators = (",", ":")
+            open_node, field_sep, close_node, node_sep = "{", ",", "}", ","
+            open_list, item_sep, close_list = "[", ",", "]"
+        else:
+            separators = (",", ": ")
+            open_node, field_sep, close_node = "{\n" + indent * 3, ",\n" + indent * 3, "\n" + indent * 2 + "}"
+            node_sep = ",\n" + indent * 2
+            open_list, item_sep, close_list = "[\n" + indent * 4, ",\n" + indent * 4, "\n" + indent * 3 + "]"
+        key = {name: json.dumps(name) + separators[1] for name in
+               ("extensions", "extras", "mesh", "rotation", "translation", "scale", "children", "name")}
+
+        def dump(value):
+            text = json.dumps(value, indent=indent, separators=separators, allow_nan=False)
+            return text if indent is None else text.replace("\n", "\n" + indent * 3)
+
+        def numbers(values):
+            return open_list + item_sep.join(map(repr, values)) + close_list
+
+        names = [json.dumps(text) for text in self.strings]
+        extras_texts = {}  # (type, instances) -> text, for nodes without further extras
+        rows, _, starts, children = self.graph()
+        if not np.isfinite(self.trs[:self.size]).all():
+            raise ValueError("Out of range float values are not JSON compliant")
+        for first in range(0, len(rows), batch):
+            batch_rows = rows[first:first + batch]
+            pieces = []
+            for i, row, mesh, name, type_id, instances, flags, trs in zip(
+                    range(first, first + len(batch_rows)), batch_rows.tolist(), self.mesh[batch_rows].tolist(),
+                    self.name[batch_rows].tolist(), self.type[batch_rows].tolist(),
+                    self.instances[batch_rows].tolist(), self.flags[batch_rows].tolist(),
+                    self.trs[batch_rows].tolist()):
+                fields = []
+                if row in self.extensions:
+                    fields.append(key["extensions"] + dump(self.extensions[row]))
+                if row in self.extras or self.has_bounds(row):
+                    extras = self.node_extras(row)
+                    if extras:
+                        fields.append(key["extras"] + dump(extras))
+                elif type_id >= 0 or instances >= 0:
+                    text = extras_texts.get((type_id, instances))
+                    if text is None:
+                        text = extras_texts[(type_id, instances)] = key["extras"] + dump(self.node_extras(row))
+                    fields.append(text)
+                if mesh >= 0:
+                    fields.append(key["mesh"] + str(mesh))
+                if flags & self.HAS_ROTATION:
+                    fields.append(key["rotation"] + numbers(trs[3:7]))
+                if flags & self.HAS_TRANSLATION:
+                    fields.append(key["translation"] + numbers(trs[0:3]))
+                if flags & self.HAS_SCALE:
+                    fields.append(key["scale"] + numbers(trs[7:10]))
+                if starts[i] < starts[i + 1]:
+                    fields.append(key["children"] + numbers(children[starts[i]:starts[i + 1]].tolist()))
+                if name >= 0:
+                    fields.append(key["name"] + names[name])
+                pieces.append(open_node + field_sep.join(fields) + close_node if fields else "{}")
+            f.write(((node_sep if first else "") + node_sep.join(pieces)).encode("ascii"))
+
+class GltfBuilder:
+    """Builds the glTF document of one export.
+
+    The builder owns the glTF object, its binary blob and the lookup tables of
+    the meshes added so far, so any number of exports can be built from one
+    loaded design, one after the other or side by side.
+
+    Args:
+        layerstack: The (filtered) layerstack dictionary of the export. Every
+            layer gets a material, in layerstack order.
+        cells: Dictionary mapping cell names to gdspy cells.
+        max_depth: Subtrees below this hierarchy depth are drawn as one
+            bounding box per layer (None draws everything).
+        blob: Binary file object collecting the buffer data (default: an
+            io.BytesIO; pass a temporary file to keep it out of memory).
+    """
+
+    def __init__(self, layerstack, cells, max_depth=None, blob=None):
+        self.layerstack = layerstack
+        self.cells = cells
+        self.max_depth = max_depth
+        self.materials = {lnum: i for i, lnum in enumerate(layerstack)}
+        self.blob = blob if blob is not None else io.BytesIO()
+        self.blob_size = 0
+        self.meshes_lib = {}   # "<cell>_<layer>" -> glTF mesh index
+        self.shapes_lib = {}   # cell name -> [(shape lib name, layer key, offsets)]
+        self.bounds_lib = {}   # cell name -> per-layer subtree bounds
+        self.cell_meshes = {}  # (cell name, layer key) -> (indices, positions), for --flatten
+        self.mesh_bounds = []  # glTF mesh index -> (min, max) of its positions
+        self.instance_bounds = {}  # node row -> (lo, hi) of all instances of an instanced node
+        self.nodes = NodeTable()
+
+        self.gltf = pygltflib.GLTF2()
+        self.gltf.scenes.append(pygltflib.Scene())
+        self.gltf.buffers.append(pygltflib.Buffer())
+        for layer in layerstack.values():
+            material = pygltflib.Material()
+            material.doubleSided = True
+            material.name = layer['name']
+            material.pbrMetallicRoughness = {
+                "baseColorFactor": layer['color'],
+                "metallicFactor": 0.5,
+                "roughnessFactor": 0.5
+            }
+            self.gltf.materials.append(material)
+
+    def add_accessor(self, data, accessor_type, component_type, target=None):
+        """Stores an array in the binary blob and adds a bufferView and accessor for it.
+
+        Args:
+            data: numpy array, already in the component type of the accessor.
+            accessor_type: pygltflib accessor type (SCALAR, VEC3, VEC4, ...).
+            component_type: pygltflib component type (UNSIGNED_INT, FLOAT, ...).
+            target: Optional bufferView target (ARRAY_BUFFER, ELEMENT_ARRAY_BUFFER).
+
+        Returns:
+            The index of the new accessor.
+        """
+        binary_blob = data.tobytes()
+
+        bufferView = pygltflib.BufferView()
+        bufferView.buffer = 0
+        bufferView.byteOffset = self.blob_size
+        bufferView.byteLength = len(binary_blob)
+        bufferView.target = target
+        self.gltf.bufferViews.append(bufferView)
+
+        accessor = pygltflib.Accessor()
+        accessor.bufferView = len(self.gltf.bufferViews)-1
+        accessor.byteOffset = 0
+        accessor.componentType = component_type
+        accessor.type = accessor_type
+        if accessor_type == pygltflib.SCALAR:
+            accessor.count = data.size
+            accessor.max = [data.max().item()]
+            accessor.min = [data.min().item()]
+        else:
+            accessor.count = len(data)
+            accessor.max = data.max(axis=0).tolist()
+            accessor.min = data.min(axis=0).tolist()
+        self.gltf.accessors.append(accessor)
+
+        # keep every bufferView 4 byte aligned, as glTF requires for the float and int components
+        padding = -len(binary_blob) % 4
+        self.blob.write(binary_blob + b"\0" * padding)
+        self.blob_size += len(binary_blob) + padding
+        return len(self.gltf.accessors)-1
+
+    def add_mesh(self, gltf_indices, gltf_positions, lnum):
+        """Stores an indexed triangle mesh in the binary blob and the glTF object.
+
+        Args:
+            gltf_indices: Triangle vertex indices, shape (n, 3).
+            gltf_positions: Vertex positions, shape (m, 3).
+            lnum: Layerstack key of the layer, selects the material.
+
+        Returns:
+            The index of the new glTF mesh.
+        """
+        mesh = pygltflib.Mesh()
+        mesh_primitive = pygltflib.Primitive()
+        mesh_primitive.indices = self.add_accessor(gltf_indices.astype(np.uint32).flatten(), pygltflib.SCALAR,
+                                                   pygltflib.UNSIGNED_INT, pygltflib.ELEMENT_ARRAY_BUFFER)
+        mesh_primitive.attributes.POSITION = self.add_accessor(gltf_positions.astype(np.float32), pygltflib.VEC3,
+                                                               pygltflib.FLOAT, pygltflib.ARRAY_BUFFER)
+        mesh_primitive.material = self.materials[lnum]
+        mesh.primitives.append(mesh_primitive)
+        position = self.gltf.accessors[mesh_primitive.attributes.POSITION]
+        self.mesh_bounds.append((position.min, position.max))
+
+        self.gltf.meshes.append(mesh)
+        return len(self.gltf.meshes)-1
+
+    def add_layer_mesh(self, cell_name, lnum, owner, indices, positions, shapes, bake=False):
+        """Registers the mesh of one cell layer for the scenegraph.
+
+        Args:
+            cell_name: Name of the cell drawing the mesh.
+            lnum: Layerstack key of the layer.
+            owner: Name of the cell the mesh was made for. Differs from cell_name
+                when the cell shares the mesh of an identical cell (--dedup), in
+                which case the glTF mesh of the owner is reused.
+            indices, positions: The extruded layer mesh, may be empty.
+            shapes: List of (indices, positions, offsets) repeated shape groups.
+            bake: Keep the arrays in cell_meshes for add_flattened_meshes instead
+                of adding glTF meshes.
+        """
+        layername = self.layerstack[lnum]['name']
+        for k, (shape_indices, shape_positions, offsets) in enumerate(shapes):
+            lib_name = owner + "_" + layername + f"_shape{k}"
+            self.shapes_lib.setdefault(cell_name, []).append((lib_name, lnum, offsets))
+            if bake:
+                self.cell_meshes[(lib_name, lnum)] = (shape_indices, shape_positions)
+            elif lib_name not in self.meshes_lib:
+                self.meshes_lib[lib_name] = self.add_mesh(shape_indices, shape_positions, lnum)
+
+        if not len(indices):
+            return
+        if bake:
+            self.cell_meshes[(cell_name, lnum)] = (indices, positions)
+            return
+        owner_lib_name = owner + "_" + layername
+        if owner_lib_name not in self.meshes_lib:
+            self.meshes_lib[owner_lib_name] = self.add_mesh(indices, positions, lnum)
+        self.meshes_lib[cell_name + "_" + layername] = self.meshes_lib[owner_lib_name]
+
+    def add_cell_layers(self, cell_name, parent):
+        """Adds the layer mesh nodes and instanced shape nodes of a cell below the node row parent."""
+        for layer in self.layerstack.values():
+            lib_name = cell_name + "_" + layer['name']
+            if(self.meshes_lib.get(lib_name)!=None):
+                self.nodes.add(parent, name=lib_name, mesh=self.meshes_lib[lib_name])
+        self.add_shape_nodes(cell_name, parent)
+
+    def proxy_mesh(self, cell, lnum, lo, hi):
+        """Returns the index of the shared bounding box mesh of a cell subtree on one layer."""
+        layer = self.layerstack[lnum]
+        lib_name = cell.name + "_" + layer['name'] + "_bbox"
+        if self.meshes_lib.get(lib_name) is None:
+            positions, indices = box_mesh(lo, hi, layer['zmin'], layer['zmax'])
+            self.meshes_lib[lib_name] = self.add_mesh(indices, positions, lnum)
+        return self.meshes_lib[lib_name]
+
+    def add_proxy_nodes(self, cell, parent):
+        """Adds one bounding box mesh node per layer covering the whole subtree of cell.
+
+        Used instead of recursing into subtrees below the --max-depth cap. The
+        box meshes are shared between all instances of the same cell.
+        """
+        for lnum, (lo, hi) in cell_layer_bounds(cell, self.layerstack, self.bounds_lib).items():
+            self.nodes.add(parent, name=cell.name + "_" + self.layerstack[lnum]['name'] + "_bbox",
+                           mesh=self.proxy_mesh(cell, lnum, lo, hi))
+
+    def add_flattened_meshes(self, placements, root, max_vertices):
+        """Bakes all placed cell meshes into one merged world space mesh per layer.
+
+        A layer mesh is only split when it would exceed max_vertices vertices.
+
+        Args:
+            placements: Dictionary mapping cell names to world transforms (n, 3, 3).
+            root: Row of the node that receives one child node per layer mesh.
+            max_vertices: Maximum number of vertices in a single mesh.
+        """
+        for lnum, layer in self.layerstack.items():
+            chunks = []
+            pending = []
+            pending_vertices = 0
+
+            def flush():
+                nonlocal pending, pending_vertices
+                if not pending:
+                    return
+                indices = np.concatenate([p[0] for p in pending])
+                positions = np.concatenate([p[1] for p in pending])
+                chunks.append(self.add_mesh(indices, positions, lnum))
+                pending = []
+                pending_vertices = 0
+
+            for (cell_name, cell_lnum), (gltf_indices, gltf_positions) in self.cell_meshes.items():
+                if cell_lnum != lnum or cell_name not in placements:
+                    continue
+                matrices = placements[cell_name]
+                per_chunk = max(1, max_vertices // len(gltf_positions))
+                for start in range(0, len(matrices), per_chunk):
+                    group = matrices[start:start + per_chunk]
+                    if pending_vertices + len(group) * len(gltf_positions) > max_vertices:
+                        flush()
+                    indices, positions = bake_mesh(gltf_indices, gltf_positions, group)
+                    pending.append((indices + pending_vertices, positions))
+                    pending_vertices += len(positions)
+            flush()
+
+            for i, mesh_index in enumerate(chunks):
+                self.nodes.add(root, name=layer['name'] if len(chunks) == 1 else f"{layer['name']}_{i}", mesh=mesh_index)
+
+    def add_cell_node(self, cell, parent):
+        """Adds a node per placement below cell, and their subtrees, below the node row parent.
+
+        The hierarchy is walked with an explicit stack, so deep designs do not
+        hit Python's recursion limit. Instance nodes are numbered after their
+        subtree, their layer nodes first.
+        """
+        # (placements left to visit, parent row, depth, row of the instance node to close)
+        stack = [(cell_placements(cell), parent, 1, None)]
+        while stack:
+            placements, parent, depth, row = stack[-1]
+            placement = next(placements, None)
+            if placement is None:
+                stack.pop()
+                if row is not None:
+                    self.nodes.close(row)
+                continue
+            ref, translation, rotation, scale = placement
+            row = self.nodes.open(parent, name=ref.properties.get(61, "???"), type=ref.ref_cell.name,
+                                  translation=translation, rotation=rotation if rotation[3] != 1 else None,
+                                  scale=scale if np.any(scale != 1) else None)
+            if self.max_depth is not None and depth > self.max_depth:
+                # below the depth cap: one bounding box per layer for the whole subtree
+                self.add_proxy_nodes(ref.ref_cell, row)
+                self.nodes.close(row)
+                continue
+            self.add_cell_layers(ref.ref_cell.name, row)
+            stack.append((cell_placements(ref.ref_cell), row, depth + 1, row))
+
+    def use_instancing_extension(self):
+        if "EXT_mesh_gpu_instancing" not in self.gltf.extensionsUsed:
+            self.gltf.extensionsUsed.append("EXT_mesh_gpu_instancing")
+            self.gltf.extensionsRequired.append("EXT_mesh_gpu_instancing")
+
+    def add_shape_nodes(self, cell_name, parent):
+        """Adds the instanced prototype nodes of the repeated shapes of a cell.
+
+        The TRANSLATION accessor of a shape group is written once and shared by all
+        instances of the cell.
+        """
+        for lib_name, lnum, offsets in self.shapes_lib.get(cell_name, []):
+            if self.meshes_lib.get(lib_name + "_offsets") is None:
+                translations = np.zeros((len(offsets), 3), dtype=np.float32)
+                translations[:, 0:2] = offsets
+                self.meshes_lib[lib_name + "_offsets"] = self.add_accessor(translations, pygltflib.VEC3, pygltflib.FLOAT)
+            row = self.nodes.add(parent, name=lib_name, mesh=self.meshes_lib[lib_name], instances=len(offsets),
+                                 extensions={"EXT_mesh_gpu_instancing": {"attributes": {"TRANSLATION": self.meshes_lib[lib_name + "_offsets"]}}})
+            self.use_instancing_extension()
+            lo, hi = np.array(self.mesh_bounds[self.meshes_lib[lib_name]])
+            self.instance_bounds[row] = (lo + [*offsets.min(axis=0), 0], hi + [*offsets.max(axis=0), 0])
+
+    def add_instanced_node(self, name, mesh_index, matrices, parent, cell_name):
+        """Adds a node drawing a mesh once per world transform with EXT_mesh_gpu_instancing.
+
+        ROTATION and SCALE are only written when some instance needs them. A mesh
+        with a single identity placement (the top cell) gets a plain node.
+        """
+        extensions = None
+        if len(matrices) > 1 or not np.allclose(matrices[0], np.identity(3)):
+            translations, rotations, scales = matrices_to_trs(matrices)
+            attributes = {"TRANSLATION": self.add_accessor(translations.astype(np.float32), pygltflib.VEC3, pygltflib.FLOAT)}
+            if np.any(rotations[:, 3] != 1):
+                attributes["ROTATION"] = self.add_accessor(rotations.astype(np.float32), pygltflib.VEC4, pygltflib.FLOAT)
+            if np.any(scales != 1):
+                attributes["SCALE"] = self.add_accessor(scales.astype(np.float32), pygltflib.VEC3, pygltflib.FLOAT)
+            extensions = {"EXT_mesh_gpu_instancing": {"attributes": attributes}}
+            self.use_instancing_extension()
+
+        row = self.nodes.add(parent, name=name, mesh=mesh_index, type=cell_name, instances=len(matrices), extensions=extensions)
+        if extensions is not None:
+            self.instance_bounds[row] = placed_box(*np.array(self.mesh_bounds[mesh_index]), matrices)
+
+    def add_instanced_nodes(self, placements, proxies, root):
+        """Adds one instanced node per layer mesh using the flattened placements.
+
+        Every reference and every element of a GDSII array becomes one instance
+        attribute entry instead of a node, so rows of standard cells collapse to
+        one draw call per cell type and layer. Cells sharing a mesh (see --dedup)
+        are grouped into the same node.
+        """
+        groups = {}
+        def group(lib_name, mesh_index, matrices, name):
+            if mesh_index not in groups:
+                groups[mesh_index] = (lib_name, [], name)
+            groups[mesh_index][1].append(matrices)
+
+        for name, matrices in placements.items():
+            for layer in self.layerstack.values():
+                lib_name = name + "_" + layer['name']
+                if(self.meshes_lib.get(lib_name)!=None):
+                    group(lib_name, self.meshes_lib[lib_name], matrices, name)
+            for lib_name, lnum, offsets in self.shapes_lib.get(name, []):
+                group(lib_name, self.meshes_lib[lib_name], compose_placements(matrices, offset_matrices(offsets)), name)
+
+        for name, matrices in proxies.items():
+            cell = self.cells[name]
+            for lnum, (lo, hi) in cell_layer_bounds(cell, self.layerstack, self.bounds_lib).items():
+                lib_name = name + "_" + self.layerstack[lnum]['name'] + "_bbox"
+                group(lib_name, self.proxy_mesh(cell, lnum, lo, hi), matrices, name)
+
+        for mesh_index, (lib_name, matrices, name) in groups.items():
+            self.add_instanced_node(lib_name, mesh_index, np.concatenate(matrices), root, name)
+
+    def add_node_bounds(self):
+        """Adds the local and world space bounding boxes to the nodes with children or instances.
+
+        The local box of a node covers its mesh, all its instances and the
+        boxes of its children, in the frame of the node before its own
+        transform; the world box is the local box in scene coordinates. The
+        boxes are built from the POSITION min/max of the meshes, bottom-up one
+        hierarchy level at a time, and the world transforms top-down, each
+        level in one NumPy step.
+        """
+        nodes = self.nodes
+        n = len(nodes)
+        parents = nodes.parent[:n]
+        meshes = nodes.mesh[:n]
+        boxes = np.empty((n, 2, 3))
+        boxes[:, 0], boxes[:, 1] = np.inf, -np.inf
+        if self.mesh_bounds:
+            mesh_boxes = np.array(self.mesh_bounds, dtype=np.float64)
+            drawn = meshes >= 0
+            boxes[drawn] = mesh_boxes[meshes[drawn]]
+        for row, box in self.instance_bounds.items():
+            boxes[row] = box
+
+        matrices = trs_matrices(nodes.trs[:n])
+        depths = tree_depths(parents)
+        order = np.argsort(depths, kind="stable")
+        levels = np.searchsorted(depths[order], np.arange(depths.max() + 2))
+        for depth in range(depths.max(), 0, -1):
+            rows = order[levels[depth]:levels[depth + 1]]
+            rows = rows[np.isfinite(boxes[rows, 0, 0])]
+            lo, hi = transform_boxes(boxes[rows, 0], boxes[rows, 1], matrices[rows])
+            np.minimum.at(boxes[:, 0], parents[rows], lo)
+            np.maximum.at(boxes[:, 1], parents[rows], hi)
+        for depth in range(1, depths.max() + 1):
+            rows = order[levels[depth]:levels[depth + 1]]
+            matrices[rows] = matrices[parents[rows]] @ matrices[rows]
+
+        has_children = np.bincount(parents[parents >= 0], minlength=n) > 0
+        instanced = np.zeros(n, dtype=bool)
+        instanced[list(self.instance_bounds)] = True
+        rows = np.flatnonzero((has_children | instanced) & np.isfinite(boxes[:, 0, 0]))
+        bounds = np.empty((len(rows), 2, 2, 3))
+        bounds[:, 0] = boxes[rows]
+        bounds[:, 1, 0], bounds[:, 1, 1] = transform_boxes(boxes[rows, 0], boxes[rows, 1], matrices[rows])
+        nodes.set_bounds(rows, bounds)
+
+    def build_scene(self, main_cell, flatten=False, instancing=False, max_mesh_vertices=2**32 - 1, verbose=True,
+                    node_bounds=False):
+        """Adds the root node of main_cell and the scenegraph below it.
+
+        Args:
+            main_cell: The gdspy cell at the root of the scene.
+            flatten: Bake everything into one world space mesh per layer.
+            instancing: One EXT_mesh_gpu_instancing node per cell layer mesh.
+            max_mesh_vertices: Vertex limit of a flattened layer mesh.
+            verbose: Print the node, mesh and buffer totals.
+            node_bounds: Add bounding box extras to the nodes, see add_node_bounds().
+        """
+        root = self.nodes.add(name=main_cell.name)
+
+        if flatten:
+            placements, proxies = flatten_placements(main_cell, self.max_depth)
+            for name, matrices in proxies.items():
+                for lnum, (lo, hi) in cell_layer_bounds(self.cells[name], self.layerstack, self.bounds_lib).items():
+                    self.cell_meshes[(name + "_bbox", lnum)] = box_mesh(lo, hi, self.layerstack[lnum]['zmin'], self.layerstack[lnum]['zmax'])[::-1]
+                placements[name + "_bbox"] = matrices
+            shape_placements = {}
+            for name, shapes in self.shapes_lib.items():
+                if name in placements:
+                    for lib_name, lnum, offsets in shapes:
+                        shape_placements.setdefault(lib_name, []).append(compose_placements(placements[name], offset_matrices(offsets)))
+            for lib_name, matrices in shape_placements.items():
+                placements[lib_name] = np.concatenate(matrices)
+            self.add_flattened_meshes(placements, root, max_mesh_vertices)
+        elif instancing:
+            placements, proxies = flatten_placements(main_cell, self.max_depth)
+            self.add_instanced_nodes(placements, proxies, root)
+        else:
+            self.add_cell_node(main_cell, root)
+            self.add_cell_layers(main_cell.name, root)
+        if node_bounds:
+            self.add_node_bounds()
+
+        self.gltf.scenes[0].nodes.append(0)
+        self.gltf.scene = 0
+
+        self.gltf.buffers[0].byteLength = self.blob_size
+        if verbose:
+                print(f"Scenegraph {main_cell.name}: {len(self.nodes)} nodes, {len(self.gltf.meshes)} meshes, "
+                  f"{self.blob_size} bytes of buffer data")
+        return self.gltf
+
+    def to_gltf(self):
+        """Returns the glTF object of build_scene() with its nodes and the buffer data set as its binary blob."""
+        self.gltf.nodes = self.nodes.to_gltf()
+        self.blob.seek(0)
+        self.gltf.set_binary_blob(self.blob.read())
+        return self.gltf
+
+    def save(self, output_path):
+        """Saves the scene of build_scene() as .glb or .gltf, streaming the buffer data (see write_gltf)."""
+        write_gltf(self.gltf, self.blob, self.blob_size, output_path, self.nodes)
+
+    def to_bytes(self, binary=True):
+        """Returns the scene of build_scene() as the bytes of a .glb file, or of a .gltf file if not binary."""
+        output = io.BytesIO()
+        write_gltf_file(output, self.gltf, self.blob, self.blob_size, binary, self.nodes)
+        return output.getvalue()
+
+    def validate(self):
+        """Runs validate_gltf() on the scene of build_scene() and returns its report."""
+        if isinstance(self.blob, io.BytesIO):
+            data = np.frombuffer(self.blob.getbuffer(), dtype=np.uint8, count=self.blob_size)
+        elif self.blob_size:
+            self.blob.flush()
+            data = np.memmap(self.blob, dtype=np.uint8, mode="r", shape=(self.blob_size,))
+        else:
+            data = np.zeros(0, dtype=np.uint8)
+        return validate_gltf(self.gltf, data, nodes=self.nodes)
+
+class Converter:
+    """In-process GDSII to glTF conversion API.
+
+    The GDSII library is read once by load() and the cell layer meshes are
+    kept in memory, so repeated exports of different top cells, layer subsets
+    or scenegraph modes of one loaded design only mesh what they have not seen
+    yet and never re-read the file.
+
+    Example:
+        converter = Converter("design.gds", "sg13g2_layerstack.txt").load()
+        converter.write("design.gltf")
+        converter.write("core_metal.glb", top="core", layers=["Metal*"], instancing=True)
+
+    Args:
+        gds_path: Path of the GDSII file.
+        layerstack: Layerstack file path or dictionary (see read_layerstack_from_file).
+            None guesses the layerstack from the layers used in the file.
+        shape_instancing: Instance shapes repeated more than this many times
+            within a cell layer (None disables shape instancing).
+        shape_precision: Coordinate precision of the shape and fingerprint hashes.
+        vertex_cache: Reorder triangles and vertices for the GPU vertex caches
+            (see optimize_vertex_cache).
+        dedup: Share meshes between cells with identical layer geometry.
+        mesh_cache: Optional MeshCache persisting meshes between processes.
+        multithread: Mesh cells in parallel; only used if backend is None.
+        backend: Execution backend of the meshing stage and of the catalog
+            and split layer exports: "process", "thread" or "serial" (see
+            worker_pool). Default: "process" with multithread, else "serial".
+        profiler: Profiler collecting the stage spans and counters (default:
+            a Profiler that only sums up the stages).
+        memory_budget: Resident set size in bytes above which finished meshes
+            are spilled to memory mapped temporary files (see MeshSpill) and
+            the buffer data of exports is collected in a temporary file and
+            streamed into the output. None keeps everything in memory.
+        spill_dir: Directory for the spill files (default: the system temp directory).
+        pool: multiprocessing.Pool or ThreadPool shared with other converters
+            (default: a pool of the backend for every mesh_cells() call).
+        layerstack_candidates: Layerstack dictionaries to guess from (default:
+            the files found by find_layerstacks()).
+    """
+
+    def __init__(self, gds_path, layerstack=None, shape_instancing=None, shape_precision=1e-6,
+                 dedup=True, mesh_cache=None, multithread=multithread, profiler=None,
+                 memory_budget=None, spill_dir=None, pool=None, layerstack_candidates=None,
+                 vertex_cache=False, backend=None):
+        if backend is None:
+            backend = "process" if multithread else "serial"
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, use one of {', '.join(BACKENDS)}")
+        self.gds_path = gds_path
+        self.layerstack_source = layerstack
+        self.shape_instancing = shape_instancing
+        self.shape_precision = shape_precision
+        self.vertex_cache = vertex_cache
+        self.dedup = dedup
+        self.mesh_cache = mesh_cache
+        self.backend = backend
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.mesh_spill = None
+        self.pool = pool
+        self.layerstack_candidates = layerstack_candidates
+        self.gdsii = None
+        self.layerstack = None
+
+    def load(self):
+        """Reads the GDSII file and the layerstack, dropping all meshes of a previous load.
+
+        Returns:
+            The converter itself, so calls can be chained.
+        """
+        print('Reading GDSII file {}...'.format(self.gds_path))
+        with self.profiler.span("read", file=self.gds_path):
+            self.gdsii = gdspy.GdsLibrary()
+            self.gdsii.read_gds(self.gds_path, units='import')
+
+        with self.profiler.span("layerstack"):
+            if self.layerstack_source is None:
+                self.layerstack = guess_layerstack(self.gdsii, self.layerstack_candidates)
+            elif isinstance(self.layerstack_source, dict):
+                self.layerstack = dict(self.layerstack_source)
+            else:
+                self.layerstack = read_layerstack_from_file(self.layerstack_source)
+
+        self.fingerprints = {}  # cell name -> {layer key: fingerprint}
+        self.layer_meshes = {}  # (cell name, layer key) -> (indices, positions, shapes)
+        self.meshed = {}        # cell name -> layer keys already meshed (or found empty)
+        self.aliases = {}       # (cell name, layer key) -> cell owning the identical mesh
+        self.owners = {}        # (layer key, fingerprint) -> cell owning the mesh
+        self.resident = []      # keys of the layer meshes not spilled yet
+        self.resident_bytes = 0
+        return self
+
+    def top_cell(self, top=None):
+        """Returns the gdspy cell named top, or the first top level cell of the library.
+
+        gdspy returns the top level cells in set order, so the default is the
+        first of them in file order to keep the output reproducible.
+        """
+        if top is None:
+            top_level = set(self.gdsii.top_level())
+            return next(cell for cell in self.gdsii.cells.values() if cell in top_level)
+        if top not in self.gdsii.cells:
+            raise KeyError(f"Cell {top} not found in {self.gds_path}")
+        return self.gdsii.cells[top]
+
+    def select_layers(self, layers=None, zmin=None, zmax=None):
+        """Returns the layerstack filtered by layer names and z range (see filter_layerstack).
+
+        Raises:
+            ValueError: A filter is given and selects no layer, which would
+                write an output without geometry.
+        """
+        layerstack = filter_layerstack(self.layerstack, layers, zmin, zmax)
+        if not layerstack and (layers or zmin is not None or zmax is not None):
+            names = ", ".join(dict.fromkeys(layer['name'] for layer in self.layerstack.values()))
+            raise ValueError(f"the layer selection matches no layer of the layerstack, available layers: {names}")
+        return layerstack
+
+    def cells(self, top=None, max_depth=None):
+        """Returns the cells placed below top (a cell name or a list of names) down to max_depth, in library order."""
+        names = set()
+        for name in (top if isinstance(top, (list, tuple)) else [top]):
+            names |= cells_within_depth(self.top_cell(name), max_depth)
+        return [cell for name, cell in self.gdsii.cells.items() if name in names]
+
+    def mesh_options(self):
+        """Returns the process_cell arguments after cell and layerstack, which are also part of the mesh cache keys."""
+        return self.shape_instancing, self.shape_precision, self.vertex_cache
+
+    def cell_fingerprints(self, cell):
+        """Returns the memoized layer fingerprints (cell_layer_fingerprints) of a cell."""
+        if cell.name not in self.fingerprints:
+            self.fingerprints[cell.name] = cell_layer_fingerprints(cell, self.layerstack, self.shape_precision)
+        return self.fingerprints[cell.name]
+
+    def layer_fingerprints(self, top=None, layers=None, zmin=None, zmax=None, max_depth=None):
+        """Returns the fingerprints of the selected cells restricted to the selected layers."""
+        layerstack = self.select_layers(layers, zmin, zmax)
+        return {cell.name: {lnum: fingerprint for lnum, fingerprint in self.cell_fingerprints(cell).items()
+                            if lnum in layerstack}
+                for cell in self.cells(top, max_depth)}
+
+    def estimate(self, top=None, layers=None, zmin=None, zmax=None, max_depth=None,
+                 flatten=False, instancing=False, max_mesh_vertices=max_mesh_vertices, binary=False):
+        """Predicts the size of an export from polygon counts, without triangulating anything.
+
+        Triangles and vertices follow the extrusion of process_cell (see
+        extruded_size), placements are counted through the hierarchy and the
+        JSON size uses the per-object sizes of ESTIMATE_JSON_BYTES. The
+        arguments are those of scene(); binary estimates a .glb instead of a
+        .gltf file.
+
+        Returns:
+            Dictionary with 'totals', per layer name 'layers', per cell name
+            'cells' (placements, polygons, points, triangles, layers), the
+            'workers' worth using, and 'notes' (see print_estimate).
+        """
+        layerstack = self.select_layers(layers, zmin, zmax)
+        top_cell = self.top_cell(top)
+        counts, proxies, transformed = placement_counts(top_cell, max_depth)
+        box_positions, box_indices = box_mesh((0, 0), (1, 1), 0, 1)
+
+        cells = {}
+        layer_totals = {layer['name']: {'polygons': 0, 'vertices': 0, 'triangles': 0, 'drawn_triangles': 0,
+                                        'drawn_vertices': 0} for layer in layerstack.values()}
+        owners = {}
+        jobs = []  # polygon points to triangulate per cell
+        meshes = meshed_triangles = mesh_bytes = 0
+        layer_nodes = transformed_layer_nodes = 0  # placements times layers drawn
+        for cell in self.cells(top, max_depth):
+            layer_counts = cell_layer_counts(cell, layerstack)
+            fingerprints = self.cell_fingerprints(cell) if self.dedup else {}
+            placements = counts.get(cell.name, 0)
+            entry = cells[cell.name] = {'placements': placements, 'polygons': 0, 'points': 0, 'triangles': 0,
+                                        'layers': {}}
+            work = 0
+            for lnum, (polygons, points) in layer_counts.items():
+                vertices, triangles = extruded_size(polygons, points)
+                name = layerstack[lnum]['name']
+                entry['layers'][name] = {'polygons': polygons, 'vertices': vertices, 'triangles': triangles}
+                entry['polygons'] += polygons
+                entry['points'] += points
+                entry['triangles'] += triangles
+                layer = layer_totals[name]
+                layer['polygons'] += polygons
+                layer['vertices'] += vertices
+                layer['triangles'] += triangles
+                layer['drawn_triangles'] += triangles * placements
+                layer['drawn_vertices'] += vertices * placements
+                layer_nodes += placements
+                transformed_layer_nodes += transformed.get(cell.name, 0)
+                # identical layers of other cells share the mesh (--dedup)
+                if lnum in fingerprints and owners.setdefault((lnum, fingerprints[lnum]), cell.name) != cell.name:
+                    continue
+                meshes += 1
+                meshed_triangles += triangles
+                mesh_bytes += 12 * (triangles + vertices)
+                work += points
+            if work:
+                jobs.append(work)
+
+        proxy_meshes = proxy_boxes = 0
+        bounds = {}
+        for name, placements in proxies.items():
+            boxes = cell_layer_bounds(self.gdsii.cells[name], layerstack, bounds)
+            proxy_meshes += len(boxes)
+            proxy_boxes += placements * len(boxes)
+            for lnum in boxes:
+                layer = layer_totals[layerstack[lnum]['name']]
+                layer['drawn_triangles'] += len(box_indices) * placements
+                layer['drawn_vertices'] += len(box_positions) * placements
+        box_bytes = 12 * (len(box_indices) + len(box_positions))
+        drawn_triangles = sum(layer['drawn_triangles'] for layer in layer_totals.values())
+        placements = sum(counts.values()) - 1 + sum(proxies.values())
+
+        json_bytes = ESTIMATE_JSON_BYTES["document"]
+        if flatten:
+            mode = "flatten"
+            buffer_bytes = 12 * sum(layer['drawn_triangles'] + layer['drawn_vertices'] for layer in layer_totals.values())
+            meshes = sum(-(-layer['drawn_vertices'] // max_mesh_vertices) for layer in layer_totals.values())
+            nodes = 1 + meshes
+            json_bytes += meshes * ESTIMATE_JSON_BYTES["mesh"] + nodes * ESTIMATE_JSON_BYTES["layer_node"]
+        elif instancing:
+            mode = "instancing"
+            meshes += proxy_meshes
+            # one node per mesh with a translation per placement, rotation and scale only where needed
+            buffer_bytes = mesh_bytes + proxy_meshes * box_bytes + 12 * (layer_nodes + proxy_boxes) + \
+                28 * transformed_layer_nodes
+            nodes = 1 + meshes
+            json_bytes += meshes * ESTIMATE_JSON_BYTES["mesh"] + meshes * (
+                ESTIMATE_JSON_BYTES["instanced_node"] + ESTIMATE_JSON_BYTES["accessor"])
+        else:
+            mode = "hierarchical"
+            meshes += proxy_meshes
+            buffer_bytes = mesh_bytes + proxy_meshes * box_bytes
+            nodes = 1 + placements + layer_nodes + proxy_boxes
+            json_bytes += meshes * ESTIMATE_JSON_BYTES["mesh"] + placements * ESTIMATE_JSON_BYTES["instance_node"] + \
+                (layer_nodes + proxy_boxes) * ESTIMATE_JSON_BYTES["layer_node"]
+        if binary:
+            output_bytes = 28 + json_bytes + buffer_bytes
+        else:
+            json_bytes = int(json_bytes * ESTIMATE_GLTF_JSON_FACTOR)
+            output_bytes = json_bytes + -(-buffer_bytes // 3) * 4
+
+        notes = []
+        if self.shape_instancing is not None:
+            notes.append("shape instancing is not taken into account, meshes may be smaller")
+        largest = max(jobs, default=0)
+        total_work = sum(jobs)
+        return {
+            'top': top_cell.name, 'mode': mode, 'format': "glb" if binary else "gltf",
+            'totals': {'cells': len(cells), 'placements': placements,
+                       'polygons': sum(cell['polygons'] for cell in cells.values()),
+                       'points': sum(cell['points'] for cell in cells.values()),
+                       'meshed_triangles': meshed_triangles, 'drawn_triangles': drawn_triangles,
+                       'meshes': meshes, 'nodes': nodes, 'buffer_bytes': buffer_bytes,
+                       'json_bytes': json_bytes, 'output_bytes': output_bytes},
+            'layers': {name: {key: value for key, value in layer.items() if key != 'drawn_vertices'}
+                       for name, layer in layer_totals.items() if layer['drawn_triangles']},
+            'cells': cells,
+            # the largest cell is meshed by one worker, so it bounds the speedup
+            'workers': {'jobs': len(jobs), 'largest_job_share': largest / total_work if total_work else 0,
+                        'suggested': max(1, min(multiprocessing.cpu_count(), len(jobs),
+                                                -(-total_work // largest) if largest else 1))},
+            'notes': notes,
+        }
+
+    def mesh_cells(self, top=None, layers=None, zmin=None, zmax=None, max_depth=None):
+        """Meshes the selected cell layers that are not in memory yet.
+
+        Layers identical to a layer meshed before share its mesh (dedup) and
+        layers found in the mesh cache are read from it; everything else is
+        triangulated, in parallel unless the backend is "serial".
+
+        Args:
+            top: Name of the top cell (default: the first top level cell), or a
+                list of names to mesh the cells of several exports at once.
+            layers: Layer names to mesh, wildcards allowed (default: all).
+            zmin, zmax: Only mesh layers overlapping this z range.
+            max_depth: Only mesh cells down to this hierarchy depth.
+
+        Returns:
+            The list of selected gdspy cells.
+        """
+        return self.finish_meshing(self.start_meshing(top, layers, zmin, zmax, max_depth))
+
+    def start_meshing(self, top=None, layers=None, zmin=None, zmax=None, max_depth=None):
+        """First half of mesh_cells(): reuses what it can and submits the remaining jobs.
+
+        With a shared pool the jobs start running at once, so the caller can
+        go on, e.g. load the next design of a batch, before finish_meshing().
+
+        Returns:
+            A handle for finish_meshing().
+        """
+        layerstack = self.select_layers(layers, zmin, zmax)
+        cells = self.cells(top, max_depth)
+
+        jobs = []
+        deferred = [] # (cell, layer key, layer, cache key) being meshed for another design
+        reserved = []
+        aliases = len(self.aliases)
+        hits = self.mesh_cache.hits if self.mesh_cache is not None else 0
+        with self.profiler.span("fingerprints", cells=len(cells)):
+            for cell in cells:
+                todo, cached = self.plan_cell(cell, layerstack, deferred, reserved)
+                for lnum, mesh in cached.items():
+                    self.store_mesh((cell.name, lnum), mesh)
+                if todo:
+                    jobs.append((cell, todo, *self.mesh_options()))
+        self.count_reuse(len(self.aliases) - aliases, hits, len(deferred))
+
+        tasks = [(index, job, self.profiler.worker_profile_dir) for index, job in enumerate(jobs)]
+        return {'cells': cells, 'jobs': jobs, 'results': self.run_mesh_jobs(tasks),
+                'deferred': deferred, 'reserved': reserved}
+
+    def plan_cell(self, cell, layerstack, deferred, reserved):
+        """Sorts the layers of a cell that are not meshed yet by how they get their mesh.
+
+        Layers without geometry and layers identical to a layer of another
+        cell (dedup) are marked as meshed. Layers another design is meshing
+        into the shared mesh cache are appended to deferred as (cell, layer
+        key, layer, cache key), the cache keys reserved for meshing here to
+        reserved.
+
+        Returns:
+            (todo, cached): the {layer key: layer} left to mesh and the
+            {layer key: mesh} read from the mesh cache, marked as meshed.
+        """
+        done = self.meshed.setdefault(cell.name, set())
+        todo = {lnum: layer for lnum, layer in layerstack.items() if lnum not in done}
+        cached = {}
+        if not self.dedup and self.mesh_cache is None:
+            return todo, cached
+        # layers without geometry need no mesh
+        fingerprints = self.cell_fingerprints(cell)
+        done.update(lnum for lnum in todo if lnum not in fingerprints)
+        todo = {lnum: layer for lnum, layer in todo.items() if lnum in fingerprints}
+        for lnum in list(todo):
+            fingerprint = fingerprints[lnum]
+            if self.dedup:
+                owner = self.owners.setdefault((lnum, fingerprint), cell.name)
+                if owner != cell.name:
+                    self.aliases[(cell.name, lnum)] = owner
+                    done.add(lnum)
+                    del todo[lnum]
+                    continue
+            if self.mesh_cache is not None:
+                key = mesh_cache_key(fingerprint, todo[lnum], *self.mesh_options())
+                arrays = self.mesh_cache.get(key)
+                if arrays is not None:
+                    cached[lnum] = cached_layer_mesh(arrays)
+                elif not self.mesh_cache.reserve(key):
+                    deferred.append((cell, lnum, todo[lnum], key))
+                else:
+                    reserved.append(key)
+                    continue
+                done.add(lnum)
+                del todo[lnum]
+        return todo, cached
+
+    def count_reuse(self, aliases, hits_before, deferred=0):
+        """Counts and prints the duplicate and cached layer meshes reused since the mesh cache had hits_before hits."""
+        hits = self.mesh_cache.hits - hits_before if self.mesh_cache is not None else 0
+        self.profiler.count("duplicate_layers", aliases)
+        self.profiler.count("cache_hits", hits)
+        if aliases or hits or deferred:
+            print(f"Reusing {aliases} duplicate and {hits} cached cell layer meshes" +
+                  (f", {deferred} more are being meshed for another design" if deferred else ""))
+
+    def finish_meshing(self, handle):
+        """Second half of mesh_cells(): stores the meshes of a start_meshing() handle as they arrive.
+
+        Returns:
+            The list of selected gdspy cells.
+        """
+        self.collect_meshes(handle['jobs'], handle['results'])
+        missing = {}
+        for cell, lnum, layer, key in handle['deferred']:
+            arrays = self.mesh_cache.get(key)
+            if arrays is not None:
+                self.store_mesh((cell.name, lnum), cached_layer_mesh(arrays))
+            else:
+                # the other design failed, or its mesh was evicted already
+                missing.setdefault(cell.name, (cell, {}))[1][lnum] = layer
+        if missing:
+            jobs = [(cell, todo, *self.mesh_options()) for cell, todo in missing.values()]
+            tasks = [(index, job, self.profiler.worker_profile_dir) for index, job in enumerate(jobs)]
+            self.collect_meshes(jobs, self.run_mesh_jobs(tasks))
+        return handle['cells']
+
+    def collect_meshes(self, jobs, results):
+        """Stores the (index, process_cell result) pairs of jobs as they arrive, printing the progress."""
+        # results are stored as they arrive, so they can be spilled before the last one is done
+        with self.profiler.span("mesh", cells=len(jobs)):
+            triangles = 0
+            last_print = 0
+            for done, (index, (meshes, stats)) in enumerate(results, 1):
+                cell, todo = jobs[index][:2]
+                self.meshed[cell.name].update(todo)
+                self.profiler.add_cell_stats(cell.name, stats)
+                for lnum, (indices, positions, shapes) in meshes.items():
+                    fingerprint = self.fingerprints.get(cell.name, {}).get(lnum)
+                    if self.mesh_cache is not None and fingerprint is not None:
+                        key = mesh_cache_key(fingerprint, todo[lnum], *self.mesh_options())
+                        self.mesh_cache.put(key, layer_mesh_arrays(indices, positions, shapes))
+                    self.store_mesh((cell.name, lnum), (indices, positions, shapes))
+                triangles += sum(layer['triangles'] for layer in stats['layers'].values())
+                now = time.perf_counter()
+                # redraw the line on terminals, only print the final count to logs
+                if (now - last_print > 0.2 and sys.stdout.isatty()) or done == len(jobs):
+                    last_print = now
+                    print(f"\rMeshing cells: {done}/{len(jobs)}, {triangles} triangles",
+                          end="\n" if done == len(jobs) else "", flush=True)
+
+    def store_mesh(self, key, mesh):
+        """Keeps the (indices, positions, shapes) mesh of a cell layer, spilling over the memory budget.
+
+        Meshes are spilled in batches of at least 1/16 of the budget (at most
+        64 MB), so a design whose library alone exceeds the budget does not
+        end up with one file per mesh.
+        """
+        self.layer_meshes[key] = mesh
+        if self.memory_budget is None:
+            return
+        self.resident.append(key)
+        self.resident_bytes += sum(array.nbytes for array in layer_mesh_list(*mesh))
+        if self.resident_bytes >= min(self.memory_budget // 16, 64 * 2**20) and current_rss() > self.memory_budget:
+            self.spill_meshes()
+
+    def spill_meshes(self):
+        """Moves all resident layer meshes to a MeshSpill file."""
+        if self.mesh_spill is None:
+            self.mesh_spill = MeshSpill(self.spill_dir)
+        with self.profiler.span("spill", meshes=len(self.resident)):
+            meshes = [layer_mesh_list(*self.layer_meshes[key]) for key in self.resident]
+            mapped = self.mesh_spill.spill([array for arrays in meshes for array in arrays])
+            start = 0
+            for key, arrays in zip(self.resident, meshes):
+                self.layer_meshes[key] = layer_mesh_from_list(mapped[start:start + len(arrays)])
+                start += len(arrays)
+        self.profiler.count("spilled_meshes", len(self.resident))
+        self.profiler.count("spilled_bytes", self.resident_bytes)
+        self.resident = []
+        self.resident_bytes = 0
+
+    def close(self):
+        """Removes the spill directory and stops the profiler. Spilled meshes stay readable on POSIX systems only."""
+        self.profiler.close()
+        if self.mesh_spill is not None:
+            self.mesh_spill.close()
+            self.mesh_spill = None
+
+    def run_mesh_jobs(self, tasks):
+        """Returns an iterator over the (index, process_cell result) of run_mesh_job tasks as they complete.
+
+        On a shared pool the tasks are submitted right away, otherwise when
+        the iteration starts.
+        """
+        if self.pool is not None and tasks:
+            return self.pool.imap_unordered(run_mesh_job, tasks)
+        if self.backend != "serial" and len(tasks) > 1:
+            def run_in_pool():
+                with worker_pool(self.backend, min(multiprocessing.cpu_count(), len(tasks))) as pool:
+                    yield from pool.imap_unordered(run_mesh_job, tasks)
+            return run_in_pool()
+        return map(run_mesh_job, tasks)
+
+    def scene(self, top=None, layers=None, zmin=None, zmax=None, max_depth=None,
+              flatten=False, instancing=False, max_mesh_vertices=max_mesh_vertices, node_bounds=False):
+        """Meshes what is missing and builds the scenegraph of one export.
+
+        Args:
+            top, layers, zmin, zmax, max_depth: Selection, see mesh_cells().
+            flatten: Bake all instances into one world space mesh per layer.
+            instancing: Draw repeated cells and arrays with EXT_mesh_gpu_instancing.
+            max_mesh_vertices: Split flattened layer meshes above this vertex count.
+            node_bounds: Add local and world bounding boxes to the node extras,
+                see GltfBuilder.add_node_bounds().
+
+        Returns:
+            The GltfBuilder holding the scene. With a memory budget its buffer
+            data is in a temporary file.
+        """
+        cells = self.mesh_cells(top, layers, zmin, zmax, max_depth)
+        layerstack = self.select_layers(layers, zmin, zmax)
+        print(f"Exporting layers: {', '.join(layer['name'] for layer in layerstack.values())}")
+
+        with self.profiler.span("scenegraph", flatten=flatten, instancing=instancing):
+            blob = None
+            if self.memory_budget is not None:
+                if self.mesh_spill is None:
+                    self.mesh_spill = MeshSpill(self.spill_dir)
+                blob = self.mesh_spill.blob_file()
+            builder = self.assemble(cells, layerstack, top, max_depth, flatten, instancing, max_mesh_vertices, blob,
+                                    node_bounds=node_bounds)
+        self.profiler.count("nodes", len(builder.nodes))
+        self.profiler.count("blob_bytes", builder.blob_size)
+        return builder
+
+    def assemble(self, cells, layerstack, top=None, max_depth=None, flatten=False, instancing=False,
+                 max_mesh_vertices=max_mesh_vertices, blob=None, verbose=True, node_bounds=False):
+        """Builds the scene of top from the layer meshes in memory, see scene().
+
+        Args:
+            cells: The meshed cells of the export (mesh_cells() of top).
+            layerstack: The selected layerstack (select_layers()).
+            blob: Binary file object for the buffer data (default: in memory).
+            verbose: Print the scenegraph totals.
+
+        Returns:
+            The GltfBuilder holding the scene.
+        """
+        builder = GltfBuilder(layerstack, self.gdsii.cells, max_depth, blob)
+        for cell in cells:
+            for lnum in layerstack:
+                owner = self.aliases.get((cell.name, lnum), cell.name)
+                if (owner, lnum) in self.layer_meshes:
+                    builder.add_layer_mesh(cell.name, lnum, owner, *self.layer_meshes[(owner, lnum)], bake=flatten)
+        builder.build_scene(self.top_cell(top), flatten, instancing, max_mesh_vertices, verbose, node_bounds)
+        return builder
+
+    def build(self, **options):
+        """Meshes what is missing and builds the glTF document of one export.
+
+        Args:
+            options: Selection and scenegraph options, see scene().
+
+        Returns:
+            A pygltflib.GLTF2 object with its binary blob set.
+        """
+        return self.scene(**options).to_gltf()
+
+    def write(self, output_path, validate=True, **options):
+        """Builds one export (see scene() for the options) and saves it.
+
+        The output is a binary .glb file if output_path ends in .glb, and a
+        .gltf file with the buffer embedded as a data URI otherwise. The buffer
+        data is streamed into the file, see write_gltf().
+
+        Args:
+            output_path: Path of the .glb or .gltf file.
+            validate: Check the export with validate_gltf() and print a summary.
+
+        Returns:
+            output_path.
+
+        Raises:
+            GltfValidationError: The export failed validation. The file is
+                written anyway, to be inspected.
+        """
+        builder = self.scene(**options)
+        report = None
+        if validate:
+            with self.profiler.span("validate"):
+                t_start = time.perf_counter()
+                report = builder.validate()
+                print_validation(report, time.perf_counter() - t_start)
+        with self.profiler.span("write"):
+            builder.save(output_path)
+        builder.blob.close()
+        if report is not None and report['errors']:
+            raise GltfValidationError(report)
+        return output_path
+
+    def stream(self, output_path, validate=True, window=None, top=None, layers=None, zmin=None, zmax=None,
+               max_depth=None, instancing=False, max_mesh_vertices=max_mesh_vertices, node_bounds=False):
+        """Exports like write(), but meshes, assembles and writes the cells as a pipeline.
+
+        The cells are fingerprinted and dispatched to the workers one by one,
+        and every finished mesh goes straight into the buffer data, a
+        temporary file, instead of being kept. At most window cells are
+        meshing or waiting to be written at any time; when the assembly falls
+        behind, no new cells are dispatched. Meshes are written in cell order,
+        so the output is the same as the one of write(). Memory holds the
+        meshes of the window instead of all of them, and the fingerprinting
+        and assembly run while the workers mesh.
+
+        The meshes are not kept for later exports: the converter is left with
+        the meshes it had before. --flatten needs all meshes at once to bake
+        them and is not streamed, see write().
+
+        Args:
+            output_path: Path of the .glb or .gltf file.
+            validate: Check the export with validate_gltf() and print a summary.
+            window: Maximum number of cells in flight (default: 4 per worker).
+            top, layers, zmin, zmax, max_depth: Selection, see mesh_cells().
+            instancing, max_mesh_vertices, node_bounds: Scenegraph options, see scene().
+
+        Returns:
+            output_path.
+
+        Raises:
+            GltfValidationError: The export failed validation.
+        """
+        layerstack = self.select_layers(layers, zmin, zmax)
+        cells = self.cells(top, max_depth)
+        print(f"Exporting layers: {', '.join(layer['name'] for layer in layerstack.values())}")
+        # restored at the end, the streamed meshes are gone by then
+        state = ({name: set(done) for name, done in self.meshed.items()}, dict(self.aliases), dict(self.owners))
+
+        pool = self.pool
+        own_pool = pool is None and self.backend != "serial" and len(cells) > 1
+        if own_pool:
+            pool = worker_pool(self.backend, min(multiprocessing.cpu_count(), len(cells)))
+        if window is None:
+            window = 4 * (min(multiprocessing.cpu_count(), len(cells)) if pool is not None else 1)
+        results = queue.Queue()
+        if self.mesh_spill is None:
+            self.mesh_spill = MeshSpill(self.spill_dir)
+        builder = GltfBuilder(layerstack, self.gdsii.cells, max_depth, self.mesh_spill.blob_file())
+        streamed = {} # (cell name, layer key) -> stand-in for add_layer_mesh of cells aliasing a streamed mesh
+        ready = {}    # cell position -> {layer key: mesh} of cells waiting for the cells before them
+        reserved = []
+        aliases = len(self.aliases)
+        hits = self.mesh_cache.hits if self.mesh_cache is not None else 0
+        dispatched = written = in_flight = meshed = triangles = 0
+        last_print = 0
+
+        def add_cell(cell, meshes):
+            """Adds the layer meshes of cell to the buffer data, in layerstack order like scene()."""
+            for lnum in layerstack:
+                owner = self.aliases.get((cell.name, lnum), cell.name)
+                if (owner, lnum) in meshes:
+                    mesh = meshes[(owner, lnum)]
+                elif (owner, lnum) in self.layer_meshes:
+                    mesh = self.layer_meshes[(owner, lnum)]
+                elif (owner, lnum) in streamed:
+                    mesh = streamed[(owner, lnum)]
+                else:
+                    continue
+                builder.add_layer_mesh(cell.name, lnum, owner, *mesh)
+                if (owner, lnum) in meshes:
+                    # the glTF meshes of the owner exist now, aliases only need to know
+                    # whether there is a layer mesh and where the shapes are placed
+                    indices, _, shapes = mesh
+                    streamed[(owner, lnum)] = (np.empty(min(len(indices), 1)), None,
+                                               [(None, None, offsets) for _, _, offsets in shapes])
+
+        try:
+            with self.profiler.span("stream", cells=len(cells), window=window):
+                while written < len(cells):
+                    # dispatch while the window has room
+                    while dispatched < len(cells) and dispatched - written < window:
+                        cell = cells[dispatched]
+                        deferred = []
+                        todo, meshes = self.plan_cell(cell, layerstack, deferred, reserved)
+                        for _, lnum, layer, _ in deferred:
+                            todo[lnum] = layer # another design is meshing it, mesh it here as well
+                        meshes = {(cell.name, lnum): mesh for lnum, mesh in meshes.items()}
+                        job = (cell, todo, *self.mesh_options())
+                        task = (dispatched, job, self.profiler.worker_profile_dir)
+                        if not todo:
+                            ready[dispatched] = meshes
+                        elif pool is None:
+                            results.put((run_mesh_job(task), meshes))
+                            in_flight += 1
+                        else:
+                            pool.apply_async(run_mesh_job, (task,), callback=lambda result, meshes=meshes: results.put((result, meshes)),
+                                             error_callback=lambda error: results.put((error, None)))
+                            in_flight += 1
+                        dispatched += 1
+                    # write the cells whose meshes are complete, in order
+                    while written in ready:
+                        add_cell(cells[written], ready.pop(written))
+                        written += 1
+                    if written == len(cells):
+                        break
+                    if not in_flight:
+                        continue # the window moved on, dispatch more
+                    result, meshes = results.get()
+                    in_flight -= 1
+                    if isinstance(result, Exception):
+                        raise result
+                    index, (cell_meshes, stats) = result
+                    cell = cells[index]
+                    self.profiler.add_cell_stats(cell.name, stats)
+                    for lnum, (indices, positions, shapes) in cell_meshes.items():
+                        fingerprint = self.fingerprints.get(cell.name, {}).get(lnum)
+                        if self.mesh_cache is not None and fingerprint is not None:
+                            key = mesh_cache_key(fingerprint, layerstack[lnum], *self.mesh_options())
+                            self.mesh_cache.put(key, layer_mesh_arrays(indices, positions, shapes))
+                        meshes[(cell.name, lnum)] = (indices, positions, shapes)
+                    ready[index] = meshes
+                    meshed += 1
+                    triangles += sum(layer['triangles'] for layer in stats['layers'].values())
+                    now = time.perf_counter()
+                    if now - last_print > 0.2 and sys.stdout.isatty():
+                        last_print = now
+                        print(f"\rStreaming cells: {written}/{len(cells)} written, {meshed} meshed, "
+                              f"{triangles} triangles", end="", flush=True)
+                print(f"\rStreaming cells: {written}/{len(cells)} written, {meshed} meshed, {triangles} triangles")
+            self.count_reuse(len(self.aliases) - aliases, hits)
+            with self.profiler.span("scenegraph", instancing=instancing):
+                builder.build_scene(self.top_cell(top), False, instancing, max_mesh_vertices, node_bounds=node_bounds)
+        except BaseException:
+            if self.mesh_cache is not None:
+                self.mesh_cache.release(reserved)
+            builder.blob.close()
+            raise
+        finally:
+            self.meshed, self.aliases, self.owners = state
+            if own_pool:
+                pool.terminate()
+                pool.join()
+        self.profiler.count("nodes", len(builder.nodes))
+        self.profiler.count("blob_bytes", builder.blob_size)
+
+        report = None
+        if validate:
+            with self.profiler.span("validate"):
+                t_start = time.perf_counter()
+                report = builder.validate()
+                print_validation(report, time.perf_counter() - t_start)
+        with self.profiler.span("write"):
+            builder.save(output_path)
+        builder.blob.close()
+        if report is not None and report['errors']:
+            raise GltfValidationError(report)
+        return output_path
+
+    @contextlib.contextmanager
+    def export_jobs(self, function, tasks, chunksize=1):
+        """Runs export jobs (run_catalog_job, run_layer_job) on the meshes of this converter in parallel.
+
+        Workers of the "process" backend are forked, so they see the meshes
+        without pickling them, and find the converter in catalog_converter.
+        Thread workers get the converter passed in.
+
+        Yields:
+            The iterator over the job results, in task order.
+        """
+        global catalog_converter
+        pool = None
+        try:
+            workers = min(multiprocessing.cpu_count(), len(tasks))
+            if self.backend == "process" and len(tasks) > 1 and "fork" in multiprocessing.get_all_start_methods():
+                catalog_converter = self
+                pool = multiprocessing.get_context("fork").Pool(workers)
+                yield pool.imap(function, tasks, chunksize)
+            elif self.backend == "thread" and len(tasks) > 1:
+                pool = worker_pool("thread", workers)
+                yield pool.imap(functools.partial(function, converter=self), tasks, chunksize)
+            else:
+                yield map(functools.partial(function, converter=self), tasks)
+        finally:
+            if pool is not None:
+                if catalog_converter is self:
+                    catalog_converter = None
+                pool.terminate()
+                pool.join()
+
+    def catalog_cells(self, patterns=None):
+        """Returns the names of the cells matching any of patterns (wildcards allowed) in library order.
+
+        Without patterns all top level cells are returned.
+        """
+        if not patterns:
+            top_level = set(self.gdsii.top_level())
+            return [name for name, cell in self.gdsii.cells.items() if cell in top_level]
+        return [name for name in self.gdsii.cells if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)]
+
+    def catalog(self, pack_path, index_path, cells=None, validate=True, layers=None, zmin=None, zmax=None,
+                max_depth=None, flatten=False, instancing=False, max_mesh_vertices=max_mesh_vertices, node_bounds=False):
+        """Exports many cells, e.g. all cells of a standard cell library, as one GLB each.
+
+        The cells of all exports are meshed together, so sub-cells shared by
+        several of them are meshed once. The GLB files are then built in
+        parallel by workers sharing the meshes in memory (see export_jobs()),
+        and stored one after the other in the pack file. The JSON index lists the offset and
+        length of every GLB in the pack, together with the bounding box of its
+        cell, so a viewer can fetch single cells with range requests.
+
+        Args:
+            pack_path: Path of the pack file the GLB files are written to.
+            index_path: Path of the JSON index.
+            cells: Cell name patterns, see catalog_cells() (default: all top level cells).
+            validate: Check every GLB with validate_gltf().
+            layers, zmin, zmax, max_depth: Selection, see mesh_cells().
+            flatten, instancing, max_mesh_vertices, node_bounds: Scenegraph options, see scene().
+
+        Returns:
+            The index dictionary. Cells failing validation have their errors
+            in the "errors" entry of their index entry.
+        """
+        names = self.catalog_cells(cells)
+        if not names:
+            raise KeyError(f"No cells matching {', '.join(cells)} in {self.gds_path}")
+        print(f"Catalog: {len(names)} cells")
+        self.mesh_cells(names, layers, zmin, zmax, max_depth)
+        layerstack = self.select_layers(layers, zmin, zmax)
+
+        bounds_cache = {}
+        options = dict(layers=layers, zmin=zmin, zmax=zmax, max_depth=max_depth, flatten=flatten,
+                       instancing=instancing, max_mesh_vertices=max_mesh_vertices, node_bounds=node_bounds)
+        tasks = [(name, options, validate) for name in names]
+        index = {'gds': os.path.basename(self.gds_path), 'pack': os.path.basename(pack_path),
+                 'layers': [layer['name'] for layer in layerstack.values()], 'cells': []}
+        chunksize = max(1, len(tasks) // (64 * multiprocessing.cpu_count()))
+        with self.profiler.span("catalog", cells=len(names)), self.export_jobs(run_catalog_job, tasks, chunksize) as results:
+            with open(pack_path, "wb") as f:
+                for done, (name, (glb, nodes, meshes, errors)) in enumerate(zip(names, results), 1):
+                    layer_bounds = cell_layer_bounds(self.gdsii.cells[name], layerstack, bounds_cache)
+                    entry = {'name': name, 'offset': f.tell(), 'length': len(glb),
+                             'bounds': stack_bounds(layer_bounds, layerstack), 'nodes': nodes, 'meshes': meshes}
+                    f.write(glb)
+                    if errors:
+                        entry['errors'] = errors
+                        print(f"Error: {name} failed validation: {errors[0]}" +
+                              (f" and {len(errors) - 1} more" if len(errors) > 1 else ""))
+                    index['cells'].append(entry)
+                    if sys.stdout.isatty() or done == len(tasks):
+                        print(f"\rCatalog cells: {done}/{len(tasks)}", end="\n" if done == len(tasks) else "", flush=True)
+        with open(index_path, "w") as f:
+            json.dump(index, f, indent=1)
+        print(f"Wrote {pack_path} ({os.path.getsize(pack_path)} bytes) and {index_path}")
+        return index
+
+    def layer_groups(self, layerstack, groups=None):
+        """Splits a layerstack into named groups of layers.
+
+        Args:
+            layerstack: The selected layerstack (select_layers()).
+            groups: List of groups, each a list of layer name patterns (see
+                filter_layerstack). A layer goes to the first group matching it.
+                None makes one group per layer name (layers of several datatypes
+                often share a name).
+
+        Returns:
+            List of (name, layerstack) pairs, in the order of groups. The name
+            of a group is the name of its layers if they share one, otherwise
+            its patterns joined by "+".
+
+        Raises:
+            KeyError: A group matches none of the layers.
+        """
+        if groups is None:
+            by_name = {}
+            for lnum, layer in layerstack.items():
+                by_name.setdefault(layer['name'], {})[lnum] = layer
+            return list(by_name.items())
+        result = []
+        left = dict(layerstack)
+        for patterns in groups:
+            group = filter_layerstack(left, patterns)
+            if not group:
+                raise KeyError(f"No layers matching {'+'.join(patterns)}")
+            for lnum in group:
+                del left[lnum]
+            names = {layer['name'] for layer in group.values()}
+            name = names.pop() if len(names) == 1 else "+".join(patterns)
+            result.append((name, group))
+        return result
+
+    def split_layers(self, directory, groups=None, validate=True, top=None, layers=None, zmin=None, zmax=None,
+                     max_depth=None, flatten=False, instancing=False, max_mesh_vertices=max_mesh_vertices,
+                     node_bounds=False):
+        """Exports one GLB per layer, or per group of layers, for progressive loading.
+
+        The design is meshed once for all layers. The GLB files are then built
+        and written in parallel by workers sharing the meshes in memory (see
+        export_jobs()).
+        Every file holds the same scenegraph of the selected top cell, with
+        only the meshes of its layers, so a viewer can load any subset of the
+        files and they line up. manifest.json in the directory lists the
+        files in layerstack order, with their layers, z range, color, size
+        and bounding box, so a viewer can show the top metals first and fetch
+        the other layers on demand.
+
+        Args:
+            directory: Directory the GLB files and manifest.json are written to.
+            groups: Layer groups, see layer_groups() (default: one file per layer).
+            validate: Check every GLB with validate_gltf().
+            top, layers, zmin, zmax, max_depth: Selection, see mesh_cells().
+            flatten, instancing, max_mesh_vertices, node_bounds: Scenegraph options, see scene().
+
+        Returns:
+            The manifest dictionary. Groups failing validation have their
+            errors in the "errors" entry of their manifest entry.
+
+        Raises:
+            KeyError: A group matches none of the selected layers.
+        """
+        layerstack = self.select_layers(layers, zmin, zmax)
+        layer_groups = self.layer_groups(layerstack, groups)
+        self.mesh_cells(top, layers, zmin, zmax, max_depth)
+        top_cell = self.top_cell(top)
+        layer_bounds = cell_layer_bounds(top_cell, layerstack, {})
+
+        os.makedirs(directory, exist_ok=True)
+        options = dict(top=top, max_depth=max_depth, flatten=flatten, instancing=instancing,
+                       max_mesh_vertices=max_mesh_vertices, node_bounds=node_bounds)
+        files = []
+        for name, _ in layer_groups:
+            file = base = re.sub(r"[^\w.+-]", "_", name)
+            while file + ".glb" in files:
+                file = f"{base}_{len(files)}"
+            files.append(file + ".glb")
+        tasks = [(os.path.join(directory, file), list(group), options, validate)
+                 for file, (_, group) in zip(files, layer_groups)]
+        manifest = {'gds': os.path.basename(self.gds_path), 'top': top_cell.name,
+                    'scenegraph': "flatten" if flatten else "instancing" if instancing else "hierarchy",
+                    'bounds': stack_bounds(layer_bounds, layerstack), 'groups': []}
+        with self.profiler.span("split_layers", groups=len(tasks)), self.export_jobs(run_layer_job, tasks) as results:
+            for file, (name, group), (length, nodes, meshes, errors) in zip(files, layer_groups, results):
+                entry = {'name': name, 'file': file, 'layers': list(dict.fromkeys(layer['name'] for layer in group.values())),
+                         'zmin': min(layer['zmin'] for layer in group.values()),
+                         'zmax': max(layer['zmax'] for layer in group.values()),
+                         'color': next(iter(group.values()))['color'], 'length': length,
+                         'bounds': stack_bounds(layer_bounds, group), 'nodes': nodes, 'meshes': meshes}
+                if errors:
+                    entry['errors'] = errors
+                    print(f"Error: {file} failed validation: {errors[0]}" +
+                          (f" and {len(errors) - 1} more" if len(errors) > 1 else ""))
+                manifest['groups'].append(entry)
+                print(f"Wrote {os.path.join(directory, file)} ({length} bytes)")
+        with open(os.path.join(directory, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=1)
+        print(f"Wrote {os.path.join(directory, 'manifest.json')}")
+        return manifest
+
+class LruCache:
+    """Dictionary keeping at most max_entries values, dropping the least recently used."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+class ConversionService:
+    """Answers conversion requests of the --serve daemon from warm caches.
+
+    Loaded designs (a Converter with its parsed library and meshes), parsed
+    layerstack files and the encoded responses are kept in LRU caches. A design
+    is reloaded when the modification time of its file changes; with a
+    persistent mesh cache only the cells that changed are meshed again.
+
+    Args:
+        max_designs: Number of designs kept loaded.
+        mesh_cache: Optional MeshCache shared by all designs.
+    """
+
+    def __init__(self, max_designs=4, mesh_cache=None):
+        self.designs = LruCache(max_designs)
+        self.layerstacks = LruCache(16)
+        self.responses = LruCache(16)
+        self.mesh_cache = mesh_cache
+        self.requests = 0
+
+    def layerstack(self, path):
+        """Returns (key, layerstack dictionary) of a layerstack file, or (None, None) to guess it."""
+        if path is None:
+            return None, None
+        for place in look_for_places:
+            if not os.path.exists(path) and os.path.exists(os.path.join(place, path)):
+                path = os.path.join(place, path)
+        key = (os.path.abspath(path), os.stat(path).st_mtime)
+        layerstack = self.layerstacks.get(key)
+        if layerstack is None:
+            layerstack = read_layerstack_from_file(path)
+            self.layerstacks.put(key, layerstack)
+        return key, layerstack
+
+    def converter(self, gds_path, layerstack_path=None, shape_instancing=None, dedup=True):
+        """Returns the loaded Converter of a design, loading it on first use or after a change."""
+        gds_path = os.path.abspath(gds_path)
+        mtime = os.stat(gds_path).st_mtime
+        layerstack_key, layerstack = self.layerstack(layerstack_path)
+        key = (gds_path, layerstack_key, shape_instancing, dedup)
+        entry = self.designs.get(key)
+        if entry is None or entry[0] != mtime:
+            converter = Converter(gds_path, layerstack, shape_instancing=shape_instancing,
+                                  dedup=dedup, mesh_cache=self.mesh_cache).load()
+            entry = (mtime, converter)
+            self.designs.put(key, entry)
+        return entry[1]
+
+    def design_version(self, params):
+        """Returns the modification times of the files a request depends on."""
+        paths = [params["gds"]] + ([params["layerstack"]] if params.get("layerstack") else [])
+        return tuple(os.stat(path).st_mtime if os.path.exists(path) else None for path in paths)
+
+    def convert(self, params):
+        """Converts one request.
+
+        Args:
+            params: Dictionary of query parameters: gds (required), layerstack,
+                top, layers (comma separated), zmin, zmax, max_depth, flatten,
+                instancing, node_bounds, shape_instancing, dedup and format (glb or gltf).
+
+        Returns:
+            (content type, bytes) of the GLB file or the .gltf JSON with an
+            embedded data URI buffer.
+        """
+        def flag(name, default=False):
+            return params.get(name, "1" if default else "0").lower() in ("1", "true", "yes")
+        def number(name, kind):
+            return kind(params[name]) if params.get(name) not in (None, "") else None
+
+        if not params.get("gds"):
+            raise ValueError("missing gds parameter")
+        self.requests += 1
+        response_key = (tuple(sorted(params.items())), self.design_version(params))
+        response = self.responses.get(response_key)
+        if response is not None:
+            return response
+        converter = self.converter(params["gds"], params.get("layerstack"),
+                                   number("shape_instancing", int), flag("dedup", True))
+        builder = converter.scene(top=params.get("top") or None,
+                                  layers=params["layers"].split(",") if params.get("layers") else None,
+                                  zmin=number("zmin", float), zmax=number("zmax", float),
+                                  max_depth=number("max_depth", int),
+                                  flatten=flag("flatten"), instancing=flag("instancing"),
+                                  node_bounds=flag("node_bounds"))
+        if params.get("format", "glb") == "gltf":
+            response = ("model/gltf+json", builder.to_bytes(binary=False))
+        else:
+            response = ("model/gltf-binary", builder.to_bytes())
+        self.responses.put(response_key, response)
+        return response
+
+    def status(self):
+        """Returns a JSON serializable summary of the cached designs."""
+        return {
+            'requests': self.requests,
+            'designs': [{'gds': key[0], 'layerstack': key[1][0] if key[1] else None,
+                         'cells': len(converter.gdsii.cells), 'meshes': len(converter.layer_meshes)}
+                        for key, (_, converter) in self.designs.entries.items()],
+            'layerstacks': len(self.layerstacks),
+            'responses': len(self.responses),
+            'mesh_cache': {'hits': self.mesh_cache.hits, 'misses': self.mesh_cache.misses}
+                          if self.mesh_cache is not None else None,
+        }
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+    """HTTPServer counterpart listening on a Unix domain socket."""
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+def serve(args):
+    """Runs the conversion daemon until interrupted.
+
+    ADDRESS is "HOST:PORT", "PORT" or the path of a Unix socket. Requests:
+        GET /convert?gds=/path/file.gds&top=cell&layers=Metal1,Metal2&...
+            returns the GLB (or .gltf with format=gltf), see ConversionService.convert
+        GET /status
+            returns the cache contents as JSON
+    """
+    mesh_cache = MeshCache(args.cache, int(args.cache_size * 2**20)) if args.cache else None
+    service = ConversionService(args.serve_designs, mesh_cache)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def reply(self, code, content_type, body):
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            params = dict(urllib.parse.parse_qsl(url.query))
+            t_start = time.time()
+            try:
+                if url.path == "/convert":
+                    content_type, body = service.convert(params)
+                elif url.path == "/status":
+                    content_type, body = "application/json", json.dumps(service.status()).encode()
+                else:
+                    self.reply(404, "text/plain", b"unknown path\n")
+                    return
+            except (FileNotFoundError, KeyError) as e:
+                message = e.args[0] if isinstance(e, KeyError) else e
+                self.reply(404, "text/plain", f"{message}\n".encode())
+                return
+            except ValueError as e:
+                self.reply(400, "text/plain", f"{e}\n".encode())
+                return
+            except Exception as e:
+                self.reply(500, "text/plain", f"conversion failed: {e}\n".encode())
+                return
+            self.reply(200, content_type, body)
+            print(f"{url.path} {params.get('gds', '')} {params.get('top', '')}: "
+                  f"{len(body)} bytes in {time.time() - t_start:.3f} seconds")
+
+    if "/" in args.serve:
+        if os.path.exists(args.serve):
+            if not stat.S_ISSOCK(os.stat(args.serve).st_mode):
+                print(f"Error: {args.serve} exists and is not a socket")
+                sys.exit(1)
+            os.remove(args.serve) # stale socket of a previous daemon
+        server = UnixHTTPServer(args.serve, Handler)
+    else:
+        host, _, port = args.serve.rpartition(":")
+        server = http.server.HTTPServer((host or "127.0.0.1", int(port)), Handler)
+    print(f"Serving conversions on {args.serve} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if "/" in args.serve and os.path.exists(args.serve) and stat.S_ISSOCK(os.stat(args.serve).st_mode):
+            os.remove(args.serve)
+
+def convert(args):
+    """Runs one conversion of args.gds with the parsed command line options.
+
+    Returns:
+        False if the output failed validation.
+    """
+    t_start = time.time()
+    output_path = args.gds + ".gltf"
+    incremental = args.incremental or args.watch
+    if args.cache:
+        mesh_cache = MeshCache(args.cache, int(args.cache_size * 2**20))
+    elif incremental:
+        # private cache next to the output, holding exactly the meshes of the last run
+        mesh_cache = MeshCache(output_path + ".cache", float('inf'))
+    else:
+        mesh_cache = None
+
+    memory_budget = int(args.memory_budget * 2**20) if args.memory_budget else None
+    checkpoint_dir = output_path + ".checkpoint"
+    profiler = Profiler(trace=args.profile is not None, profile_workers=args.profile_workers,
+                        memory=args.profile is not None or memory_budget is not None, trace_memory=args.trace_memory)
+    try:
+        converter = Converter(args.gds, args.layerstack, shape_instancing=args.shape_instancing,
+                              dedup=args.dedup, mesh_cache=mesh_cache, profiler=profiler,
+                              memory_budget=memory_budget, spill_dir=args.spill_dir,
+                              vertex_cache=args.vertex_cache, backend=args.backend).load()
+        selection = dict(layers=args.layers.split(",") if args.layers else None,
+                         zmin=args.zmin, zmax=args.zmax, max_depth=args.max_depth)
+        scene_options = dict(flatten=args.flatten, instancing=args.instancing, max_mesh_vertices=args.max_mesh_vertices)
+        try:
+            # an empty selection would overwrite the output with one without geometry
+            converter.select_layers(selection['layers'], args.zmin, args.zmax)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return False
+        if mesh_cache is None and (args.checkpoint or args.resume):
+            # finished meshes go to a checkpoint next to the output, removed when the output is written
+            state = checkpoint_state(args.gds, converter.layerstack, list(converter.mesh_options()))
+            converter.mesh_cache = open_checkpoint(checkpoint_dir, state, args.resume)
+        elif args.resume:
+            print("Resuming from the mesh cache")
+        if incremental:
+            layerstack = converter.select_layers(selection['layers'], args.zmin, args.zmax)
+            fingerprints = converter.layer_fingerprints(**selection)
+            manifest = read_manifest(output_path + ".manifest.json")
+            changed = changed_cells(manifest, layerstack, fingerprints)
+            print(f"Incremental: {len(changed)} of {len(fingerprints)} cells changed")
+
+        valid = True
+        try:
+            if args.stream and not args.flatten:
+                converter.stream(output_path, validate=args.validate, instancing=args.instancing,
+                                 max_mesh_vertices=args.max_mesh_vertices, node_bounds=args.node_bounds, **selection)
+            else:
+                if args.stream:
+                    print("--flatten bakes all meshes at once and is not streamed")
+                converter.write(output_path, validate=args.validate, node_bounds=args.node_bounds,
+                                **scene_options, **selection)
+        except GltfValidationError as e:
+            print(f"Error: {e}, {output_path} is broken")
+            valid = False
+        converter.close()
+        if converter.mesh_cache is not None and converter.mesh_cache is not mesh_cache:
+            converter.mesh_cache.db.close()
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        if profiler.counters.get("spilled_meshes"):
+            print(f"Spilled {profiler.counters['spilled_meshes']} meshes "
+                  f"({profiler.counters['spilled_bytes'] / 2**20:.0f} MB) to stay within the memory budget")
+        if incremental:
+            with profiler.span("manifest"):
+                write_manifest(output_path + ".manifest.json", args.gds, layerstack, fingerprints)
+                if not args.cache:
+                    mesh_cache.prune()
+        # gltf.save("output.gltf")
+        #export_glb(gdsii_file_path + ".glb")
+
+        print(profiler.summary_line())
+        if args.profile:
+            profiler.write(args.profile)
+        t_end = time.time()
+        print(f"Done in {t_end - t_start:.2f} seconds")
+        return valid
+    finally:
+        profiler.close()
+
+def estimate(args):
+    """Prints (and with --estimate-json saves) the estimate of the conversion args describe.
+
+    Returns:
+        False if the layer selection matches no layer.
+    """
+    t_start = time.time()
+    converter = Converter(args.gds, args.layerstack, shape_instancing=args.shape_instancing, dedup=args.dedup).load()
+    try:
+        report = converter.estimate(layers=args.layers.split(",") if args.layers else None, zmin=args.zmin,
+                                    zmax=args.zmax, max_depth=args.max_depth, flatten=args.flatten,
+                                    instancing=args.instancing, max_mesh_vertices=args.max_mesh_vertices)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return False
+    print_estimate(report)
+    if args.estimate_json:
+        with open(args.estimate_json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Estimate written to {args.estimate_json}")
+    print(f"Estimated in {time.time() - t_start:.2f} seconds")
+    return True
+
+def catalog(args):
+    """Exports the cells of args.catalog as a GLB pack with a JSON index (see Converter.catalog).
+
+    Returns:
+        False if a cell failed validation.
+    """
+    t_start = time.time()
+    mesh_cache = MeshCache(args.cache, int(args.cache_size * 2**20)) if args.cache else None
+    converter = Converter(args.gds, args.layerstack, shape_instancing=args.shape_instancing, dedup=args.dedup,
+                          mesh_cache=mesh_cache, vertex_cache=args.vertex_cache, backend=args.backend).load()
+    try:
+        index = converter.catalog(args.gds + ".catalog.bin", args.gds + ".catalog.json",
+                                  cells=args.catalog.split(",") if args.catalog != "*" else None,
+                                  validate=args.validate, layers=args.layers.split(",") if args.layers else None,
+                                  zmin=args.zmin, zmax=args.zmax, max_depth=args.max_depth, flatten=args.flatten,
+                                  instancing=args.instancing, max_mesh_vertices=args.max_mesh_vertices,
+                                  node_bounds=args.node_bounds)
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e.args[0]}")
+        return False
+    broken = [entry['name'] for entry in index['cells'] if 'errors' in entry]
+    if broken:
+        print(f"Error: {len(broken)} of {len(index['cells'])} cells failed validation")
+    print(converter.profiler.summary_line())
+    print(f"Done in {time.time() - t_start:.2f} seconds")
+    return not broken
+
+def split_layers(args):
+    """Exports one GLB per layer or group of args.split_layers into file.gds.layers (see Converter.split_layers).
+
+    Returns:
+        False if a file failed validation.
+    """
+    t_start = time.time()
+    mesh_cache = MeshCache(args.cache, int(args.cache_size * 2**20)) if args.cache else None
+    converter = Converter(args.gds, args.layerstack, shape_instancing=args.shape_instancing, dedup=args.dedup,
+                          mesh_cache=mesh_cache, vertex_cache=args.vertex_cache, backend=args.backend).load()
+    groups = [group.split("+") for group in args.split_layers.split(",")] if args.split_layers != "*" else None
+    try:
+        manifest = converter.split_layers(args.gds + ".layers", groups, validate=args.validate,
+                                          layers=args.layers.split(",") if args.layers else None,
+                                          zmin=args.zmin, zmax=args.zmax, max_depth=args.max_depth,
+                                          flatten=args.flatten, instancing=args.instancing,
+                                          max_mesh_vertices=args.max_mesh_vertices, node_bounds=args.node_bounds)
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e.args[0]}")
+        return False
+    broken = [entry['file'] for entry in manifest['groups'] if 'errors' in entry]
+    if broken:
+        print(f"Error: {len(broken)} of {len(manifest['groups'])} files failed validation")
+    print(converter.profiler.summary_line())
+    print(f"Done in {time.time() - t_start:.2f} seconds")
+    return not broken
+
+def batch_inputs(patterns):
+    """Expands glob patterns and "@list.txt" files (one path per line) into a list of GDSII files."""
+    paths = []
+    for pattern in patterns:
+        if pattern.startswith("@"):
+            with open(pattern[1:]) as f:
+                names = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        else:
+            # a pattern without matches is kept, so its file is reported as failed
+            names = sorted(glob.glob(pattern)) or [pattern]
+        paths += [name for name in names if name not in paths]
+    return paths
+
+def batch(args):
+    """Converts every GDSII file of args.batch with one worker pool and one mesh cache.
+
+    The meshing jobs of the next file are submitted before the current file
+    is assembled and written, so the workers keep busy while the main process
+    reads, builds and writes. Meshes shared between the files (standard cells)
+    are meshed once. A file that fails is reported and the others go on.
+
+    Returns:
+        The number of files that failed.
+    """
+    t_start = time.time()
+    paths = batch_inputs(args.batch)
+    if args.cache:
+        mesh_cache = MeshCache(args.cache, int(args.cache_size * 2**20))
+    else:
+        mesh_cache = MemoryMeshCache(int(args.cache_size * 2**20))
+    layerstack = read_layerstack_from_file(args.layerstack) if args.layerstack else None
+    candidates = find_layerstacks() if layerstack is None else None
+    memory_budget = int(args.memory_budget * 2**20) if args.memory_budget else None
+    selection = dict(layers=args.layers.split(",") if args.layers else None,
+                     zmin=args.zmin, zmax=args.zmax, max_depth=args.max_depth)
+    scene_options = dict(flatten=args.flatten, instancing=args.instancing, max_mesh_vertices=args.max_mesh_vertices,
+                         node_bounds=args.node_bounds)
+    pool = worker_pool(args.backend, multiprocessing.cpu_count()) if args.backend != "serial" else None
+    failed = {}
+
+    def start(path):
+        """Loads path and submits its meshing jobs; returns (converter, handle) or None if it failed."""
+        try:
+            converter = Converter(path, layerstack, shape_instancing=args.shape_instancing, dedup=args.dedup,
+                                  mesh_cache=mesh_cache, memory_budget=memory_budget, spill_dir=args.spill_dir,
+                                  pool=pool, layerstack_candidates=candidates, vertex_cache=args.vertex_cache,
+                                  backend=args.backend).load()
+            return converter, converter.start_meshing(**selection)
+        except Exception as e:
+            print(f"Error: {path}: {e}")
+            failed[path] = e
+            return None
+
+    def finish(path, converter, handle):
+        """Collects the meshes of path and writes its output."""
+        try:
+            converter.finish_meshing(handle)
+            converter.write(path + ".gltf", validate=args.validate, **scene_options, **selection)
+        except Exception as e:
+            mesh_cache.release(handle['reserved'])
+            print(f"Error: {path}: {e}")
+            failed[path] = e
+        finally:
+            converter.close()
+
+    try:
+        print(f"Batch: {len(paths)} files")
+        pending = None
+        for number, path in enumerate(paths, 1):
+            print(f"[{number}/{len(paths)}] {path}")
+            started = start(path)
+            if pending is not None:
+                finish(*pending)
+            pending = (path, *started) if started is not None else None
+        if pending is not None:
+            finish(*pending)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    print(f"Batch: {len(paths) - len(failed)} converted, {len(failed)} failed, "
+          f"{mesh_cache.hits} meshes shared in {time.time() - t_start:.2f} seconds")
+    for path, error in failed.items():
+        print(f"  failed: {path}: {error}")
+    return len(failed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a GDSII layout file to a glTF 3D file.")
+    parser.add_argument("gds", nargs="?", help="GDSII file")
+    parser.add_argument("layerstack", nargs="?", help="layerstack file (guessed from the GDSII layers if omitted)")
+    parser.add_argument("--layerstack", dest="layerstack_file", metavar="FILE", help="layerstack file, same as the positional argument")
+    parser.add_argument("--batch", nargs="+", metavar="PATTERN",
+                        help="convert every matching GDSII file (globs, @list.txt) with one shared worker pool and mesh cache")
+    parser.add_argument("--catalog", nargs="?", const="*", metavar="CELLS",
+                        help="export every top cell, or the cells matching CELLS (comma separated, wildcards allowed), "
+                             "as one GLB each into file.gds.catalog.bin with a JSON index")
+    parser.add_argument("--split-layers", nargs="?", const="*", metavar="GROUPS",
+                        help="write one GLB per layer, or per group in GROUPS (e.g. Metal1+Via1,Metal2,TopMetal*), "
+                             "into file.gds.layers with a manifest.json")
+    parser.add_argument("--layers", help="comma separated layer names to export, wildcards allowed (e.g. Metal1,Via1,Metal2)")
+    parser.add_argument("--zmin", type=float, help="skip layers lying completely below this z value")
+    parser.add_argument("--zmax", type=float, help="skip layers lying completely above this z value")
+    parser.add_argument("--max-depth", type=int, help="hierarchy depth to mesh; deeper subtrees become one bounding box per layer")
+    parser.add_argument("--flatten", action="store_true", help="bake all instances into world space, one merged mesh per layer")
+    parser.add_argument("--instancing", action="store_true", help="draw repeated cells and arrays with EXT_mesh_gpu_instancing")
+    parser.add_argument("--node-bounds", action="store_true",
+                        help="add local and world bounding boxes to the extras of instance and group nodes")
+    parser.add_argument("--shape-instancing", type=int, metavar="N", help="instance shapes repeated more than N times within a cell layer (vias, contacts)")
+    parser.add_argument("--vertex-cache", action="store_true",
+                        help="reorder triangles and vertices for the GPU vertex cache and print the ACMR before and after")
+    parser.add_argument("--backend", choices=BACKENDS, default="process",
+                        help="run the meshing in worker processes, in threads of this process (for free-threaded "
+                             "Python builds) or serially (default: process)")
+    parser.add_argument("--dedup", action=argparse.BooleanOptionalAction, default=True, help="share meshes between cells with identical layer geometry")
+    parser.add_argument("--cache", nargs="?", const=os.path.expanduser("~/.cache/gdst/meshes"), metavar="DIR",
+                        help="persistent mesh cache directory shared between runs (default ~/.cache/gdst/meshes)")
+    parser.add_argument("--cache-size", type=float, default=4096, metavar="MB", help="mesh cache size limit, least recently used entries are evicted")
+    parser.add_argument("--validate", action=argparse.BooleanOptionalAction, default=True,
+                        help="check indices, NaNs, accessor bounds and the node graph of the output; exit 1 if broken")
+    parser.add_argument("--max-mesh-vertices", type=int, default=max_mesh_vertices, help="split flattened layer meshes above this vertex count")
+    parser.add_argument("--incremental", action="store_true", help="only re-mesh cells that changed since the last run of this output")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="store finished meshes in OUTPUT.checkpoint until the output is written, so --resume "
+                             "can continue a killed run (one file per mesh, slows the mesh stage down)")
+    parser.add_argument("--resume", action="store_true", help="reuse the meshes of an interrupted --checkpoint run with the same input and mesh options")
+    parser.add_argument("--watch", action="store_true", help="regenerate incrementally whenever the GDSII file changes")
+    parser.add_argument("--watch-interval", type=float, default=1.0, metavar="SECONDS", help="polling interval of --watch")
+    parser.add_argument("--profile", metavar="FILE", help="write per-stage spans and per-cell counters as a Chrome trace JSON file")
+    parser.add_argument("--profile-workers", action="store_true", help="with --profile, also run the meshing workers under cProfile")
+    parser.add_argument("--trace-memory", action="store_true", help="record the peak Python/NumPy allocations of each stage with tracemalloc (slow)")
+    parser.add_argument("--memory-budget", type=float, metavar="MB",
+                        help="spill finished meshes to memory mapped temporary files when the process grows beyond this size")
+    parser.add_argument("--spill-dir", metavar="DIR", help="directory for the --memory-budget spill files (default: system temp directory)")
+    parser.add_argument("--stream", action="store_true",
+                        help="mesh, assemble and write the cells as a pipeline, keeping only the meshes in flight in memory")
+    parser.add_argument("--estimate", action="store_true",
+                        help="only predict triangles, nodes and output size from polygon counts, without meshing")
+    parser.add_argument("--estimate-json", metavar="FILE", help="with --estimate, also save the estimate as JSON")
+    parser.add_argument("--serve", nargs="?", const="127.0.0.1:8765", metavar="ADDRESS",
+                        help="run as conversion daemon on HOST:PORT or a Unix socket path (default 127.0.0.1:8765)")
+    parser.add_argument("--serve-designs", type=int, default=4, metavar="N", help="number of designs the daemon keeps loaded")
+    args = parser.parse_args()
+    args.layerstack = args.layerstack or args.layerstack_file
 
-    print ("\nWriting glTF file:")
-    gltf.save(gdsii_file_path + ".gltf")
-    # gltf.save("output.gltf")
-    #export_glb(gdsii_file_path + ".glb")
+    if args.serve:
+        serve(args)
+    elif args.batch:
+        if args.gds is not None:
+            parser.error("give the layerstack of --batch with --layerstack")
+        sys.exit(1 if batch(args) else 0)
+    elif args.gds is None:
+        parser.error("the GDSII file is required")
+    elif args.profile_workers and not args.profile:
+        parser.error("--profile-workers requires --profile")
+    elif args.estimate or args.estimate_json:
+        if not estimate(args):
+            sys.exit(1)
+    elif args.catalog:
+        if not catalog(args):
+            sys.exit(1)
+    elif args.split_layers:
+        if not split_layers(args):
+            sys.exit(1)
+    elif args.watch:
+        watch(args)
+    elif not convert(args):
+        sys.exit(1)
 
-    print('Done.')
-    t_end = time.time()
-    print(f"Total time: {t_end - t_start:.5f} seconds")
\ No newline at end of file
@@ -3,8 +3,17 @@
 #include <unordered_set>
 #include <cstdio>
 #include <cstdlib>
+#include <fstream>
+#include <sstream>
+#include <vector>
+#include <set>
+#include <cstring>
+#include <cerrno>
+#include <ctime>
+#include <fcntl.h>
 #include <unistd.h>
 #include <sys/stat.h>
+#include <sys/wait.h>
 #include <curl/curl.h>
 
 int main(int argc, char* argv[]) {
@@ -27,15 +36,21 @@ int main(int argc, char* argv[]) {
         std::string command = argv[1];
 
         if (command == "list_cells" || command == "lc") {
+            // Answered from the cell index, so shell completion stays fast on big files
             std::string filename;
-            auto lib = read_gds_file(result, filename);
-            if (lib == nullptr) {
-                return 1;
+            if (!result.count("file")) {
+                filename = get_filename_from_file();
+                if (filename == "") {
+                    printf("Error: GDSII file not specified\n");
+                    return 1;
+                }
+            } else {
+                filename = result["file"].as<std::string>();
             }
 
-
-            list_cells(*lib);
-            lib->free_all();
+            if (list_cells_indexed(filename) != 0) {
+                return 1;
+            }
             save_filename_to_file(filename);
 
             return 0;
@@ -84,17 +99,10 @@ int main(int argc, char* argv[]) {
             if(!result.count("layerstack")) {
                 layerstack = "";
             } else {
-                if(!check_file_exists(result["layerstack"].as<std::string>())) {
-                    if(!check_file_exists("/usr/local/share/gdst/" + result["layerstack"].as<std::string>())) {
-                        printf("Error: Layer stack file does not exist\n");
-                        return 1;
-
-                    } else {
-                        layerstack = "/usr/local/share/gdst/" + result["layerstack"].as<std::string>();
-                    }
-
-                } else {
-                    layerstack = result["layerstack"].as<std::string>();
+                layerstack = find_layerstack_file(result["layerstack"].as<std::string>());
+                if (layerstack == "") {
+                    printf("Error: Layer stack file does not exist\n");
+                    return 1;
                 }
             }
 
@@ -102,6 +110,30 @@ int main(int argc, char* argv[]) {
 
             return 0;
 
+        } else if (command == "stats" || command == "st") {
+            // Dry run of the conversion: counts and predicted size from gds2gltf --estimate
+            std::string filename;
+            std::string layerstack;
+            if (!result.count("file")) {
+                filename = get_filename_from_file();
+                if (filename == "") {
+                    printf("Error: GDSII file not specified\n");
+                    return 1;
+                }
+            } else {
+                filename = result["file"].as<std::string>();
+            }
+
+            if (result.count("layerstack")) {
+                layerstack = find_layerstack_file(result["layerstack"].as<std::string>());
+                if (layerstack == "") {
+                    printf("Error: Layer stack file does not exist\n");
+                    return 1;
+                }
+            }
+
+            return print_design_stats(filename, layerstack);
+
         } else {
             printf("Invalid command\n");
             print_help(options);
@@ -120,6 +152,7 @@ int print_help(cxxopts::Options& options) {
     printf("  open_3d, o3d          - Open a 3D view of a GDSII file\n");
     printf("  open_3d_cell, ocv     - Open a 3D view of a cell\n");
     printf("  export_gltf, eg       - Export GDSII file to GLTF\n");
+    printf("  stats, st             - Print statistics and the predicted GLTF size\n");
     return 0;
 }
 
@@ -142,6 +175,17 @@ bool check_file_exists(const std::string& filename) {
     return (stat(filename.c_str(), &buffer) == 0);
 }
 
+std::string find_layerstack_file(const std::string& name) {
+    // The layerstack as given, or one of the installed ones, "" if neither exists
+    if (check_file_exists(name)) {
+        return name;
+    }
+    if (check_file_exists("/usr/local/share/gdst/" + name)) {
+        return "/usr/local/share/gdst/" + name;
+    }
+    return "";
+}
+
 int save_filename_to_file(const std::string& filename) {
     FILE* tmp_file = fopen("/var/tmp/.tmp_gdst_file", "w");
     if (tmp_file == NULL) {
@@ -162,8 +206,6 @@ int save_filename_to_file(const std::string& filename) {
 }
 
 std::unique_ptr<gdstk::Library> read_gds_file(cxxopts::ParseResult result, std::string& fname) {
-    double unit = 0;
-    double precision = 0;
     std::string filename;
     if (!result.count("file")) {
         filename = get_filename_from_file();
@@ -179,16 +221,22 @@ std::unique_ptr<gdstk::Library> read_gds_file(cxxopts::ParseResult result, std::
     // Copy filename to fname
     fname = filename;
 
+    return load_gds_library(filename);
+}
+
+std::unique_ptr<gdstk::Library> load_gds_library(const std::string& filename) {
+    double unit = 0;
+    double precision = 0;
     gdstk::ErrorCode error_code = gdstk::gds_units(filename.c_str(), unit, precision);
     if (error_code != gdstk::ErrorCode::NoError) {
-        printf("Failed to load GDS file: %s with code %d\n", filename, error_code);
+        printf("Failed to load GDS file: %s with code %d\n", filename.c_str(), error_code);
         return nullptr;
     }
     auto lib = std::make_unique<gdstk::Library>();
     *lib = gdstk::read_gds(filename.c_str(), unit, precision, nullptr, &error_code);
 
     if (error_code != gdstk::ErrorCode::NoError) {
-        printf("Failed to load GDS file: %s with code %d\n", filename, error_code);
+        printf("Failed to load GDS file: %s with code %d\n", filename.c_str(), error_code);
         return nullptr;
     }
 
@@ -204,6 +252,234 @@ int list_cells(gdstk::Library lib) {
     return 0;
 }
 
+// CELL INDEX
+// Cell names, top cells, polygon counts and layers of a GDSII file are kept in
+// a small text file under ~/.cache/gdst/index, so list_cells and the shell
+// completion do not have to read a multi-GB file on every tab press. The file
+// is shared with src/list_cells.py:
+//     gdst-cell-index 1
+//     path    /abs/path/design.gds
+//     size    <bytes>
+//     mtime   <ns>
+//     top     <cell> <cell> ...
+//     cell    <name> <polygons> <layer/datatype,layer/datatype,...>
+// with tab separated fields. The index is stale when size or mtime differ.
+
+std::string cell_index_path(const std::string& full_path) {
+    // FNV-1a hash of the absolute GDSII path, the same in list_cells.py
+    uint64_t hash = 14695981039346656037ULL;
+    for (unsigned char c : full_path) {
+        hash = (hash ^ c) * 1099511628211ULL;
+    }
+    char name[32];
+    snprintf(name, sizeof(name), "%016llx.idx", (unsigned long long)hash);
+
+    const char* cache_home = getenv("XDG_CACHE_HOME");
+    const char* home = getenv("HOME");
+    std::string dir;
+    if (cache_home != NULL && cache_home[0] != '\0') {
+        dir = std::string(cache_home) + "/gdst/index";
+    } else {
+        dir = std::string(home != NULL ? home : "/var/tmp") + "/.cache/gdst/index";
+    }
+    return dir + "/" + name;
+}
+
+bool gds_file_stamp(const std::string& filename, long long& size, long long& mtime) {
+    struct stat st;
+    if (stat(filename.c_str(), &st) != 0) {
+        return false;
+    }
+    size = (long long)st.st_size;
+#ifdef __APPLE__
+    mtime = (long long)st.st_mtimespec.tv_sec * 1000000000LL + st.st_mtimespec.tv_nsec;
+#else
+    mtime = (long long)st.st_mtim.tv_sec * 1000000000LL + st.st_mtim.tv_nsec;
+#endif
+    return true;
+}
+
+bool make_directories(const std::string& dir) {
+    // mkdir -p without a shell: create every missing component of dir
+    for (size_t pos = dir.find('/', 1); ; pos = dir.find('/', pos + 1)) {
+        std::string part = dir.substr(0, pos);
+        if (!part.empty() && mkdir(part.c_str(), 0755) != 0 && errno != EEXIST) {
+            return false;
+        }
+        if (pos == std::string::npos) {
+            return true;
+        }
+    }
+}
+
+bool read_cell_index(const std::string& index_path, CellIndex& index) {
+    std::ifstream file(index_path);
+    std::string line;
+    if (!std::getline(file, line) || line != "gdst-cell-index 1") {
+        return false;
+    }
+    while (std::getline(file, line)) {
+        std::vector<std::string> fields;
+        std::stringstream stream(line);
+        std::string field;
+        while (std::getline(stream, field, '\t')) {
+            fields.push_back(field);
+        }
+        if (fields.size() < 2) {
+            continue;
+        }
+        try {
+            if (fields[0] == "path") {
+                index.path = fields[1];
+            } else if (fields[0] == "size") {
+                index.size = std::stoll(fields[1]);
+            } else if (fields[0] == "mtime") {
+                index.mtime = std::stoll(fields[1]);
+            } else if (fields[0] == "top") {
+                index.top_cells.assign(fields.begin() + 1, fields.end());
+            } else if (fields[0] == "cell" && fields.size() >= 3) {
+                CellInfo cell;
+                cell.name = fields[1];
+                cell.polygons = std::stoll(fields[2]);
+                cell.layers = fields.size() > 3 ? fields[3] : "";
+                index.cells.push_back(cell);
+            }
+        } catch (const std::exception&) {
+            return false; // damaged index, rebuild it
+        }
+    }
+    return true;
+}
+
+int build_cell_index(const std::string& full_path, const std::string& index_path) {
+    long long size, mtime;
+    if (!gds_file_stamp(full_path, size, mtime)) {
+        printf("Error: cannot stat %s\n", full_path.c_str());
+        return 1;
+    }
+    auto lib = load_gds_library(full_path);
+    if (lib == nullptr) {
+        return 1;
+    }
+
+    std::ostringstream out;
+    out << "gdst-cell-index 1\npath\t" << full_path << "\nsize\t" << size << "\nmtime\t" << mtime << "\ntop";
+    gdstk::Array<gdstk::Cell*> top_cells = {};
+    gdstk::Array<gdstk::RawCell*> top_rawcells = {};
+    lib->top_level(top_cells, top_rawcells);
+    for (uint64_t i = 0; i < top_cells.count; i++) {
+        out << "\t" << top_cells[i]->name;
+    }
+    out << "\n";
+    top_cells.clear();
+    top_rawcells.clear();
+
+    for (uint64_t i = 0; i < lib->cell_array.count; i++) {
+        gdstk::Cell* cell = lib->cell_array[i];
+        std::set<std::pair<uint32_t, uint32_t>> layers;
+        long long polygons = cell->polygon_array.count;
+        for (uint64_t j = 0; j < cell->polygon_array.count; j++) {
+            gdstk::Tag tag = cell->polygon_array[j]->tag;
+            layers.insert({gdstk::get_layer(tag), gdstk::get_type(tag)});
+        }
+        for (uint64_t j = 0; j < cell->flexpath_array.count; j++) {
+            gdstk::FlexPath* path = cell->flexpath_array[j];
+            polygons += path->num_elements;
+            for (uint64_t k = 0; k < path->num_elements; k++) {
+                layers.insert({gdstk::get_layer(path->elements[k].tag), gdstk::get_type(path->elements[k].tag)});
+            }
+        }
+        for (uint64_t j = 0; j < cell->robustpath_array.count; j++) {
+            gdstk::RobustPath* path = cell->robustpath_array[j];
+            polygons += path->num_elements;
+            for (uint64_t k = 0; k < path->num_elements; k++) {
+                layers.insert({gdstk::get_layer(path->elements[k].tag), gdstk::get_type(path->elements[k].tag)});
+            }
+        }
+        out << "cell\t" << cell->name << "\t" << polygons << "\t";
+        bool first = true;
+        for (const auto& layer : layers) {
+            out << (first ? "" : ",") << layer.first << "/" << layer.second;
+            first = false;
+        }
+        out << "\n";
+    }
+    lib->free_all();
+
+    // write to a temporary file, so readers never see a partial index
+    std::string dir = index_path.substr(0, index_path.rfind('/'));
+    if (!make_directories(dir)) {
+        return 1;
+    }
+    std::string tmp_path = index_path + "." + std::to_string(getpid()) + ".tmp";
+    std::ofstream file(tmp_path);
+    file << out.str();
+    file.close();
+    if (!file || rename(tmp_path.c_str(), index_path.c_str()) != 0) {
+        remove(tmp_path.c_str());
+        return 1;
+    }
+    return 0;
+}
+
+void rebuild_cell_index_in_background(const std::string& full_path, const std::string& index_path) {
+    // One rebuild at a time: the lock file is removed when the rebuild is done,
+    // a lock older than ten minutes is left over from a crashed rebuild
+    std::string lock_path = index_path + ".lock";
+    struct stat st;
+    if (stat(lock_path.c_str(), &st) == 0 && time(NULL) - st.st_mtime < 600) {
+        return;
+    }
+    int lock = open(lock_path.c_str(), O_CREAT | O_WRONLY | O_TRUNC, 0644);
+    if (lock < 0) {
+        return;
+    }
+    close(lock);
+
+    fflush(stdout);
+    pid_t pid = fork();
+    if (pid == 0) {
+        // detach from the shell, which waits for the end of our stdout
+        setsid();
+        freopen("/dev/null", "w", stdout);
+        freopen("/dev/null", "w", stderr);
+        build_cell_index(full_path, index_path);
+        remove(lock_path.c_str());
+        _exit(0);
+    }
+    if (pid < 0) {
+        remove(lock_path.c_str());
+    }
+}
+
+int list_cells_indexed(const std::string& filename) {
+    char full_path[4096];
+    if (realpath(filename.c_str(), full_path) == NULL) {
+        printf("Failed to get the full path: %s\n", strerror(errno));
+        return 1;
+    }
+    std::string index_path = cell_index_path(full_path);
+
+    CellIndex index;
+    long long size = -1, mtime = -1;
+    gds_file_stamp(full_path, size, mtime);
+    if (!read_cell_index(index_path, index)) {
+        // first use: build the index now, the cell names are needed anyway
+        if (build_cell_index(full_path, index_path) != 0 || !read_cell_index(index_path, index)) {
+            return 1;
+        }
+    } else if (index.size != size || index.mtime != mtime) {
+        // stale: answer from the old index and refresh it for the next call
+        rebuild_cell_index_in_background(full_path, index_path);
+    }
+
+    for (const CellInfo& cell : index.cells) {
+        printf("%s ", cell.name.c_str());
+    }
+    printf("\n");
+    return 0;
+}
+
 int open_3d_cell(const std::string& filename, const std::string& cell_name) {
     // Run system command
     
@@ -224,8 +500,96 @@ int open_3d_cell(const std::string& filename, const std::string& cell_name) {
     return 0;
 }
 
+int fetch_gltf_from_server(const std::string& server, const std::string& filename, const std::string& layerstack) {
+    // Ask a running "gds2gltf --serve" daemon for the conversion. It keeps the
+    // design and its meshes loaded, so repeated exports skip the Python start-up.
+    // server is a URL (http://127.0.0.1:8765) or the path of the daemon's Unix socket.
+    char full_path[4096];
+    if (realpath(filename.c_str(), full_path) == NULL) {
+        return 1;
+    }
+
+    CURL *curl = curl_easy_init();
+    if (!curl) {
+        return 1;
+    }
+    char* gds = curl_easy_escape(curl, full_path, 0);
+    std::string url;
+    if (server[0] == '/') {
+        curl_easy_setopt(curl, CURLOPT_UNIX_SOCKET_PATH, server.c_str());
+        url = "http://localhost";
+    } else {
+        url = server;
+    }
+    url += "/convert?format=gltf&gds=" + std::string(gds);
+    curl_free(gds);
+    if (layerstack != "") {
+        char full_layerstack[4096];
+        const char* path = realpath(layerstack.c_str(), full_layerstack) ? full_layerstack : layerstack.c_str();
+        char* ls = curl_easy_escape(curl, path, 0);
+        url += "&layerstack=" + std::string(ls);
+        curl_free(ls);
+    }
+
+    // write to a temporary file, so a failed request leaves no partial output
+    std::string output_filename = filename + ".gltf";
+    std::string tmp_filename = output_filename + ".tmp";
+    FILE* output = fopen(tmp_filename.c_str(), "wb");
+    if (output == NULL) {
+        curl_easy_cleanup(curl);
+        return 1;
+    }
+    curl_easy_setopt(curl, CURLOPT_URL, url.c_str());
+    curl_easy_setopt(curl, CURLOPT_WRITEDATA, output);
+    CURLcode res = curl_easy_perform(curl);
+    long status = 0;
+    curl_easy_getinfo(curl, CURLINFO_RESPONSE_CODE, &status);
+    fclose(output);
+    curl_easy_cleanup(curl);
+
+    if (res != CURLE_OK || status != 200) {
+        printf("gds2gltf daemon at %s failed (%s, HTTP %ld), converting locally\n",
+               server.c_str(), curl_easy_strerror(res), status);
+        remove(tmp_filename.c_str());
+        return 1;
+    }
+    if (rename(tmp_filename.c_str(), output_filename.c_str()) != 0) {
+        printf("Cannot write %s (%s), converting locally\n", output_filename.c_str(), strerror(errno));
+        remove(tmp_filename.c_str());
+        return 1;
+    }
+    return 0;
+}
+
+int print_design_stats(const std::string& filename, const std::string& layerstack) {
+    // Run gds2gltf --estimate without a shell, so file names are passed as they are
+    std::vector<const char*> args = {"gds2gltf", filename.c_str()};
+    if (layerstack != "") {
+        args.push_back(layerstack.c_str());
+    }
+    args.push_back("--estimate");
+    args.push_back(NULL);
+
+    fflush(stdout);
+    pid_t pid = fork();
+    if (pid == 0) {
+        execvp(args[0], const_cast<char* const*>(args.data()));
+        printf("Error: cannot run gds2gltf: %s\n", strerror(errno));
+        printf("Check if gds2gltf and libraries is installed\n");
+        fflush(stdout);
+        _exit(127);
+    }
+    int status;
+    if (pid < 0 || waitpid(pid, &status, 0) < 0) {
+        printf("Error: cannot run gds2gltf: %s\n", strerror(errno));
+        return 1;
+    }
+    return WIFEXITED(status) ? WEXITSTATUS(status) : 1;
+}
+
 int export_gltf_file(const std::string& filename, const std::string& layerstack) {
-    // Call the Python script to perform the conversion
+    // Use the conversion daemon if GDS2GLTF_SERVER points to one
+    // Otherwise call the Python script to perform the conversion
     // If layerstack is not specified, dont include it in the command
     std::string command;
     if(layerstack == "") {
@@ -234,7 +598,14 @@ int export_gltf_file(const std::string& filename, const std::string& layerstack)
         command = "gds2gltf " + filename + " " + layerstack;
 
     }
-    int result = system(command.c_str());
+    const char* server = getenv("GDS2GLTF_SERVER");
+    int result = 1;
+    if (server != NULL && server[0] != '\0') {
+        result = fetch_gltf_from_server(server, filename, layerstack);
+    }
+    if (result != 0) {
+        result = system(command.c_str());
+    }
     
     if (result == 0) {
         printf("GLTF export successful\n");
@@ -4,19 +4,46 @@
 
 #include <gdstk/gdstk.hpp>
 #include <string>
+#include <vector>
 #include "cxxopts.hpp"
 
+// Cell index of a GDSII file, see cell_index_path() in gdst.cpp
+struct CellInfo {
+    std::string name;
+    long long polygons = 0;
+    std::string layers;     // "layer/datatype,..."
+};
+
+struct CellIndex {
+    std::string path;
+    long long size = -1;
+    long long mtime = -1;
+    std::vector<std::string> top_cells;
+    std::vector<CellInfo> cells;
+};
+
 
 // Function declarations
 int print_help(cxxopts::Options& options);
 
 std::string get_filename_from_file();
 bool check_file_exists(const std::string& filename);
+std::string find_layerstack_file(const std::string& name);
 int save_filename_to_file(const std::string& filename);
 std::unique_ptr<gdstk::Library> read_gds_file(cxxopts::ParseResult result, std::string& fname);
+std::unique_ptr<gdstk::Library> load_gds_library(const std::string& filename);
 
 int list_cells(gdstk::Library lib);
+std::string cell_index_path(const std::string& full_path);
+bool gds_file_stamp(const std::string& filename, long long& size, long long& mtime);
+bool make_directories(const std::string& dir);
+bool read_cell_index(const std::string& index_path, CellIndex& index);
+int build_cell_index(const std::string& full_path, const std::string& index_path);
+void rebuild_cell_index_in_background(const std::string& full_path, const std::string& index_path);
+int list_cells_indexed(const std::string& filename);
 int open_3d_cell(const std::string& filename, const std::string& cell_name);
+int fetch_gltf_from_server(const std::string& server, const std::string& filename, const std::string& layerstack);
+int print_design_stats(const std::string& filename, const std::string& layerstack);
 int export_gltf_file(const std::string& filename, const std::string& layerstack);
 
 #endif // GDSTOOL_H
@@ -1,85 +1,476 @@
-import pygltflib
-from pygltflib import GLTF2, Scene, Node, EXT_mesh_gpu_instancing, Accessor, BufferView, Buffer, Mesh
+#!/usr/bin/env python3
+"""
+This program optimizes glTF files written by gds2gltf
+
+USAGE:
+    - run "gtlf_instancing.py model.gltf [-o model_optimized.gltf]"
+OUTPUT:
+    - the file model_optimized.gltf (or .glb when the output name ends in .glb)
+
+The file is read as plain JSON and its buffer is decoded once. Then these
+passes run over the document:
+
+    1. identical accessors and meshes are deduplicated by content hash
+    2. meshes drawn by several nodes become one EXT_mesh_gpu_instancing node
+    3. sibling leaf nodes sharing a material are merged into one mesh
+    4. nodes without mesh and without children are dropped
+    5. unused meshes and accessors are removed and the buffer is compacted
+       into one 4-byte aligned bufferView per accessor
+
+Before/after sizes and node counts are printed at the end.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import struct
 import sys
 
-def identify_instancable_meshes(gltf: GLTF2):
-    """
-    Identify identical meshes that can be instanced. In this simplified case,
-    we assume meshes with identical geometry (same buffer views, accessors, etc.)
-    can be instanced.
+import numpy as np
+
+COMPONENT_DTYPES = {5120: np.int8, 5121: np.uint8, 5122: np.int16,
+                    5123: np.uint16, 5125: np.uint32, 5126: np.float32}
+TYPE_SIZES = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT2": 4, "MAT3": 9, "MAT4": 16}
+GLB_JSON = 0x4E4F534A
+GLB_BIN = 0x004E4942
+INSTANCING = "EXT_mesh_gpu_instancing"
+
+########## INPUT / OUTPUT #####################################################
+
+def load_gltf(path):
+    """Reads a .gltf (data URI or external buffer) or .glb file.
+
+    Returns:
+        (doc, blob): the JSON document as a dictionary and the buffer contents.
     """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    blob = b""
+    if data[:4] == b"glTF":
+        length = struct.unpack_from("<I", data, 8)[0]
+        offset = 12
+        while offset < length:
+            chunk_length, chunk_type = struct.unpack_from("<II", data, offset)
+            chunk = data[offset + 8:offset + 8 + chunk_length]
+            if chunk_type == GLB_JSON:
+                doc = json.loads(chunk)
+            elif chunk_type == GLB_BIN:
+                blob = chunk
+            offset += 8 + chunk_length
+    else:
+        doc = json.loads(data)
+        buffers = doc.get("buffers", [])
+        uri = buffers[0].get("uri") if buffers else None
+        if uri is not None and uri.startswith("data:"):
+            blob = base64.b64decode(uri.split(",", 1)[1])
+        elif uri is not None:
+            with open(os.path.join(os.path.dirname(path), uri), 'rb') as f:
+                blob = f.read()
+    del data
+
+    if len(doc.get("buffers", [])) > 1:
+        sys.exit("Error: only glTF files with a single buffer are supported")
+    if any("sparse" in accessor for accessor in doc.get("accessors", [])):
+        sys.exit("Error: sparse accessors are not supported")
+    return doc, bytearray(blob)
+
+def save_gltf(doc, blob, path):
+    """Writes the document as .glb when path ends in .glb, else as .gltf with a data URI."""
+    doc["buffers"] = [{"byteLength": len(blob)}] if blob else []
+    if path.endswith(".glb"):
+        json_chunk = json.dumps(doc, separators=(",", ":")).encode()
+        json_chunk += b" " * (-len(json_chunk) % 4)
+        bin_chunk = bytes(blob) + b"\0" * (-len(blob) % 4)
+        length = 12 + 8 + len(json_chunk) + (8 + len(bin_chunk) if blob else 0)
+        with open(path, 'wb') as f:
+            f.write(struct.pack("<4sII", b"glTF", 2, length))
+            f.write(struct.pack("<II", len(json_chunk), GLB_JSON))
+            f.write(json_chunk)
+            if blob:
+                f.write(struct.pack("<II", len(bin_chunk), GLB_BIN))
+                f.write(bin_chunk)
+    else:
+        if blob:
+            doc["buffers"][0]["uri"] = "data:application/octet-stream;base64," + base64.b64encode(blob).decode()
+        with open(path, 'w') as f:
+            json.dump(doc, f, separators=(",", ":"))
+
+def accessor_bytes(doc, blob, index):
+    """Returns the tightly packed bytes of an accessor."""
+    accessor = doc["accessors"][index]
+    element = np.dtype(COMPONENT_DTYPES[accessor["componentType"]]).itemsize * TYPE_SIZES[accessor["type"]]
+    count = accessor["count"]
+    if "bufferView" not in accessor:
+        return bytes(element * count)
+    view = doc["bufferViews"][accessor["bufferView"]]
+    start = view.get("byteOffset", 0) + accessor.get("byteOffset", 0)
+    stride = view.get("byteStride", element)
+    if stride == element:
+        return bytes(blob[start:start + element * count])
+    strided = np.ndarray((count, element), dtype=np.uint8, buffer=blob, offset=start, strides=(stride, 1))
+    return strided.tobytes()
+
+def accessor_array(doc, blob, index):
+    """Returns an accessor as a numpy array of shape (count, components)."""
+    accessor = doc["accessors"][index]
+    data = np.frombuffer(accessor_bytes(doc, blob, index), dtype=COMPONENT_DTYPES[accessor["componentType"]])
+    return data.reshape(accessor["count"], TYPE_SIZES[accessor["type"]])
+
+def append_accessor(doc, blob, data, accessor_type, target=None):
+    """Appends a float32 or uint32 array to the blob and returns the index of its new accessor."""
+    blob.extend(b"\0" * (-len(blob) % 4))
+    view = {"buffer": 0, "byteOffset": len(blob), "byteLength": data.nbytes}
+    if target is not None:
+        view["target"] = target
+    doc.setdefault("bufferViews", []).append(view)
+    blob.extend(data.tobytes())
+    component_type = 5126 if data.dtype == np.float32 else 5125
+    flat = data.reshape(len(data), -1)
+    doc.setdefault("accessors", []).append({
+        "bufferView": len(doc["bufferViews"]) - 1, "componentType": component_type,
+        "count": len(data) if accessor_type != "SCALAR" else data.size, "type": accessor_type,
+        "max": flat.max(axis=0).tolist() if accessor_type != "SCALAR" else [flat.max().item()],
+        "min": flat.min(axis=0).tolist() if accessor_type != "SCALAR" else [flat.min().item()]})
+    return len(doc["accessors"]) - 1
+
+########## TRANSFORMS #########################################################
+
+def local_matrix(node):
+    """Returns the 4x4 local transform of a node (column vector convention)."""
+    if "matrix" in node:
+        return np.array(node["matrix"], dtype=float).reshape(4, 4).T
+    matrix = np.identity(4)
+    if "scale" in node:
+        matrix = np.diag(list(node["scale"]) + [1]) @ matrix
+    if "rotation" in node:
+        x, y, z, w = node["rotation"]
+        rotation = np.identity(4)
+        rotation[0:3, 0:3] = [[1 - 2*(y*y + z*z), 2*(x*y - z*w), 2*(x*z + y*w)],
+                              [2*(x*y + z*w), 1 - 2*(x*x + z*z), 2*(y*z - x*w)],
+                              [2*(x*z - y*w), 2*(y*z + x*w), 1 - 2*(x*x + y*y)]]
+        matrix = rotation @ matrix
+    if "translation" in node:
+        matrix[0:3, 3] = node["translation"]
+    return matrix
+
+def world_matrices(doc):
+    """Returns the 4x4 world transform of every node reachable from the scenes."""
+    nodes = doc.get("nodes", [])
+    world = {}
+    stack = [(root, np.identity(4)) for scene in doc.get("scenes", []) for root in scene.get("nodes", [])]
+    while stack:
+        node_index, parent = stack.pop()
+        world[node_index] = parent @ local_matrix(nodes[node_index])
+        for child in nodes[node_index].get("children", []):
+            stack.append((child, world[node_index]))
+    return world
+
+def matrices_to_trs(matrices):
+    """Splits 4x4 transforms without shear into translations, xyzw quaternions and scales."""
+    translations = matrices[:, 0:3, 3]
+    linear = matrices[:, 0:3, 0:3]
+    scales = np.linalg.norm(linear, axis=1)
+    scales[:, 1] *= np.where(np.linalg.det(linear) < 0, -1, 1)
+    r = linear / scales[:, None, :]
+    t = np.stack((1 + r[:, 0, 0] - r[:, 1, 1] - r[:, 2, 2],
+                  1 - r[:, 0, 0] + r[:, 1, 1] - r[:, 2, 2],
+                  1 - r[:, 0, 0] - r[:, 1, 1] + r[:, 2, 2],
+                  1 + r[:, 0, 0] + r[:, 1, 1] + r[:, 2, 2]), axis=1)
+    rotations = np.sqrt(np.maximum(t, 0)) / 2
+    rotations[:, 0] = np.copysign(rotations[:, 0], r[:, 2, 1] - r[:, 1, 2])
+    rotations[:, 1] = np.copysign(rotations[:, 1], r[:, 0, 2] - r[:, 2, 0])
+    rotations[:, 2] = np.copysign(rotations[:, 2], r[:, 1, 0] - r[:, 0, 1])
+    return translations, rotations, scales
+
+########## PASSES #############################################################
+
+def remap_accessors(doc, mapping):
+    """Rewrites every accessor reference through mapping (old index -> new index)."""
+    for mesh in doc.get("meshes", []):
+        for primitive in mesh["primitives"]:
+            primitive["attributes"] = {k: mapping[v] for k, v in primitive["attributes"].items()}
+            if "indices" in primitive:
+                primitive["indices"] = mapping[primitive["indices"]]
+            for target in primitive.get("targets", []):
+                for k in target:
+                    target[k] = mapping[target[k]]
+    for node in doc.get("nodes", []):
+        attributes = node.get("extensions", {}).get(INSTANCING, {}).get("attributes", {})
+        for k in attributes:
+            attributes[k] = mapping[attributes[k]]
+    for skin in doc.get("skins", []):
+        if "inverseBindMatrices" in skin:
+            skin["inverseBindMatrices"] = mapping[skin["inverseBindMatrices"]]
+    for animation in doc.get("animations", []):
+        for sampler in animation["samplers"]:
+            sampler["input"] = mapping[sampler["input"]]
+            sampler["output"] = mapping[sampler["output"]]
+
+def referenced_accessors(doc):
+    """Returns the indices of all accessors referenced by meshes, nodes, skins and animations."""
+    used = set()
+    for mesh in doc.get("meshes", []):
+        for primitive in mesh["primitives"]:
+            used.update(primitive["attributes"].values())
+            if "indices" in primitive:
+                used.add(primitive["indices"])
+            for target in primitive.get("targets", []):
+                used.update(target.values())
+    for node in doc.get("nodes", []):
+        used.update(node.get("extensions", {}).get(INSTANCING, {}).get("attributes", {}).values())
+    for skin in doc.get("skins", []):
+        if "inverseBindMatrices" in skin:
+            used.add(skin["inverseBindMatrices"])
+    for animation in doc.get("animations", []):
+        for sampler in animation["samplers"]:
+            used.update((sampler["input"], sampler["output"]))
+    return used
+
+def dedupe_accessors(doc, blob):
+    """Points all accessors with identical type and contents at the first copy."""
+    first = {}
+    mapping = {}
+    for index, accessor in enumerate(doc.get("accessors", [])):
+        key = (accessor["componentType"], accessor["type"], accessor.get("normalized", False), accessor["count"],
+               hashlib.sha1(accessor_bytes(doc, blob, index)).digest())
+        mapping[index] = first.setdefault(key, index)
+    remap_accessors(doc, mapping)
+    return sum(1 for k, v in mapping.items() if k != v)
+
+def dedupe_meshes(doc):
+    """Points all nodes using meshes with identical primitives at the first copy."""
+    first = {}
+    mapping = {}
+    for index, mesh in enumerate(doc.get("meshes", [])):
+        key = json.dumps(mesh["primitives"], sort_keys=True)
+        mapping[index] = first.setdefault(key, index)
+    for node in doc.get("nodes", []):
+        if "mesh" in node:
+            node["mesh"] = mapping[node["mesh"]]
+    return sum(1 for k, v in mapping.items() if k != v)
+
+def identify_instancable_meshes(doc, world, min_instances):
+    """Returns {mesh: [node indices]} for meshes drawn by at least min_instances plain nodes."""
     mesh_to_nodes = {}
-    
-    # Iterate over nodes and group them by their mesh index
-    for node_index, node in enumerate(gltf.nodes):
-        if node.mesh is not None:
-            if node.mesh not in mesh_to_nodes:
-                mesh_to_nodes[node.mesh] = []
-            mesh_to_nodes[node.mesh].append(node_index)
-    
-    # Find meshes with more than one node using them (i.e., possible candidates for instancing)
-    instancable_meshes = {mesh: nodes for mesh, nodes in mesh_to_nodes.items() if len(nodes) > 1}
-    
-    return instancable_meshes
-
-def add_instancing_to_gltf(gltf: GLTF2, instancable_meshes: dict):
-    """
-    Add EXT_mesh_gpu_instancing to the GLTF for identified instancable meshes.
-    """
+    for node_index in world:
+        node = doc["nodes"][node_index]
+        if "mesh" in node and INSTANCING not in node.get("extensions", {}):
+            mesh_to_nodes.setdefault(node["mesh"], []).append(node_index)
+    return {mesh: nodes for mesh, nodes in mesh_to_nodes.items() if len(nodes) >= min_instances}
+
+def add_instancing(doc, blob, min_instances):
+    """Replaces nodes sharing a mesh by one EXT_mesh_gpu_instancing node below the scene root."""
+    world = world_matrices(doc)
+    instancable_meshes = identify_instancable_meshes(doc, world, min_instances)
     if not instancable_meshes:
-        print("No instancable meshes found.")
-        return
-    
-    # Ensure extensionsUsed and extensionsRequired are lists
-    if not gltf.extensionsUsed:
-        gltf.extensionsUsed = []
-    if not gltf.extensionsRequired:
-        gltf.extensionsRequired = []
-    
-    # Add the EXT_mesh_gpu_instancing extension
-    gltf.extensionsUsed.append("EXT_mesh_gpu_instancing")
-    gltf.extensionsRequired.append("EXT_mesh_gpu_instancing")
-    
-    # Go through each instancable mesh and add instancing data
+        return 0
+
+    root_index = doc["scenes"][doc.get("scene", 0)]["nodes"][0]
+    root = doc["nodes"][root_index]
+    # instance transforms are relative to the root node the instanced nodes hang below
+    root_inverse = np.linalg.inv(world[root_index])
     for mesh, node_indices in instancable_meshes.items():
-        # Create transformation matrices for each instance (position, rotation, scale)
-        instance_transforms = []
+        matrices = np.array([root_inverse @ world[node_index] for node_index in node_indices])
+        translations, rotations, scales = matrices_to_trs(matrices)
+        attributes = {"TRANSLATION": append_accessor(doc, blob, translations.astype(np.float32), "VEC3")}
+        if np.any(np.abs(rotations[:, 3]) != 1):
+            attributes["ROTATION"] = append_accessor(doc, blob, rotations.astype(np.float32), "VEC4")
+        if np.any(scales != 1):
+            attributes["SCALE"] = append_accessor(doc, blob, scales.astype(np.float32), "VEC3")
+        doc["nodes"].append({"name": doc["nodes"][node_indices[0]].get("name", ""), "mesh": mesh,
+                             "extensions": {INSTANCING: {"attributes": attributes}}})
+        root.setdefault("children", []).append(len(doc["nodes"]) - 1)
         for node_index in node_indices:
-            node = gltf.nodes[node_index]
-            instance_transforms.append(node.matrix if node.matrix else node.translation + node.rotation + node.scale)
-        
-        # Add the extension with the instance transforms
-        instancing_extension = EXT_mesh_gpu_instancing(count=len(instance_transforms), transformations=instance_transforms)
-        gltf.meshes[mesh].extensions = {"EXT_mesh_gpu_instancing": instancing_extension}
-        
-        # Remove the individual nodes, they are now instanced
-        for node_index in node_indices[1:]:  # Keep the first node
-            gltf.nodes[node_index].mesh = None
-
-def save_gltf(gltf: GLTF2, output_file: str):
-    """Save the optimized GLTF file."""
-    gltf.save(output_file)
-
-def optimize_gltf_with_instancing(input_file: str, output_file: str):
-    # Load the GLTF file
-    gltf = GLTF2().load(input_file)
-    
-    # Identify meshes that can be instanced
-    instancable_meshes = identify_instancable_meshes(gltf)
-    
-    # Apply instancing
-    add_instancing_to_gltf(gltf, instancable_meshes)
-    
-    # Save the optimized GLTF file
-    save_gltf(gltf, output_file)
-    print(f"Optimized GLTF file saved to {output_file}")
-
-if(len(sys.argv) < 2):
-    print("Usage: python gltf_instancing.py input_model.gltf")
-    sys.exit(1)
-
-input_gltf_file = sys.argv[1]
-output_gltf_file = input_gltf_file.split(".")[:1] + "optimized.gltf"
-
-
-optimize_gltf_with_instancing(input_gltf_file, output_gltf_file)
+            del doc["nodes"][node_index]["mesh"]
+
+    for key in ("extensionsUsed", "extensionsRequired"):
+        if INSTANCING not in doc.setdefault(key, []):
+            doc[key].append(INSTANCING)
+    return len(instancable_meshes)
+
+def mergeable(doc, node, mesh_users):
+    """Whether a node is a plain leaf with a single indexed triangle primitive used nowhere else."""
+    if "mesh" not in node or node.get("children") or node.get("extensions") or mesh_users[node["mesh"]] != 1:
+        return False
+    primitives = doc["meshes"][node["mesh"]]["primitives"]
+    return (len(primitives) == 1 and primitives[0].get("mode", 4) == 4 and "indices" in primitives[0]
+            and list(primitives[0]["attributes"]) == ["POSITION"] and "targets" not in primitives[0])
+
+def merge_siblings(doc, blob):
+    """Merges sibling leaf nodes with the same material into one mesh.
+
+    The local transform of each node is baked into the merged positions and
+    the surviving node gets the identity transform.
+    """
+    nodes = doc.get("nodes", [])
+    mesh_users = {}
+    for node in nodes:
+        if "mesh" in node:
+            mesh_users[node["mesh"]] = mesh_users.get(node["mesh"], 0) + 1
+
+    merged = 0
+    for parent in nodes:
+        groups = {}
+        for child in parent.get("children", []):
+            if mergeable(doc, nodes[child], mesh_users):
+                material = doc["meshes"][nodes[child]["mesh"]]["primitives"][0].get("material")
+                groups.setdefault(material, []).append(child)
+        for material, children in groups.items():
+            if len(children) < 2:
+                continue
+            positions = []
+            indices = []
+            offset = 0
+            for child in children:
+                primitive = doc["meshes"][nodes[child]["mesh"]]["primitives"][0]
+                matrix = local_matrix(nodes[child])
+                p = accessor_array(doc, blob, primitive["attributes"]["POSITION"]).astype(float)
+                i = accessor_array(doc, blob, primitive["indices"]).reshape(-1, 3).astype(np.uint32)
+                positions.append(p @ matrix[0:3, 0:3].T + matrix[0:3, 3])
+                indices.append((i[:, ::-1] if np.linalg.det(matrix[0:3, 0:3]) < 0 else i) + offset)
+                offset += len(p)
+            primitive = {"attributes": {"POSITION": append_accessor(doc, blob, np.concatenate(positions).astype(np.float32), "VEC3", 34962)},
+                         "indices": append_accessor(doc, blob, np.concatenate(indices).ravel(), "SCALAR", 34963)}
+            if material is not None:
+                primitive["material"] = material
+            doc["meshes"].append({"primitives": [primitive]})
+            keep = nodes[children[0]]
+            for key in ("matrix", "translation", "rotation", "scale"):
+                keep.pop(key, None)
+            keep["mesh"] = len(doc["meshes"]) - 1
+            for child in children[1:]:
+                del nodes[child]["mesh"]
+            merged += len(children) - 1
+    return merged
+
+def drop_empty_nodes(doc):
+    """Removes nodes that draw nothing: no mesh, camera, skin or extension and no kept children.
+
+    Nodes that are not reachable from any scene are removed too.
+    """
+    if doc.get("animations") or doc.get("skins"):
+        return 0 # node indices are referenced from elsewhere, leave them alone
+    nodes = doc.get("nodes", [])
+    keep = [False] * len(nodes)
+    # iterative post-order walk, so deep hierarchies do not hit the recursion limit
+    stack = [(root, False) for scene in doc.get("scenes", []) for root in scene.get("nodes", [])]
+    while stack:
+        node_index, visited = stack.pop()
+        node = nodes[node_index]
+        if not visited:
+            stack.append((node_index, True))
+            stack.extend((child, False) for child in node.get("children", []))
+            continue
+        node["children"] = [child for child in node.get("children", []) if keep[child]]
+        keep[node_index] = bool(node["children"] or "mesh" in node or "camera" in node or "skin" in node
+                                or node.get("extensions"))
+
+    mapping = {}
+    new_nodes = []
+    for index, node in enumerate(nodes):
+        if keep[index]:
+            mapping[index] = len(new_nodes)
+            new_nodes.append(node)
+    for node in new_nodes:
+        if node.get("children"):
+            node["children"] = [mapping[child] for child in node["children"]]
+        else:
+            node.pop("children", None)
+    for scene in doc.get("scenes", []):
+        scene["nodes"] = [mapping[root] for root in scene.get("nodes", []) if root in mapping]
+    doc["nodes"] = new_nodes
+    return len(nodes) - len(new_nodes)
+
+def compact(doc, blob):
+    """Removes unused meshes and accessors and rewrites the buffer without gaps.
+
+    Every accessor gets its own tightly packed bufferView starting on a
+    4-byte boundary.
+
+    Returns:
+        The new buffer contents.
+    """
+    used_meshes = sorted({node["mesh"] for node in doc.get("nodes", []) if "mesh" in node})
+    mesh_mapping = {old: new for new, old in enumerate(used_meshes)}
+    doc["meshes"] = [doc["meshes"][old] for old in used_meshes]
+    for node in doc.get("nodes", []):
+        if "mesh" in node:
+            node["mesh"] = mesh_mapping[node["mesh"]]
+
+    used_accessors = sorted(referenced_accessors(doc))
+
+    new_blob = bytearray()
+    new_views = []
+    new_accessors = []
+    for old in used_accessors:
+        accessor = dict(doc["accessors"][old])
+        data = accessor_bytes(doc, blob, old)
+        if "bufferView" in accessor:
+            new_blob.extend(b"\0" * (-len(new_blob) % 4))
+            view = {"buffer": 0, "byteOffset": len(new_blob), "byteLength": len(data)}
+            target = doc["bufferViews"][accessor["bufferView"]].get("target")
+            if target is not None:
+                view["target"] = target
+            new_blob.extend(data)
+            new_views.append(view)
+            accessor["bufferView"] = len(new_views) - 1
+            accessor.pop("byteOffset", None)
+        new_accessors.append(accessor)
+
+    # images stored in the buffer are copied as they are
+    for image in doc.get("images", []):
+        if "bufferView" in image:
+            view = doc["bufferViews"][image["bufferView"]]
+            new_blob.extend(b"\0" * (-len(new_blob) % 4))
+            start = view.get("byteOffset", 0)
+            new_views.append({"buffer": 0, "byteOffset": len(new_blob), "byteLength": view["byteLength"]})
+            new_blob.extend(blob[start:start + view["byteLength"]])
+            image["bufferView"] = len(new_views) - 1
+
+    remap_accessors(doc, {old: new for new, old in enumerate(used_accessors)})
+    doc["accessors"] = new_accessors
+    doc["bufferViews"] = new_views
+    return new_blob
+
+########## MAIN ###############################################################
+
+def stats(doc, blob, path):
+    return {"file bytes": os.path.getsize(path), "buffer bytes": len(blob),
+            "nodes": len(doc.get("nodes", [])), "meshes": len(doc.get("meshes", [])),
+            "accessors": len(doc.get("accessors", [])), "bufferViews": len(doc.get("bufferViews", []))}
+
+def optimize_gltf(input_file, output_file, instancing=True, merge=True, min_instances=2):
+    doc, blob = load_gltf(input_file)
+    before = stats(doc, blob, input_file)
+
+    print(f"Deduplicated {dedupe_accessors(doc, blob)} accessors")
+    print(f"Deduplicated {dedupe_meshes(doc)} meshes")
+    if instancing:
+        print(f"Instanced {add_instancing(doc, blob, min_instances)} meshes")
+    if merge:
+        print(f"Merged {merge_siblings(doc, blob)} sibling meshes")
+    print(f"Dropped {drop_empty_nodes(doc)} empty nodes")
+    blob = compact(doc, blob)
+
+    save_gltf(doc, blob, output_file)
+    after = stats(doc, blob, output_file)
+
+    print(f"\n{'':14}{'before':>14}{'after':>14}")
+    for key in before:
+        print(f"{key:14}{before[key]:>14}{after[key]:>14}")
+    print(f"Optimized glTF file saved to {output_file}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Optimize a glTF file written by gds2gltf.")
+    parser.add_argument("input", help="input .gltf or .glb file")
+    parser.add_argument("-o", "--output", help="output file (default: <input>_optimized.gltf)")
+    parser.add_argument("--no-instancing", action="store_true", help="do not emit EXT_mesh_gpu_instancing")
+    parser.add_argument("--no-merge", action="store_true", help="do not merge sibling meshes")
+    parser.add_argument("--min-instances", type=int, default=2, help="minimum number of nodes sharing a mesh to instance it")
+    args = parser.parse_args()
+
+    output_file = args.output or os.path.splitext(args.input)[0] + "_optimized.gltf"
+    optimize_gltf(args.input, output_file, not args.no_instancing, not args.no_merge, args.min_instances)
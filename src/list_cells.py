@@ -2,21 +2,170 @@
 
 # -*- coding: utf-8 -*-
 
-import gdstk as gdspy
+"""
+Lists the cells of a GDSII file from a cached cell index.
 
-# open a gds file
-#gdsii = gdspy.GdsLibrary(infile='sg13g2_stdcell.gds')
-gdsii = gdspy.gds_info('sg13g2_stdcell.gds')
+USAGE:
+    list_cells.py [file.gds]          cell names (default file: the last one opened with gdst lc)
+    list_cells.py file.gds --top      top level cells only
+    list_cells.py file.gds --long     one line per cell with polygon count and layers
 
-# get the cell names
-#cell_names = gdsii.cells.keys()
-cell_names = list(gdsii.values())[0]
+The index holds the cell names, the top cells, the polygon count and the
+layers of every cell. It is stored under ~/.cache/gdst/index (or
+$XDG_CACHE_HOME/gdst/index) and is shared with "gdst lc", see the CELL INDEX
+section of gdst.cpp for the file format. An index is used as long as size and
+modification time of the GDSII file match; a stale index still answers at
+once and is rebuilt in the background for the next call.
+"""
 
-# print the cell names
-for cell_name in cell_names:
-    print(cell_name)
-    
+import os
+import sys
+import time
+import argparse
+import subprocess
 
+import gdstk
 
+INDEX_VERSION = 1
+LAST_FILE = "/var/tmp/.tmp_gdst_file" # written by gdst list_cells
 
+def index_path(full_path):
+    """Returns the index file of a GDSII file (FNV-1a hash of its absolute path, as in gdst.cpp)."""
+    digest = 14695981039346656037
+    for byte in full_path.encode():
+        digest = ((digest ^ byte) * 1099511628211) & 0xFFFFFFFFFFFFFFFF
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.environ.get("HOME", "/var/tmp"), ".cache")
+    return os.path.join(cache_home, "gdst", "index", f"{digest:016x}.idx")
 
+def file_stamp(path):
+    """Returns (size, mtime in ns) of a file."""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def read_index(path):
+    """Returns the index dictionary stored at path, or None if it is missing or damaged.
+
+    The dictionary has the keys path, size, mtime, top (list of names) and
+    cells (list of (name, polygons, layers) with layers as "layer/datatype"
+    strings).
+    """
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    if not lines or lines[0] != f"gdst-cell-index {INDEX_VERSION}":
+        return None
+    index = {'path': None, 'size': -1, 'mtime': -1, 'top': [], 'cells': []}
+    try:
+        for line in lines[1:]:
+            fields = line.split("\t")
+            if fields[0] == "path":
+                index['path'] = fields[1]
+            elif fields[0] in ("size", "mtime"):
+                index[fields[0]] = int(fields[1])
+            elif fields[0] == "top":
+                index['top'] = fields[1:]
+            elif fields[0] == "cell":
+                layers = fields[3].split(",") if len(fields) > 3 and fields[3] else []
+                index['cells'].append((fields[1], int(fields[2]), layers))
+    except (IndexError, ValueError):
+        return None
+    return index
+
+def build_index(full_path):
+    """Reads a GDSII file with gdstk and writes its index.
+
+    Returns:
+        The new index dictionary (see read_index).
+    """
+    size, mtime = file_stamp(full_path)
+    library = gdstk.read_gds(full_path)
+    cells = []
+    for cell in library.cells:
+        layers = {(polygon.layer, polygon.datatype) for polygon in cell.polygons}
+        polygons = len(cell.polygons)
+        for path in cell.paths:
+            layers.update(zip(path.layers, path.datatypes))
+            polygons += len(path.layers)
+        cells.append((cell.name, polygons, [f"{layer}/{datatype}" for layer, datatype in sorted(layers)]))
+    index = {'path': full_path, 'size': size, 'mtime': mtime,
+             'top': [cell.name for cell in library.top_level()], 'cells': cells}
+
+    lines = [f"gdst-cell-index {INDEX_VERSION}", f"path\t{full_path}", f"size\t{size}", f"mtime\t{mtime}",
+             "\t".join(["top"] + index['top'])]
+    lines += [f"cell\t{name}\t{polygons}\t{','.join(layers)}" for name, polygons, layers in cells]
+    path = index_path(full_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write to a temporary file, so readers never see a partial index
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+    return index
+
+def rebuild_in_background(full_path):
+    """Starts a detached process rebuilding the index, unless one is running already."""
+    lock_path = index_path(full_path) + ".lock"
+    try:
+        # a lock older than ten minutes is left over from a crashed rebuild
+        if time.time() - os.path.getmtime(lock_path) < 600:
+            return
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    open(lock_path, "w").close()
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), full_path, "--build-index"],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+
+def cell_index(gds_path):
+    """Returns the index of a GDSII file, building it on first use.
+
+    A stale index is returned as is and rebuilt in the background.
+    """
+    full_path = os.path.realpath(gds_path)
+    index = read_index(index_path(full_path))
+    if index is None:
+        return build_index(full_path)
+    if (index['size'], index['mtime']) != file_stamp(full_path):
+        rebuild_in_background(full_path)
+    return index
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the cells of a GDSII file from a cached cell index.")
+    parser.add_argument("gds", nargs="?", help="GDSII file (default: the last file opened with gdst lc)")
+    parser.add_argument("--top", action="store_true", help="only list the top level cells")
+    parser.add_argument("--long", action="store_true", help="also print polygon count and layers of each cell")
+    parser.add_argument("--build-index", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    gds_path = args.gds
+    if gds_path is None:
+        try:
+            with open(LAST_FILE) as f:
+                gds_path = f.read().strip()
+        except OSError:
+            sys.exit("Error: GDSII file not specified")
+
+    if args.build_index:
+        full_path = os.path.realpath(gds_path)
+        try:
+            build_index(full_path)
+        finally:
+            try:
+                os.remove(index_path(full_path) + ".lock")
+            except OSError:
+                pass
+        sys.exit(0)
+
+    index = cell_index(gds_path)
+    cells = index['cells']
+    if args.top:
+        top = set(index['top'])
+        cells = [cell for cell in cells if cell[0] in top]
+    for name, polygons, layers in cells:
+        if args.long:
+            print(f"{name}\t{polygons}\t{','.join(layers)}")
+        else:
+            print(name)